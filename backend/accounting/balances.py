@@ -0,0 +1,114 @@
+"""
+Batched ledger balance resolution.
+
+Computes the balance of many ledgers in a fixed number of grouped queries,
+following the same precedence MasterLedgerSerializer.get_balance applies to a
+single ledger:
+
+1. Latest AmountTransaction balance (Cash/Bank ledgers)
+2. Ledgers present in TransactionFile resolve to 0.0 (the table carries no
+   per-ledger transaction payload, so the single-ledger lookup yields 0.0)
+3. Journal entry totals (ledger_balances summary), signed by ledger category
+"""
+
+import logging
+from django.db.models import OuterRef, Subquery
+
+from accounting.models import MasterLedger, AmountTransaction
+from accounting.models_transaction import TransactionFile
+from accounting.ledger_balances import get_ledger_totals
+
+logger = logging.getLogger(__name__)
+
+DEBIT_NATURE_CATEGORIES = ['Asset', 'Expenditure', 'Expense']
+
+
+def signed_balance(category, total_debit, total_credit):
+    """Return the balance of a ledger from its debit/credit totals."""
+    if category in DEBIT_NATURE_CATEGORIES:
+        balance = total_debit - total_credit
+    else:  # Liability, Income, Capital
+        balance = total_credit - total_debit
+    return float(balance)
+
+
+def resolve_ledger_balances(ledgers):
+    """
+    Resolve balances for a page of ledgers.
+
+    Args:
+        ledgers: Iterable of MasterLedger instances
+
+    Returns:
+        dict: {ledger.id: balance}
+    """
+    ledgers = [ledger for ledger in ledgers if ledger.pk is not None]
+    if not ledgers:
+        return {}
+
+    ledger_ids = [ledger.id for ledger in ledgers]
+    tenant_ids = {ledger.tenant_id for ledger in ledgers}
+    balances = {}
+
+    # 1. Latest AmountTransaction balance per ledger (one query)
+    try:
+        latest_balance = AmountTransaction.objects.filter(
+            tenant_id=OuterRef('tenant_id'),
+            ledger_id=OuterRef('pk')
+        ).order_by('-transaction_date', '-created_at').values('balance')[:1]
+
+        rows = MasterLedger.objects.filter(id__in=ledger_ids).annotate(
+            latest_balance=Subquery(latest_balance)
+        ).values_list('id', 'latest_balance')
+
+        for ledger_id, balance in rows:
+            if balance is not None:
+                balances[ledger_id] = balance
+    except Exception as e:
+        logger.debug(f"AmountTransaction batch lookup failed: {e}")
+
+    pending = [ledger for ledger in ledgers if ledger.id not in balances]
+    if not pending:
+        return balances
+
+    # 2. Ledgers registered in TransactionFile (one query)
+    try:
+        transaction_file_keys = set(
+            TransactionFile.objects.filter(
+                tenant_id__in=tenant_ids,
+                ledger_name__in={ledger.name for ledger in pending}
+            ).values_list('tenant_id', 'ledger_name')
+        )
+    except Exception as e:
+        logger.debug(f"TransactionFile batch lookup failed: {e}")
+        transaction_file_keys = set()
+
+    remaining = []
+    for ledger in pending:
+        if (ledger.tenant_id, ledger.name) in transaction_file_keys:
+            balances[ledger.id] = 0.0
+        else:
+            remaining.append(ledger)
+
+    if not remaining:
+        return balances
+
+    # 3. Journal entry totals from the ledger_balances summary (one query).
+    # Entries are matched on the ledger's string form, as the per-ledger
+    # lookup filters the CharField with the model instance.
+    try:
+        totals = {
+            (row['tenant_id'], row['ledger']): (row['total_debit'] or 0, row['total_credit'] or 0)
+            for row in get_ledger_totals(tenant_ids, ledgers={str(ledger) for ledger in remaining})
+        }
+    except Exception as je:
+        logger.debug(f"Ledger balances not available: {je}")
+        for ledger in remaining:
+            balances[ledger.id] = 0
+        return balances
+
+    for ledger in remaining:
+        total_debit, total_credit = totals.get((ledger.tenant_id, str(ledger)), (0, 0))
+        balances[ledger.id] = signed_balance(ledger.category, total_debit, total_credit)
+
+    return balances
@@ -0,0 +1,175 @@
+"""
+Hierarchy Index - In-memory trie over master_hierarchy_raw.
+
+master_hierarchy_raw is global, read-only reference data (the chart of
+accounts), yet ledger code generation looked it up with up to six raw queries
+per ledger, dropping one field per retry, and the questions API ran the same
+kind of query again. Each process now loads the table once into a trie keyed
+by the hierarchy path:
+
+    major_group_1 -> group_1 -> sub_group_1_1 -> sub_group_2_1 -> sub_group_3_1 -> ledger_1
+
+Every node remembers the first row (lowest id) below it, and the first row
+with a code, so a lookup is a dictionary walk with no database access.
+Levels left out of a lookup match anything, like the SQL it replaces.
+Values are compared ignoring case and surrounding spaces, as the MySQL
+collation did.
+
+After master_hierarchy_raw is reloaded, run `manage.py master_hierarchy
+invalidate`. It bumps a version stamp (a global series in tenant_sequences),
+and every process rebuilds its trie the next time it checks the stamp.
+
+Configuration (settings.HIERARCHY_INDEX):
+    CHECK_INTERVAL: seconds between version stamp checks (default 60)
+"""
+
+import logging
+import threading
+import time
+
+from django.conf import settings
+
+from accounting.models import MasterHierarchyRaw
+from core.models import TenantSequence
+from core.sequences import next_tenant_number
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHECK_INTERVAL = 60
+
+# Trie levels, outermost first
+LEVELS = ('major_group_1', 'group_1', 'sub_group_1_1', 'sub_group_2_1', 'sub_group_3_1', 'ledger_1')
+
+# Version stamp: a series of the global pseudo-tenant in tenant_sequences
+VERSION_TENANT = 'global'
+VERSION_SERIES = 'master_hierarchy_raw'
+
+
+def _key(value):
+    return str(value).strip().lower() if value else ''
+
+
+class _Node:
+    __slots__ = ('children', 'first', 'first_coded')
+
+    def __init__(self):
+        self.children = {}
+        self.first = None
+        self.first_coded = None
+
+
+class HierarchyIndex:
+    """
+    Trie over master_hierarchy_raw rows.
+
+    Args:
+        rows: (id, code, major_group_1, group_1, sub_group_1_1, sub_group_2_1,
+            sub_group_3_1, ledger_1) tuples
+        version: Version stamp the rows were loaded at
+    """
+
+    def __init__(self, rows, version=0):
+        self.version = version
+        self.rows = sorted(rows, key=lambda row: row[0])
+        self.root = _Node()
+        for position, row in enumerate(self.rows):
+            coded = bool(row[1] and row[1].strip())
+            node = self.root
+            self._mark(node, position, coded)
+            for value in row[2:]:
+                node = node.children.setdefault(_key(value), _Node())
+                self._mark(node, position, coded)
+
+    @staticmethod
+    def _mark(node, position, coded):
+        if node.first is None:
+            node.first = position
+        if coded and node.first_coded is None:
+            node.first_coded = position
+
+    def __len__(self):
+        return len(self.rows)
+
+    def find(self, path, coded=False):
+        """
+        First row matching a hierarchy path.
+
+        Args:
+            path: Up to six values in LEVELS order; None or '' matches anything
+            coded: Only rows with a non-empty code
+
+        Returns:
+            Row tuple (see class docstring) or None
+        """
+        keys = [_key(value) for value in path]
+        while keys and not keys[-1]:
+            keys.pop()
+        position = self._first(self.root, keys, 0, 'first_coded' if coded else 'first')
+        return None if position is None else self.rows[position]
+
+    def _first(self, node, keys, depth, attr):
+        # Past the last given level every row below the node matches
+        while depth < len(keys) and keys[depth]:
+            node = node.children.get(keys[depth])
+            if node is None:
+                return None
+            depth += 1
+        if depth == len(keys):
+            return getattr(node, attr)
+
+        # Level left out: best match over all children
+        found = [self._first(child, keys, depth + 1, attr) for child in node.children.values()]
+        found = [position for position in found if position is not None]
+        return min(found) if found else None
+
+
+_index = None
+_checked_at = 0
+_index_lock = threading.Lock()
+
+
+def get_hierarchy_index_settings():
+    config = getattr(settings, 'HIERARCHY_INDEX', {})
+    return {
+        'CHECK_INTERVAL': config.get('CHECK_INTERVAL', DEFAULT_CHECK_INTERVAL),
+    }
+
+
+def _current_version():
+    return TenantSequence.objects.filter(
+        tenant_id=VERSION_TENANT, name=VERSION_SERIES
+    ).values_list('current_number', flat=True).first() or 0
+
+
+def load_hierarchy_index(version=None):
+    """Build a trie from the table (one query)"""
+    # Stamp first: rows reloaded meanwhile are picked up at the next check
+    version = _current_version() if version is None else version
+    index = HierarchyIndex(list(MasterHierarchyRaw.objects.values_list('id', 'code', *LEVELS)), version)
+    logger.info(f"Loaded master_hierarchy_raw index: {len(index)} rows (version {index.version})")
+    return index
+
+
+def get_hierarchy_index():
+    """Process-wide trie, built on first use and rebuilt when the version stamp moves"""
+    global _index, _checked_at
+    with _index_lock:
+        now = time.monotonic()
+        if _index is None:
+            _index = load_hierarchy_index()
+            _checked_at = now
+        elif now - _checked_at > get_hierarchy_index_settings()['CHECK_INTERVAL']:
+            _checked_at = now
+            version = _current_version()
+            if version != _index.version:
+                _index = load_hierarchy_index(version)
+        return _index
+
+
+def invalidate_hierarchy_index():
+    """Bump the version stamp after master_hierarchy_raw is reloaded; returns the new version"""
+    global _index
+    version = next_tenant_number(VERSION_TENANT, VERSION_SERIES)
+    with _index_lock:
+        _index = None
+    return version
@@ -7,6 +7,8 @@ from typing import List, Dict, Optional
 from django.db.models import QuerySet
 from datetime import date
 
+from core.sequences import last_number, next_tenant_number
+
 
 def get_invoice_by_id(invoice_id: int, tenant_id: str) -> Optional['SalesInvoice']:
     """
@@ -134,19 +136,10 @@ def generate_invoice_number(tenant_id: str) -> str:
     """
     from accounting.models import SalesInvoice
     
-    last_invoice = SalesInvoice.objects.filter(
-        tenant_id=tenant_id
-    ).order_by('-id').first()
-    
-    if last_invoice:
-        # Extract number and increment
-        try:
-            last_num = int(last_invoice.invoice_number.split('-')[-1])
-            new_num = last_num + 1
-        except (ValueError, IndexError):
-            new_num = 1
-    else:
-        new_num = 1
+    # Per-tenant series (see core.sequences), seeded from the latest invoice on first use
+    new_num = next_tenant_number(tenant_id, 'sales_invoice', seed=lambda: last_number(
+        SalesInvoice.objects.filter(tenant_id=tenant_id).order_by('-id').values_list('invoice_number', flat=True).first()
+    ))
     
     return f"SI-{tenant_id[:8]}-{new_num:04d}"
 
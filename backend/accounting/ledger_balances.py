@@ -0,0 +1,248 @@
+"""
+Ledger Balance Maintenance - Materialized per-ledger period totals.
+
+The ledger_balances table (LedgerBalance) holds debit/credit totals per
+(tenant, ledger, period). Each journal entry contributes to the 'day' row and
+the 'month' row of its voucher date, so:
+
+- whole-history totals (trial balance, ledger balances) read month rows,
+  O(#ledgers x #months) instead of O(#journal entries)
+- date ranges read month rows for whole months and day rows for the edges
+
+Postings must run in the same transaction as the journal entry writes.
+`rebuild_ledger_balances` / `verify_ledger_balances` recompute the table from
+journal_entries (see the ledger_balances management command).
+"""
+
+import calendar
+import logging
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q, Sum
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from accounting.models import JournalEntry, LedgerBalance
+
+logger = logging.getLogger('accounting.ledger_balances')
+
+PERIOD_DAY = LedgerBalance.PERIOD_DAY
+PERIOD_MONTH = LedgerBalance.PERIOD_MONTH
+
+
+def _as_date(value):
+    """Normalize a voucher date (date, datetime or ISO string) to a date."""
+    if isinstance(value, datetime):
+        # Same conversion as DateField for the default (timezone.now)
+        return timezone.localtime(value).date() if timezone.is_aware(value) else value.date()
+    if isinstance(value, date):
+        return value
+    if isinstance(value, str):
+        return parse_date(value[:10])
+    return None
+
+
+def _month_start(day):
+    return day.replace(day=1)
+
+
+def _month_end(day):
+    return day.replace(day=calendar.monthrange(day.year, day.month)[1])
+
+
+def _apply_delta(tenant_id, ledger, period_type, period_start, debit, credit):
+    """Atomically add debit/credit to one balance row, creating it if needed."""
+    key = dict(tenant_id=tenant_id, ledger=ledger, period_type=period_type, period_start=period_start)
+
+    updated = LedgerBalance.objects.filter(**key).update(
+        debit=F('debit') + debit, credit=F('credit') + credit
+    )
+    if updated:
+        return
+
+    try:
+        with transaction.atomic():
+            LedgerBalance.objects.create(debit=debit, credit=credit, **key)
+    except IntegrityError:
+        # Created concurrently - fall back to the increment
+        LedgerBalance.objects.filter(**key).update(
+            debit=F('debit') + debit, credit=F('credit') + credit
+        )
+
+
+def post_journal_entries(entries, entry_date=None, sign=1):
+    """
+    Add (sign=1) or remove (sign=-1) journal entries from the balance table.
+
+    Args:
+        entries: Iterable of JournalEntry instances
+        entry_date: Posting date; defaults to each entry's voucher date
+        sign: 1 to post, -1 to reverse
+    """
+    deltas = defaultdict(lambda: [Decimal('0'), Decimal('0')])
+
+    for entry in entries:
+        day = _as_date(entry_date if entry_date is not None else entry.voucher.date)
+        if day is None or not entry.ledger:
+            continue
+        debit = Decimal(str(entry.debit or 0)) * sign
+        credit = Decimal(str(entry.credit or 0)) * sign
+        for period_type, period_start in ((PERIOD_DAY, day), (PERIOD_MONTH, _month_start(day))):
+            delta = deltas[(entry.tenant_id, entry.ledger, period_type, period_start)]
+            delta[0] += debit
+            delta[1] += credit
+
+    for (tenant_id, ledger, period_type, period_start), (debit, credit) in deltas.items():
+        if debit or credit:
+            _apply_delta(tenant_id, ledger, period_type, period_start, debit, credit)
+
+
+def reverse_journal_entries(entries, entry_date=None):
+    """Remove journal entries from the balance table."""
+    post_journal_entries(entries, entry_date=entry_date, sign=-1)
+
+
+def _range_filter(start_date=None, end_date=None):
+    """
+    Build the LedgerBalance filter covering [start_date, end_date]:
+    month rows for whole months, day rows for partial months at the edges.
+    """
+    start_date = _as_date(start_date)
+    end_date = _as_date(end_date)
+
+    if start_date is None and end_date is None:
+        return Q(period_type=PERIOD_MONTH)
+
+    # Whole months fully inside the range
+    first_full = None
+    if start_date is not None:
+        first_full = start_date if start_date.day == 1 else _month_end(start_date) + timedelta(days=1)
+    last_full = None
+    if end_date is not None:
+        last_full = end_date if end_date == _month_end(end_date) else _month_start(end_date) - timedelta(days=1)
+
+    if first_full is not None and last_full is not None and first_full > last_full:
+        # Range lies within a single month (or spans a month boundary only partially)
+        return Q(period_type=PERIOD_DAY, period_start__gte=start_date, period_start__lte=end_date)
+
+    months = Q(period_type=PERIOD_MONTH)
+    if first_full is not None:
+        months &= Q(period_start__gte=first_full)
+    if last_full is not None:
+        months &= Q(period_start__lte=_month_start(last_full))
+
+    condition = months
+    if start_date is not None and start_date < first_full:
+        condition |= Q(period_type=PERIOD_DAY, period_start__gte=start_date, period_start__lt=first_full)
+    if end_date is not None and end_date > last_full:
+        condition |= Q(period_type=PERIOD_DAY, period_start__gt=last_full, period_start__lte=end_date)
+    return condition
+
+
+def get_ledger_totals(tenant_ids, ledgers=None, start_date=None, end_date=None):
+    """
+    Return debit/credit totals per ledger from the balance table.
+
+    Args:
+        tenant_ids: Tenant ID or iterable of tenant IDs
+        ledgers: Optional iterable of ledger names to restrict to
+        start_date / end_date: Optional inclusive date range
+
+    Returns:
+        QuerySet of dicts with tenant_id, ledger, total_debit, total_credit
+        ordered by ledger
+    """
+    if isinstance(tenant_ids, (str, int)):
+        tenant_ids = [tenant_ids]
+
+    rows = LedgerBalance.objects.filter(
+        _range_filter(start_date, end_date), tenant_id__in=list(tenant_ids)
+    )
+    if ledgers is not None:
+        rows = rows.filter(ledger__in=list(ledgers))
+
+    return rows.values('tenant_id', 'ledger').annotate(
+        total_debit=Sum('debit'),
+        total_credit=Sum('credit')
+    ).order_by('ledger')
+
+
+def _expected_balances(tenant_id=None):
+    """Aggregate journal_entries into {(tenant, ledger, period_type, start): (debit, credit)}."""
+    entries = JournalEntry.objects.all()
+    if tenant_id:
+        entries = entries.filter(tenant_id=tenant_id)
+
+    expected = defaultdict(lambda: [Decimal('0'), Decimal('0')])
+    rows = entries.values('tenant_id', 'ledger', 'voucher__date').annotate(
+        total_debit=Sum('debit'), total_credit=Sum('credit')
+    )
+    for row in rows.iterator():
+        day = _as_date(row['voucher__date'])
+        if day is None or not row['ledger']:
+            continue
+        for key in ((PERIOD_DAY, day), (PERIOD_MONTH, _month_start(day))):
+            totals = expected[(row['tenant_id'], row['ledger']) + key]
+            totals[0] += row['total_debit'] or 0
+            totals[1] += row['total_credit'] or 0
+    return expected
+
+
+def rebuild_ledger_balances(tenant_id=None, batch_size=1000):
+    """
+    Recompute the balance table from journal_entries.
+
+    Returns:
+        int: Number of balance rows written
+    """
+    expected = _expected_balances(tenant_id)
+
+    with transaction.atomic():
+        existing = LedgerBalance.objects.all()
+        if tenant_id:
+            existing = existing.filter(tenant_id=tenant_id)
+        existing.delete()
+
+        LedgerBalance.objects.bulk_create(
+            [
+                LedgerBalance(
+                    tenant_id=tenant, ledger=ledger, period_type=period_type,
+                    period_start=period_start, debit=debit, credit=credit
+                )
+                for (tenant, ledger, period_type, period_start), (debit, credit) in expected.items()
+            ],
+            batch_size=batch_size
+        )
+
+    logger.info(f"Rebuilt {len(expected)} ledger balance rows (tenant: {tenant_id or 'all'})")
+    return len(expected)
+
+
+def verify_ledger_balances(tenant_id=None):
+    """
+    Compare the balance table with journal_entries.
+
+    Returns:
+        list: (key, expected (debit, credit), actual (debit, credit)) per mismatch
+    """
+    expected = _expected_balances(tenant_id)
+
+    actual_rows = LedgerBalance.objects.all()
+    if tenant_id:
+        actual_rows = actual_rows.filter(tenant_id=tenant_id)
+    actual = {
+        (row.tenant_id, row.ledger, row.period_type, row.period_start): (row.debit, row.credit)
+        for row in actual_rows.iterator()
+    }
+
+    mismatches = []
+    zero = (Decimal('0'), Decimal('0'))
+    for key in set(expected) | set(actual):
+        want = tuple(expected.get(key, zero))
+        have = actual.get(key, zero)
+        if want[0] != have[0] or want[1] != have[1]:
+            mismatches.append((key, want, have))
+    return mismatches
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from accounting.ledger_balances import rebuild_ledger_balances, verify_ledger_balances
+
+
+class Command(BaseCommand):
+    help = 'Rebuild or verify the ledger_balances summary table against journal_entries'
+
+    def add_arguments(self, parser):
+        parser.add_argument('action', choices=['rebuild', 'verify'], help='What to do')
+        parser.add_argument('--tenant', dest='tenant_id', default=None, help='Limit to one tenant')
+
+    def handle(self, *args, **options):
+        tenant_id = options['tenant_id']
+
+        if options['action'] == 'rebuild':
+            count = rebuild_ledger_balances(tenant_id)
+            self.stdout.write(self.style.SUCCESS(f'✓ Rebuilt {count} ledger balance rows'))
+            return
+
+        mismatches = verify_ledger_balances(tenant_id)
+        if not mismatches:
+            self.stdout.write(self.style.SUCCESS('✓ ledger_balances matches journal_entries'))
+            return
+
+        for (tenant, ledger, period_type, period_start), want, have in mismatches[:50]:
+            self.stdout.write(
+                f"  - {tenant} | {ledger} | {period_type} {period_start}: "
+                f"expected Dr {want[0]} Cr {want[1]}, found Dr {have[0]} Cr {have[1]}"
+            )
+        raise CommandError(
+            f'{len(mismatches)} ledger balance rows out of sync; run "ledger_balances rebuild"'
+        )
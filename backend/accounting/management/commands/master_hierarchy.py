@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from accounting.hierarchy_index import invalidate_hierarchy_index, load_hierarchy_index
+
+
+class Command(BaseCommand):
+    help = 'Invalidate or inspect the in-memory master_hierarchy_raw index'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'action', choices=['invalidate', 'stats'],
+            help='invalidate: every process reloads the index (run after reloading master_hierarchy_raw)'
+        )
+
+    def handle(self, *args, **options):
+        if options['action'] == 'invalidate':
+            version = invalidate_hierarchy_index()
+            self.stdout.write(self.style.SUCCESS(f'✓ master_hierarchy_raw index version is now {version}'))
+            return
+
+        index = load_hierarchy_index()
+        coded = sum(1 for row in index.rows if row[1] and row[1].strip())
+        self.stdout.write(f'master_hierarchy_raw: {len(index)} rows, {coded} with codes (version {index.version})')
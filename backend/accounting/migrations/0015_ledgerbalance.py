@@ -0,0 +1,66 @@
+# Generated by Django 5.0.14 on 2026-10-17 17:56
+
+from collections import defaultdict
+
+from django.db import migrations, models
+from django.db.models import Sum
+
+
+def populate_ledger_balances(apps, schema_editor):
+    """Seed ledger_balances from existing journal entries."""
+    JournalEntry = apps.get_model('accounting', 'JournalEntry')
+    LedgerBalance = apps.get_model('accounting', 'LedgerBalance')
+
+    totals = defaultdict(lambda: [0, 0])
+    rows = JournalEntry.objects.values('tenant_id', 'ledger', 'voucher__date').annotate(
+        total_debit=Sum('debit'), total_credit=Sum('credit')
+    )
+    for row in rows.iterator():
+        day = row['voucher__date']
+        if day is None or not row['ledger']:
+            continue
+        for period_type, period_start in (('day', day), ('month', day.replace(day=1))):
+            key = (row['tenant_id'], row['ledger'], period_type, period_start)
+            totals[key][0] += row['total_debit'] or 0
+            totals[key][1] += row['total_credit'] or 0
+
+    LedgerBalance.objects.bulk_create(
+        [
+            LedgerBalance(
+                tenant_id=tenant_id, ledger=ledger, period_type=period_type,
+                period_start=period_start, debit=debit, credit=credit
+            )
+            for (tenant_id, ledger, period_type, period_start), (debit, credit) in totals.items()
+        ],
+        batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounting', '0014_voucherpurchasesupplyforeigndetails_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LedgerBalance',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tenant_id', models.CharField(db_index=True, max_length=36)),
+                ('created_at', models.DateTimeField(auto_now_add=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True, null=True)),
+                ('ledger', models.CharField(help_text='Ledger name as stored on journal entries', max_length=255)),
+                ('period_type', models.CharField(choices=[('day', 'Day'), ('month', 'Month')], max_length=10)),
+                ('period_start', models.DateField(help_text='Day, or first day of the month')),
+                ('debit', models.DecimalField(decimal_places=2, default=0, max_digits=18)),
+                ('credit', models.DecimalField(decimal_places=2, default=0, max_digits=18)),
+            ],
+            options={
+                'db_table': 'ledger_balances',
+                'indexes': [models.Index(fields=['tenant_id', 'period_type', 'period_start'], name='ledger_bala_tenant__a2666f_idx')],
+                'unique_together': {('tenant_id', 'ledger', 'period_type', 'period_start')},
+            },
+        ),
+        migrations.RunPython(populate_ledger_balances, migrations.RunPython.noop),
+    ]
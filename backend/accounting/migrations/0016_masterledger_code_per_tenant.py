@@ -0,0 +1,26 @@
+# Generated by Django 5.0.14 on 2026-10-17 18:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounting', '0015_ledgerbalance'),
+    ]
+
+    operations = [
+        migrations.AlterUniqueTogether(
+            name='masterledger',
+            unique_together={('name', 'tenant_id')},
+        ),
+        migrations.AlterField(
+            model_name='masterledger',
+            name='code',
+            field=models.CharField(blank=True, db_column='ledger_code', help_text='Auto-generated code based on hierarchy position (unique per tenant)', max_length=50, null=True),
+        ),
+        migrations.AlterUniqueTogether(
+            name='masterledger',
+            unique_together={('name', 'tenant_id'), ('tenant_id', 'code')},
+        ),
+    ]
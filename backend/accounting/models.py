@@ -1,6 +1,7 @@
 from django.db import models
 from django.utils import timezone
 from core.models import BaseModel
+from core.sequences import SequenceAllocator, format_number
 
 # Import TransactionFile model
 from .models_transaction import TransactionFile
@@ -119,9 +120,8 @@ class MasterLedger(BaseModel):
         max_length=50,
         null=True,
         blank=True,
-        unique=True,
         db_column='ledger_code',
-        help_text="Auto-generated code based on hierarchy position"
+        help_text="Auto-generated code based on hierarchy position (unique per tenant)"
     )
     
     # Dynamic question answers (NEW FIELD for questions system)
@@ -133,7 +133,7 @@ class MasterLedger(BaseModel):
 
     class Meta:
         db_table = 'master_ledgers'
-        unique_together = ('name', 'tenant_id')
+        unique_together = [('name', 'tenant_id'), ('tenant_id', 'code')]
 
     def __str__(self):
         return f"{self.name} ({self.group})"
@@ -215,17 +215,14 @@ class VoucherConfiguration(BaseModel):
         if not self.enable_auto_numbering:
             return None
         
-        # Format the number with padding
-        padded_number = str(self.current_number).zfill(self.required_digits)
-        
-        # Construct the voucher number
-        voucher_number = f"{self.prefix or ''}{padded_number}{self.suffix or ''}"
-        
-        # Increment current_number for next use
-        self.current_number += 1
-        self.save(update_fields=['current_number', 'updated_at'])
+        # current_number holds the next number to issue; take it atomically (see core.sequences)
+        number = voucher_numbers.next(self.pk) - 1
+        self.current_number = number + 1
         
-        return voucher_number
+        return format_number(number, self.prefix, self.required_digits, self.suffix)
+
+
+voucher_numbers = SequenceAllocator(VoucherConfiguration._meta.db_table, touch='updated_at')
 
 
 class Voucher(BaseModel):
@@ -287,6 +284,36 @@ class JournalEntry(BaseModel):
         ]
 
 
+class LedgerBalance(BaseModel):
+    """
+    Materialized debit/credit totals per ledger and period.
+    Maintained alongside journal entries (see accounting/ledger_balances.py);
+    every posting updates one 'day' row and one 'month' row.
+    """
+    PERIOD_DAY = 'day'
+    PERIOD_MONTH = 'month'
+    PERIOD_TYPE_CHOICES = [
+        (PERIOD_DAY, 'Day'),
+        (PERIOD_MONTH, 'Month'),
+    ]
+
+    ledger = models.CharField(max_length=255, help_text="Ledger name as stored on journal entries")
+    period_type = models.CharField(max_length=10, choices=PERIOD_TYPE_CHOICES)
+    period_start = models.DateField(help_text="Day, or first day of the month")
+    debit = models.DecimalField(max_digits=18, decimal_places=2, default=0)
+    credit = models.DecimalField(max_digits=18, decimal_places=2, default=0)
+
+    class Meta:
+        db_table = 'ledger_balances'
+        unique_together = ('tenant_id', 'ledger', 'period_type', 'period_start')
+        indexes = [
+            models.Index(fields=['tenant_id', 'period_type', 'period_start']),
+        ]
+
+    def __str__(self):
+        return f"{self.ledger} {self.period_type} {self.period_start}"
+
+
 class AmountTransaction(BaseModel):
     """
     Stores transaction amounts for Cash and Bank ledgers from Asset category.
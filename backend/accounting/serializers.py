@@ -1,11 +1,15 @@
 import uuid
 import logging
+from django.db import transaction
 from rest_framework import serializers
 from .models import (
     MasterLedgerGroup, MasterLedger, MasterVoucherConfig, MasterHierarchyRaw,
     Voucher, JournalEntry, AmountTransaction
 )
 from .models_question import Answer, Question
+from .balances import resolve_ledger_balances
+from .ledger_balances import post_journal_entries
+from .voucher_posting import auto_voucher_number, build_journal_entries
 
 logger = logging.getLogger(__name__)
 
@@ -24,6 +28,20 @@ class MasterLedgerGroupSerializer(TenantModelSerializerMixin, serializers.ModelS
         read_only_fields = ['id', 'tenant_id', 'created_at', 'updated_at']
 
 
+class MasterLedgerListSerializer(serializers.ListSerializer):
+    """
+    Resolves balances for every ledger being listed in a fixed number of
+    grouped queries and feeds them to the child serializer through context.
+    """
+
+    def to_representation(self, data):
+        iterable = data.all() if hasattr(data, 'all') else data
+        ledgers = list(iterable)
+        if 'ledger_balances' not in self._context:
+            self._context['ledger_balances'] = resolve_ledger_balances(ledgers)
+        return super().to_representation(ledgers)
+
+
 class MasterLedgerSerializer(TenantModelSerializerMixin, serializers.ModelSerializer):
     question_answers = serializers.JSONField(source='additional_data', required=False, allow_null=True)
     balance = serializers.SerializerMethodField()
@@ -43,6 +61,7 @@ class MasterLedgerSerializer(TenantModelSerializerMixin, serializers.ModelSerial
             'tenant_id', 'created_at', 'updated_at'
         ]
         read_only_fields = ['id', 'code', 'balance', 'tenant_id', 'created_at', 'updated_at']
+        list_serializer_class = MasterLedgerListSerializer
         extra_kwargs = {
             'category': {'required': False, 'allow_null': True, 'allow_blank': True},
             'group': {'required': False, 'allow_null': True, 'allow_blank': True},
@@ -58,65 +77,19 @@ class MasterLedgerSerializer(TenantModelSerializerMixin, serializers.ModelSerial
         }
     
     def get_balance(self, obj):
-        """Calculate balance from transaction files, amount_transactions, or journal entries"""
+        """
+        Return the ledger balance.
+        List serialization resolves all balances up front (see MasterLedgerListSerializer)
+        and passes them through context; single ledgers are resolved on demand.
+        """
         try:
-            logger.debug(f"Looking for ledger: '{obj.name}' with tenant_id: '{obj.tenant_id}'")
-            
-            # Try AmountTransaction first (for Cash/Bank ledgers)
-            try:
-                from accounting.models import AmountTransaction
-                latest_txn = AmountTransaction.objects.filter(
-                    tenant_id=obj.tenant_id,
-                    ledger=obj
-                ).order_by('-transaction_date', '-created_at').first()
-                
-                if latest_txn:
-                    logger.debug(f"Found balance in AmountTransaction: {latest_txn.balance}")
-                    return latest_txn.balance
-            except Exception as e:
-                logger.debug(f"AmountTransaction lookup failed: {e}")
-            
-            # Try TransactionFile
-            from accounting.models import TransactionFile
-            transaction_file = TransactionFile.objects.filter(
-                tenant_id=obj.tenant_id,
-                ledger_name=obj.name
-            ).first()
-            
-            logger.debug(f"TransactionFile query result: {transaction_file}")
-            
-            if transaction_file and transaction_file.transactions:
-                return transaction_file.transactions.get('balance', 0)
-            
-            # Fallback to journal entries (if table exists)
-            try:
-                logger.debug("Trying journal entries")
-                from django.db.models import Sum
-                from accounting.models import JournalEntry
-                entries = JournalEntry.objects.filter(
-                    tenant_id=obj.tenant_id,
-                    ledger=obj
-                )
-                
-                total_debit = entries.aggregate(Sum('debit'))['debit__sum'] or 0
-                total_credit = entries.aggregate(Sum('credit'))['credit__sum'] or 0
-                
-                # Calculate balance based on ledger category
-                if obj.category in ['Asset', 'Expenditure', 'Expense']:
-                    balance = total_debit - total_credit
-                else:  # Liability, Income, Capital
-                    balance = total_credit - total_debit
-                
-                return float(balance)
-            except Exception as je:
-                logger.debug(f"Journal entries not available: {je}")
-                return 0
-            
+            balances = self.context.get('ledger_balances')
+            if balances is None or obj.id not in balances:
+                balances = resolve_ledger_balances([obj])
+            return balances.get(obj.id, 0.0)
         except Exception as e:
             # If any error, return 0
-            print(f"ERROR getting balance for {obj.name}: {e}")
-            import traceback
-            traceback.print_exc()
+            logger.error(f"ERROR getting balance for {obj.name}: {e}", exc_info=True)
             return 0.0
 
 
@@ -272,8 +245,18 @@ class AmountTransactionSerializer(TenantModelSerializerMixin, serializers.ModelS
 class JournalEntrySerializer(serializers.ModelSerializer):
     class Meta:
         model = JournalEntry
-        fields = ['id', 'ledger', 'debit', 'credit']
+        fields = ['id', 'voucher', 'ledger', 'debit', 'credit']
         read_only_fields = ['id']
+        # Needed to post a single entry; nested under the voucher otherwise
+        extra_kwargs = {'voucher': {'write_only': True, 'required': False}}
+
+    def validate_voucher(self, voucher):
+        """Entries may only be attached to a voucher of the caller's tenant"""
+        request = self.context.get('request')
+        tenant_id = getattr(getattr(request, 'user', None), 'tenant_id', None)
+        if voucher is not None and str(voucher.tenant_id) != str(tenant_id):
+            raise serializers.ValidationError('A voucher of this tenant is required.')
+        return voucher
 
 
 class VoucherSerializer(TenantModelSerializerMixin, serializers.ModelSerializer):
@@ -379,123 +362,25 @@ class VoucherSerializer(TenantModelSerializerMixin, serializers.ModelSerializer)
         
         # Auto-generate voucher_number if not provided
         if 'voucher_number' not in validated_data or not validated_data['voucher_number']:
-            prefix_map = {
-                'sales': 'SALES',
-                'purchase': 'PURCH',
-                'payment': 'PAY',
-                'receipt': 'REC',
-                'contra': 'CONTRA',
-                'journal': 'JV'
-            }
-            prefix = prefix_map.get(voucher_type, 'VCH')
             unique_suffix = str(uuid.uuid4())[:8]
-            validated_data['voucher_number'] = validated_data.get('invoice_no') or f"{prefix}-AUTO-{unique_suffix}"
+            validated_data['voucher_number'] = validated_data.get('invoice_no') or auto_voucher_number(
+                voucher_type, unique_suffix
+            )
         
         tenant_id = validated_data.get('tenant_id')
-        voucher = Voucher.objects.create(**validated_data)
-        
-        # Create journal entries based on voucher type
-        self._create_journal_entries(voucher, validated_data, entries_data, tenant_id)
+        with transaction.atomic():
+            voucher = Voucher.objects.create(**validated_data)
+            
+            # Create journal entries based on voucher type
+            self._create_journal_entries(voucher, validated_data, entries_data, tenant_id)
         
         return voucher
     
     def _create_journal_entries(self, voucher, validated_data, entries_data, tenant_id):
-        """Create journal entries based on voucher type"""
-        voucher_type = voucher.type
-        
-        if voucher_type == 'sales':
-            # Debit: Party, Credit: Sales
-            JournalEntry.objects.create(
-                voucher=voucher,
-                ledger=validated_data.get('party', 'Unknown'),
-                debit=voucher.total or 0,
-                credit=0,
-                tenant_id=tenant_id
-            )
-            JournalEntry.objects.create(
-                voucher=voucher,
-                ledger='Sales',
-                debit=0,
-                credit=voucher.total or 0,
-                tenant_id=tenant_id
-            )
-        
-        elif voucher_type == 'purchase':
-            # Debit: Purchase, Credit: Party
-            JournalEntry.objects.create(
-                voucher=voucher,
-                ledger='Purchase',
-                debit=voucher.total or 0,
-                credit=0,
-                tenant_id=tenant_id
-            )
-            JournalEntry.objects.create(
-                voucher=voucher,
-                ledger=validated_data.get('party', 'Unknown'),
-                debit=0,
-                credit=voucher.total or 0,
-                tenant_id=tenant_id
-            )
-        
-        elif voucher_type == 'payment':
-            # Debit: Party, Credit: Account
-            JournalEntry.objects.create(
-                voucher=voucher,
-                ledger=validated_data.get('party', 'Unknown'),
-                debit=voucher.amount or 0,
-                credit=0,
-                tenant_id=tenant_id
-            )
-            JournalEntry.objects.create(
-                voucher=voucher,
-                ledger=validated_data.get('account', 'Cash'),
-                debit=0,
-                credit=voucher.amount or 0,
-                tenant_id=tenant_id
-            )
-        
-        elif voucher_type == 'receipt':
-            # Debit: Account, Credit: Party
-            JournalEntry.objects.create(
-                voucher=voucher,
-                ledger=validated_data.get('account', 'Cash'),
-                debit=voucher.amount or 0,
-                credit=0,
-                tenant_id=tenant_id
-            )
-            JournalEntry.objects.create(
-                voucher=voucher,
-                ledger=validated_data.get('party', 'Unknown'),
-                debit=0,
-                credit=voucher.amount or 0,
-                tenant_id=tenant_id
-            )
-        
-        elif voucher_type == 'contra':
-            # Debit: To Account, Credit: From Account
-            JournalEntry.objects.create(
-                voucher=voucher,
-                ledger=validated_data.get('to_account', 'Bank'),
-                debit=voucher.amount or 0,
-                credit=0,
-                tenant_id=tenant_id
-            )
-            JournalEntry.objects.create(
-                voucher=voucher,
-                ledger=validated_data.get('from_account', 'Cash'),
-                debit=0,
-                credit=voucher.amount or 0,
-                tenant_id=tenant_id
-            )
-        
-        elif voucher_type == 'journal':
-            # Create custom journal entries
-            for entry in entries_data:
-                JournalEntry.objects.create(
-                    voucher=voucher,
-                    ledger=entry.get('ledger'),
-                    debit=entry.get('debit', 0),
-                    credit=entry.get('credit', 0),
-                    tenant_id=tenant_id
-                )
+        """
+        Create journal entries based on voucher type and post them to the
+        ledger_balances summary table (caller provides the transaction).
+        """
+        entries = JournalEntry.objects.bulk_create(build_journal_entries(voucher, entries_data))
+        post_journal_entries(entries, entry_date=voucher.date)
 
@@ -0,0 +1,81 @@
+"""
+Test cases for the in-memory master_hierarchy_raw index.
+
+Lookups must return what the SQL they replace returned: the first row (by id)
+matching every given level, with left-out levels matching anything.
+"""
+
+from unittest.mock import patch
+
+from django.test import TestCase, override_settings
+from accounting import hierarchy_index
+from accounting.hierarchy_index import HierarchyIndex, get_hierarchy_index, invalidate_hierarchy_index
+from accounting.utils import _lookup_exact_hierarchy_code
+from accounting.views_questions import LedgerQuestionsView
+from core.models import TenantSequence
+
+ROWS = [
+    (1, '', 'Assets', None, None, None, None, None),
+    (2, '0101000000000000', 'Assets', 'Current Assets', None, None, None, None),
+    (3, '0101010000000000', 'Assets', 'Current Assets', 'Cash & Bank', None, None, None),
+    (4, '0101010100000001', 'Assets', 'Current Assets', 'Cash & Bank', 'Bank', None, 'Bank Account'),
+    (5, '0102010000000000', 'Assets', 'Fixed Assets', 'Cash & Bank', None, None, None),
+    (6, '0201000000000000', 'Liabilities', 'Current Liabilities', None, None, None, None),
+]
+
+
+class TestHierarchyIndex(TestCase):
+    """Dictionary walks over master_hierarchy_raw"""
+
+    def setUp(self):
+        self.index = HierarchyIndex(reversed(ROWS), version=1)
+        patcher = patch('accounting.utils.get_hierarchy_index', return_value=self.index)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_find_matches_first_row_by_id(self):
+        self.assertEqual(self.index.find(['Assets'])[0], 1)
+        self.assertEqual(self.index.find(['Assets'], coded=True)[0], 2)
+        self.assertEqual(self.index.find([' assets ', 'CURRENT ASSETS', 'cash & bank'])[0], 3)
+        # Left-out levels match anything
+        self.assertEqual(self.index.find([None, None, 'Cash & Bank'])[0], 3)
+        self.assertEqual(self.index.find([None, 'Fixed Assets', 'Cash & Bank'])[0], 5)
+        self.assertEqual(self.index.find(['Assets', None, None, None, None, 'Bank Account'])[0], 4)
+        self.assertIsNone(self.index.find(['Assets', 'Current Liabilities']))
+
+    def test_code_lookup_drops_trailing_fields(self):
+        self.assertEqual(_lookup_exact_hierarchy_code({
+            'category': 'Assets', 'group': 'Current Assets', 'sub_group_1': 'Cash & Bank', 'sub_group_2': 'Bank'
+        }), '0101010100000001')
+        self.assertEqual(_lookup_exact_hierarchy_code({
+            'category': 'Assets', 'group': 'Current Assets', 'sub_group_1': 'Cash & Bank', 'ledger_type': 'Petty Cash'
+        }), '0101010000000000')
+        self.assertEqual(_lookup_exact_hierarchy_code({'category': 'Assets', 'group': ' '}), '0101000000000000')
+        self.assertIsNone(_lookup_exact_hierarchy_code({'category': 'Equity'}))
+        self.assertIsNone(_lookup_exact_hierarchy_code({}))
+
+    def test_questions_view_node(self):
+        with patch('accounting.views_questions.get_hierarchy_index', return_value=self.index):
+            node = LedgerQuestionsView().get_hierarchy_node('Liabilities', None, None, None, None, None)
+            self.assertEqual(node['code'], '0201000000000000')
+            self.assertEqual(node['group'], 'Current Liabilities')
+            self.assertIsNone(LedgerQuestionsView().get_hierarchy_node(None, None, None, None, None, None))
+
+    @override_settings(HIERARCHY_INDEX={'CHECK_INTERVAL': -1})
+    def test_version_stamp_reloads_the_index(self):
+        with patch.object(hierarchy_index, '_index', None), \
+                patch('accounting.hierarchy_index.MasterHierarchyRaw') as model:
+            model.objects.values_list.return_value = ROWS[:2]
+            self.assertEqual(len(get_hierarchy_index()), 2)
+            self.assertEqual(len(get_hierarchy_index()), 2)
+            self.assertEqual(model.objects.values_list.call_count, 1)
+
+            # Another process reloaded the table and bumped the stamp
+            model.objects.values_list.return_value = ROWS
+            TenantSequence.objects.create(tenant_id='global', name='master_hierarchy_raw', current_number=1)
+            index = get_hierarchy_index()
+            self.assertEqual((len(index), index.version), (6, 1))
+
+            self.assertEqual(invalidate_hierarchy_index(), 2)
+            self.assertEqual(get_hierarchy_index().version, 2)
+            self.assertEqual(model.objects.values_list.call_count, 3)
@@ -0,0 +1,103 @@
+"""
+Test cases for the materialized ledger_balances table.
+
+Postings made through VoucherSerializer must keep ledger_balances in step with
+journal_entries, and range totals must match a direct aggregation.
+"""
+
+from datetime import date
+from decimal import Decimal
+from types import SimpleNamespace
+
+from django.db.models import Sum
+from django.test import TestCase
+from rest_framework.test import APIRequestFactory, force_authenticate
+from accounting.ledger_balances import (
+    get_ledger_totals, rebuild_ledger_balances, reverse_journal_entries, verify_ledger_balances
+)
+from accounting.models import JournalEntry, LedgerBalance, Voucher
+from accounting.serializers import VoucherSerializer
+from accounting.views import JournalEntryViewSet
+
+
+class TestLedgerBalanceTable(TestCase):
+    """ledger_balances is maintained on voucher posting"""
+
+    def setUp(self):
+        self.tenant_id = 'tenant-1'
+        request = SimpleNamespace(user=SimpleNamespace(is_authenticated=True, tenant_id=self.tenant_id))
+        postings = [
+            {'type': 'sales', 'date': '2025-04-10', 'party': 'ABC Ltd', 'total': '1000.00'},
+            {'type': 'sales', 'date': '2025-05-02', 'party': 'ABC Ltd', 'total': '500.00'},
+            {'type': 'purchase', 'date': '2025-05-31', 'party': 'XYZ Suppliers', 'total': '300.00'},
+            {'type': 'receipt', 'date': '2025-06-15', 'party': 'ABC Ltd', 'account': 'Cash', 'amount': '700.00'},
+        ]
+        for data in postings:
+            serializer = VoucherSerializer(data=data, context={'request': request})
+            serializer.is_valid(raise_exception=True)
+            serializer.save()
+
+    def _journal_totals(self, **filters):
+        rows = JournalEntry.objects.filter(tenant_id=self.tenant_id, **filters).values('ledger').annotate(
+            total_debit=Sum('debit'), total_credit=Sum('credit')
+        )
+        return {row['ledger']: (row['total_debit'], row['total_credit']) for row in rows}
+
+    def _balance_totals(self, **kwargs):
+        return {
+            row['ledger']: (row['total_debit'], row['total_credit'])
+            for row in get_ledger_totals(self.tenant_id, **kwargs)
+        }
+
+    def test_posting_updates_summary(self):
+        self.assertEqual(verify_ledger_balances(self.tenant_id), [])
+        self.assertEqual(self._balance_totals(), self._journal_totals())
+        self.assertEqual(self._balance_totals()['ABC Ltd'], (Decimal('1500.00'), Decimal('700.00')))
+
+    def test_range_totals_match_journal_entries(self):
+        for start, end in ((date(2025, 4, 15), date(2025, 6, 30)),
+                           (date(2025, 5, 1), date(2025, 5, 31)),
+                           (date(2025, 5, 2), date(2025, 5, 2)),
+                           (None, date(2025, 5, 30))):
+            filters = {'voucher__date__lte': end}
+            if start:
+                filters['voucher__date__gte'] = start
+            self.assertEqual(
+                self._balance_totals(start_date=start, end_date=end),
+                self._journal_totals(**filters)
+            )
+
+    def test_reversal_and_rebuild(self):
+        voucher = Voucher.objects.get(tenant_id=self.tenant_id, type='purchase')
+        reverse_journal_entries(voucher.journal_entries.all(), entry_date=voucher.date)
+        voucher.delete()
+        self.assertEqual(verify_ledger_balances(self.tenant_id), [])
+
+        LedgerBalance.objects.filter(tenant_id=self.tenant_id).update(debit=0)
+        self.assertNotEqual(verify_ledger_balances(self.tenant_id), [])
+        rebuild_ledger_balances(self.tenant_id)
+        self.assertEqual(verify_ledger_balances(self.tenant_id), [])
+
+    def test_journal_entry_endpoint_posts(self):
+        voucher = Voucher.objects.get(tenant_id=self.tenant_id, type='purchase')
+        request = APIRequestFactory().post('/journal-entries/', {
+            'voucher': voucher.id, 'ledger': 'Freight', 'debit': '25.00', 'credit': '0'
+        }, format='json')
+        force_authenticate(request, user=SimpleNamespace(is_authenticated=True, tenant_id=self.tenant_id))
+
+        response = JournalEntryViewSet.as_view({'post': 'create'})(request)
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(verify_ledger_balances(self.tenant_id), [])
+        self.assertEqual(self._balance_totals()['Freight'], (Decimal('25.00'), Decimal('0.00')))
+
+    def test_journal_entry_cannot_move_to_foreign_voucher(self):
+        entry = JournalEntry.objects.filter(tenant_id=self.tenant_id).first()
+        foreign = Voucher.objects.create(type='journal', voucher_number='JV-X', tenant_id='tenant-2')
+        request = APIRequestFactory().patch(f'/journal-entries/{entry.id}/', {'voucher': foreign.id}, format='json')
+        force_authenticate(request, user=SimpleNamespace(is_authenticated=True, tenant_id=self.tenant_id))
+
+        response = JournalEntryViewSet.as_view({'patch': 'partial_update'})(request, pk=entry.id)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('voucher', response.data)
+        entry.refresh_from_db()
+        self.assertNotEqual(entry.voucher_id, foreign.id)
@@ -0,0 +1,79 @@
+"""
+Test cases for batched ledger balance resolution.
+
+The batched resolver must return exactly what MasterLedgerSerializer.get_balance
+returns for a single ledger, in a fixed number of queries.
+"""
+
+from datetime import date
+from decimal import Decimal
+
+from django.test import TestCase
+from accounting.balances import resolve_ledger_balances
+from accounting.ledger_balances import post_journal_entries
+from accounting.models import MasterLedger, AmountTransaction, JournalEntry, Voucher
+from accounting.models_transaction import TransactionFile
+from accounting.serializers import MasterLedgerSerializer
+from core.testing import use_temp_ai_cache
+
+
+class TestLedgerBalanceResolver(TestCase):
+    """Batched balances match the single-ledger lookup"""
+
+    def setUp(self):
+        use_temp_ai_cache(self)
+        self.tenant_id = 'tenant-1'
+        self.bank = MasterLedger.objects.create(
+            name='HDFC Bank', group='Cash and Bank Balances', category='Assets',
+            sub_group_1='Bank', tenant_id=self.tenant_id
+        )
+        self.registered = MasterLedger.objects.create(
+            name='Registered', group='Sundry Debtors', tenant_id=self.tenant_id
+        )
+        self.expense = MasterLedger.objects.create(
+            name='Rent', group='Indirect Expenses', category='Expense', tenant_id=self.tenant_id
+        )
+        self.income = MasterLedger.objects.create(
+            name='Sales', group='Sales Accounts', category='Income', tenant_id=self.tenant_id
+        )
+
+        for day, balance in ((1, '100.00'), (5, '250.00')):
+            AmountTransaction.objects.create(
+                ledger=self.bank, ledger_name=self.bank.name, tenant_id=self.tenant_id,
+                transaction_date=date(2025, 4, day), balance=Decimal(balance)
+            )
+
+        TransactionFile.objects.create(
+            tenant_id=self.tenant_id, financial_year_id=1, ledger_name=self.registered.name
+        )
+
+        voucher = Voucher.objects.create(
+            type='journal', voucher_number='JV-1', tenant_id=self.tenant_id
+        )
+        entries = [
+            JournalEntry.objects.create(
+                voucher=voucher, ledger=str(ledger), debit=debit, credit=credit,
+                tenant_id=self.tenant_id
+            )
+            for ledger, debit, credit in ((self.expense, 300, 0), (self.income, 0, 300), (self.income, 50, 0))
+        ]
+        post_journal_entries(entries)
+
+    def test_batched_balances_match_single_lookup(self):
+        ledgers = list(MasterLedger.objects.filter(tenant_id=self.tenant_id))
+        single = {ledger.id: MasterLedgerSerializer(ledger).data['balance'] for ledger in ledgers}
+
+        self.assertEqual(resolve_ledger_balances(ledgers), single)
+        self.assertEqual(single[self.bank.id], Decimal('250.00'))
+        self.assertEqual(single[self.registered.id], 0.0)
+        self.assertEqual(single[self.expense.id], 300.0)
+        self.assertEqual(single[self.income.id], 250.0)
+
+    def test_list_serialization_uses_fixed_query_count(self):
+        for i in range(20):
+            MasterLedger.objects.create(name=f'Party {i}', group='Sundry Debtors', tenant_id=self.tenant_id)
+
+        queryset = MasterLedger.objects.filter(tenant_id=self.tenant_id)
+        # ledgers + AmountTransaction + TransactionFile + ledger_balances
+        with self.assertNumQueries(4):
+            MasterLedgerSerializer(queryset, many=True).data
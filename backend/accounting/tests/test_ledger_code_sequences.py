@@ -0,0 +1,90 @@
+"""
+Test cases for ledger codes allocated from per-tenant counters.
+
+Each stem's counter continues from the codes a tenant already has, and
+tenants number independently of each other.
+"""
+
+from unittest.mock import patch
+
+from django.test import TestCase
+from rest_framework.test import APIRequestFactory
+from accounting.hierarchy_index import HierarchyIndex
+from accounting.models import MasterLedger
+from accounting.utils import generate_ledger_code
+from accounting.views import MasterLedgerViewSet
+from core.testing import use_temp_ai_cache
+
+ROWS = [
+    (1, '0101010100000001', 'Assets', 'Current Assets', 'Cash & Bank', 'Bank', None, 'Bank Account'),
+    (2, '1001', 'Liabilities', 'Loans', None, None, None, None),
+]
+
+BANK = {'category': 'Assets', 'group': 'Current Assets', 'sub_group_1': 'Cash & Bank', 'sub_group_2': 'Bank'}
+LOANS = {'category': 'Liabilities', 'group': 'Loans'}
+
+
+class TestLedgerCodeSequences(TestCase):
+    """generate_ledger_code without sibling scans"""
+
+    def setUp(self):
+        use_temp_ai_cache(self)
+        patcher = patch('accounting.utils.get_hierarchy_index', return_value=HierarchyIndex(ROWS))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _ledger(self, tenant_id, code, **fields):
+        return MasterLedger.objects.create(
+            tenant_id=tenant_id, name=f"Ledger {code}", group='Group', code=code, **fields
+        )
+
+    def test_flat_codes_continue_existing_numbering(self):
+        self._ledger('t1', '0101010100000003')
+
+        self.assertEqual(generate_ledger_code(BANK, 't1'), '0101010100000004')
+        self.assertEqual(generate_ledger_code(BANK, 't1'), '0101010100000005')
+        self.assertEqual(generate_ledger_code(BANK, 't2'), '0101010100000001')
+
+    def test_stem_shared_by_every_path(self):
+        # ledger_type alone matches the 16-digit code without a parent level
+        self.assertEqual(generate_ledger_code(BANK, 't1'), '0101010100000001')
+        self.assertEqual(generate_ledger_code({'ledger_type': 'Bank Account'}, 't1'), '0101010100000002')
+        self.assertEqual(generate_ledger_code(BANK, 't1'), '0101010100000003')
+
+    def test_hierarchy_code_then_suffixes(self):
+        self.assertEqual(generate_ledger_code(LOANS, 't1'), '1001')
+        self.assertEqual(generate_ledger_code(LOANS, 't1'), '1001.001')
+
+        base = self._ledger('t2', '1001')
+        self._ledger('t2', '1001.004')
+        self.assertEqual(generate_ledger_code(LOANS, 't2'), '1001.005')
+        self.assertEqual(generate_ledger_code({'parent_ledger_id': base.id}, 't2'), '1001.006')
+
+    def test_fallback_codes(self):
+        self._ledger('t1', '9005')
+
+        self.assertEqual(generate_ledger_code({'category': 'Unknown'}, 't1'), '9006')
+        self.assertEqual(generate_ledger_code({'category': 'Unknown'}, 't2'), '9001')
+
+    def test_codes_unique_per_tenant(self):
+        self._ledger('t1', '9001')
+        self._ledger('t2', '9001')
+
+        self.assertEqual(MasterLedger.objects.filter(code='9001').count(), 2)
+
+    def test_conflict_is_a_validation_error(self):
+        view = MasterLedgerViewSet.as_view({'post': 'create'})
+        payload = {'name': 'Cash', 'group': 'Cash & Bank', 'category': 'Unknown'}
+
+        response = view(APIRequestFactory().post('/ledgers/', payload, format='json'))
+        self.assertEqual(response.status_code, 201, response.data)
+        response = view(APIRequestFactory().post('/ledgers/', payload, format='json'))
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('name', response.data)
+
+        # A code taken outside the counters
+        self._ledger(1, '9002')
+        payload['name'] = 'Petty Cash'
+        response = view(APIRequestFactory().post('/ledgers/', payload, format='json'))
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('code', response.data)
@@ -0,0 +1,71 @@
+"""
+Test cases for bulk voucher posting.
+
+post_vouchers must write the same vouchers, journal entries and ledger_balances
+as posting each row through VoucherSerializer, and report bad rows by index.
+"""
+
+from decimal import Decimal
+from types import SimpleNamespace
+
+from django.test import TestCase
+from accounting.ledger_balances import get_ledger_totals, verify_ledger_balances
+from accounting.models import JournalEntry, Voucher
+from accounting.serializers import VoucherSerializer
+from accounting.voucher_posting import post_vouchers
+
+
+class TestVoucherPosting(TestCase):
+    """Bulk posting matches single posting"""
+
+    def setUp(self):
+        self.tenant_id = 'tenant-1'
+        request = SimpleNamespace(user=SimpleNamespace(is_authenticated=True, tenant_id=self.tenant_id))
+        self.serializer = VoucherSerializer(context={'request': request})
+        self.rows = [
+            {'type': 'sales', 'date': '2025-04-10', 'party': 'ABC Ltd', 'total': '1000.00', 'invoiceNo': 'INV-1'},
+            {'type': 'purchase', 'date': '2025-05-31', 'party': 'XYZ Suppliers', 'total': '300.00'},
+            {'type': 'receipt', 'date': '2025-06-15', 'party': 'ABC Ltd', 'amount': '700.00'},
+            {'type': 'contra', 'date': '2025-06-20', 'amount': '50.00'},
+            {'type': 'journal', 'date': '2025-06-30', 'entries': [
+                {'ledger': 'Rent', 'debit': '20.00', 'credit': '0'},
+                {'ledger': 'Cash', 'debit': '0', 'credit': '20.00'},
+            ]},
+        ]
+
+    def _totals(self):
+        return {row['ledger']: (row['total_debit'], row['total_credit']) for row in get_ledger_totals(self.tenant_id)}
+
+    def test_bulk_posting_in_chunks(self):
+        result = post_vouchers(self.tenant_id, self.rows, self.serializer, chunk_size=2)
+
+        self.assertEqual(result['errors'], [])
+        self.assertEqual((result['count'], result['journal_entries']), (5, 10))
+        self.assertEqual(JournalEntry.objects.filter(tenant_id=self.tenant_id).count(), 10)
+        self.assertEqual(Voucher.objects.get(type='sales').voucher_number, 'INV-1')
+        self.assertTrue(Voucher.objects.get(type='purchase').voucher_number.startswith('PURCH-AUTO-'))
+        self.assertEqual(verify_ledger_balances(self.tenant_id), [])
+
+        totals = self._totals()
+        self.assertEqual(totals['ABC Ltd'], (Decimal('1000.00'), Decimal('700.00')))
+        self.assertEqual(totals['Bank'], (Decimal('50.00'), Decimal('0.00')))
+        self.assertEqual(totals['Cash'], (Decimal('700.00'), Decimal('70.00')))
+
+    def test_errors_reject_batch_unless_partial(self):
+        Voucher.objects.create(type='sales', voucher_number='INV-1', tenant_id=self.tenant_id)
+        rows = self.rows + [
+            {'type': 'payment', 'date': '2025-06-01', 'party': 'XYZ Suppliers'},
+            {'type': 'purchase', 'voucher_number': 'P-1', 'total': '1'},
+            {'type': 'purchase', 'voucher_number': 'P-1', 'total': '2'},
+        ]
+
+        result = post_vouchers(self.tenant_id, rows, self.serializer)
+        self.assertEqual(result['count'], 0)
+        self.assertEqual([error['index'] for error in result['errors']], [0, 5, 7])
+        self.assertIn('amount', result['errors'][1]['errors'])
+        self.assertEqual(JournalEntry.objects.count(), 0)
+
+        result = post_vouchers(self.tenant_id, rows, self.serializer, partial=True)
+        self.assertEqual(result['count'], 5)
+        self.assertEqual(len(result['errors']), 3)
+        self.assertEqual(verify_ledger_balances(self.tenant_id), [])
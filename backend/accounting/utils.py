@@ -1,11 +1,24 @@
 """
 Utility functions for auto-generating ledger codes based on hierarchy.
+
+The next code under a stem comes from a per-tenant counter in tenant_sequences
+(core.sequences.next_tenant_number): one indexed UPDATE per code instead of
+reading and parsing every sibling code, so concurrent requests never get the
+same code. Every 16-digit code is drawn from the counter of its 14-digit stem,
+whichever path picked the stem. Each counter is seeded from the codes already issued the first time
+it is used. Series names:
+
+    ledger_flat:{14-digit stem}  last 2-digit ledger id under a 16-digit stem
+    ledger_base:{code}           1 once a (non 16-digit) hierarchy code itself is taken
+    ledger_suffix:{code}         last {code}.NNN child
+    ledger_fallback              last 9NNN code, minus 9000
 """
 
 import logging
-from django.db import connection
 from django.db.models import Max
 from accounting.models import MasterLedger
+from accounting.hierarchy_index import get_hierarchy_index
+from core.sequences import next_tenant_number
 
 # Initialize logger
 logger = logging.getLogger('accounting.utils')
@@ -54,10 +67,9 @@ def generate_ledger_code(ledger_data, tenant_id, hierarchy_ids=None):
             
         # Old Rule: Suffix logic
         logger.info(f"🏛️ Using EXACT hierarchy code: {hierarchy_code}")
-        existing = MasterLedger.objects.filter(tenant_id=tenant_id, code=hierarchy_code).exists()
-        if existing:
-            return _generate_next_suffix_code(hierarchy_code, tenant_id)
-        return hierarchy_code
+        if _claim_base_code(hierarchy_code, tenant_id):
+            return hierarchy_code
+        return _generate_next_suffix_code(hierarchy_code, tenant_id)
     
     # -------------------------------------------------------------------------
     # Case 3: Fallback (9000+)
@@ -77,11 +89,9 @@ def _generate_next_flat_code(base_code, ledger_data, tenant_id):
     elif ledger_data.get('category') or ledger_data.get('major_group'): prefix_len = 6
     
     if prefix_len == 0 or prefix_len >= 16:
-        # Can't determine parent or full match -> check collision logic
-        if MasterLedger.objects.filter(tenant_id=tenant_id, code=base_code).exists():
-             prefix = base_code[:14]
-        else:
-             return base_code
+        # Can't determine parent or full match -> next id under the code's own stem
+        # (not the code itself: the stem counter would not know it was taken)
+        prefix = base_code[:14]
     else:
         prefix = base_code[:prefix_len]
     
@@ -90,8 +100,27 @@ def _generate_next_flat_code(base_code, ledger_data, tenant_id):
     # Reconstruct from prefix + 00s (Target 14 digits)
     target_stem = prefix.ljust(14, '0')
     
-    # Now find max ledger_id (last 2 digits) for this stem
-    logger.info(f"🔍 Looking for max ID in stem: {target_stem}")
+    # Next ledger_id (last 2 digits) for this stem
+    next_val = next_tenant_number(
+        str(tenant_id), f"ledger_flat:{target_stem}",
+        seed=lambda: _max_flat_id(target_stem, tenant_id)
+    )
+    new_code = f"{target_stem}{next_val:02d}"
+    
+    logger.info(f"✅ Generated dynamic flat code: {new_code}")
+    return new_code
+
+
+def ledger_conflict_errors(ledger_data, tenant_id):
+    """Validation errors for an IntegrityError saving a ledger (duplicate name, or a code taken outside the counters)"""
+    if MasterLedger.objects.filter(tenant_id=tenant_id, name=ledger_data.get('name')).exists():
+        return {'name': 'A ledger with this name already exists.'}
+    return {'code': 'Failed to generate unique ledger code. Please try again.'}
+
+
+def _max_flat_id(target_stem, tenant_id):
+    """Largest ledger_id (last 2 digits) already issued under a 14-digit stem"""
+    logger.info(f"🔍 Seeding ledger_flat:{target_stem} from existing codes")
     
     siblings = MasterLedger.objects.filter(
         tenant_id=tenant_id,
@@ -100,20 +129,18 @@ def _generate_next_flat_code(base_code, ledger_data, tenant_id):
     
     max_val = 0
     for code in siblings:
-        if len(code) != 16 or not code.isdigit():
-            continue
-            
-        try:
-            val = int(code[14:])
-            max_val = max(max_val, val)
-        except ValueError:
-            continue
-            
-    next_val = max_val + 1
-    new_code = f"{target_stem}{next_val:02d}"
-    
-    logger.info(f"✅ Generated dynamic flat code: {new_code}")
-    return new_code
+        if len(code) == 16 and code.isdigit():
+            max_val = max(max_val, int(code[14:]))
+    return max_val
+
+
+def _claim_base_code(base_code, tenant_id):
+    """True for exactly one caller per tenant: the one that may use base_code itself"""
+    number = next_tenant_number(
+        str(tenant_id), f"ledger_base:{base_code}",
+        seed=lambda: int(MasterLedger.objects.filter(tenant_id=tenant_id, code=base_code).exists())
+    )
+    return number == 1
 
 
 def _generate_nested_code(ledger_data, tenant_id):
@@ -144,98 +171,42 @@ def _generate_nested_code(ledger_data, tenant_id):
 
 def _lookup_exact_hierarchy_code(ledger_data):
     """
-    Look up the EXACT code from master_hierarchy_raw table.
+    Look up the EXACT code from master_hierarchy_raw (in-memory index, see
+    accounting.hierarchy_index). If nothing matches all given fields, the
+    trailing fields are dropped one by one.
     """
     
-    # Build WHERE clause based on available hierarchy fields
-    conditions = []
-    params = []
-    
-    # Map ledger_data fields to database columns
-    field_mapping = {
-        'category': 'major_group_1',
-        'group': 'group_1',
-        'sub_group_1': 'sub_group_1_1',
-        'sub_group_2': 'sub_group_2_1',
-        'sub_group_3': 'sub_group_3_1',
-        'ledger_type': 'ledger_1'
-    }
+    # ledger_data fields in hierarchy order (master_hierarchy_raw columns: hierarchy_index.LEVELS)
+    fields = ['category', 'group', 'sub_group_1', 'sub_group_2', 'sub_group_3', 'ledger_type']
     
     # Collect all non-empty hierarchy fields
     hierarchy_fields = []
-    for field, db_column in field_mapping.items():
+    for level, field in enumerate(fields):
         value = ledger_data.get(field)
         if value and value.strip():
-            hierarchy_fields.append((field, db_column, value.strip()))
+            hierarchy_fields.append((level, value.strip()))
     
     if not hierarchy_fields:
         logger.debug("No hierarchy fields provided")
         return None
     
-    # Try to find exact match with all provided fields
-    logger.debug(f"🔍 Looking up exact code with {len(hierarchy_fields)} hierarchy fields")
-    
-    for field, db_column, value in hierarchy_fields:
-        conditions.append(f"{db_column} = %s")
-        params.append(value)
-    
-    query = f"""
-        SELECT code 
-        FROM master_hierarchy_raw 
-        WHERE {' AND '.join(conditions)}
-          AND code IS NOT NULL
-          AND code != ''
-        LIMIT 1
-    """
-    
-    logger.debug(f"Query: {query}")
-    logger.debug(f"Params: {params}")
+    index = get_hierarchy_index()
     
-    with connection.cursor() as cursor:
-        cursor.execute(query, params)
-        row = cursor.fetchone()
+    # Try the exact match first, then progressively less specific matches
+    for i in range(len(hierarchy_fields), 0, -1):
+        path = [None] * len(fields)
+        for level, value in hierarchy_fields[:i]:
+            path[level] = value
         
-        if row and row[0]:
-            exact_code = row[0].strip()
+        row = index.find(path, coded=True)
+        if row:
+            exact_code = row[1].strip()
             logger.info(
-                f"✅ Found EXACT hierarchy code: {exact_code} "
-                f"(matched {len(hierarchy_fields)} fields)"
+                f"✅ Found hierarchy code: {exact_code} "
+                f"(matched {i} of {len(hierarchy_fields)} fields)"
             )
             return exact_code
     
-    # If no exact match, try progressively less specific matches
-    logger.debug("No exact match found, trying less specific matches...")
-    
-    # Try removing fields from the end one by one
-    for i in range(len(hierarchy_fields) - 1, 0, -1):
-        conditions = []
-        params = []
-        
-        for field, db_column, value in hierarchy_fields[:i]:
-            conditions.append(f"{db_column} = %s")
-            params.append(value)
-        
-        query = f"""
-            SELECT code 
-            FROM master_hierarchy_raw 
-            WHERE {' AND '.join(conditions)}
-              AND code IS NOT NULL
-              AND code != ''
-            LIMIT 1
-        """
-        
-        with connection.cursor() as cursor:
-            cursor.execute(query, params)
-            row = cursor.fetchone()
-            
-            if row and row[0]:
-                exact_code = row[0].strip()
-                logger.info(
-                    f"✅ Found hierarchy code: {exact_code} "
-                    f"(matched {i} fields)"
-                )
-                return exact_code
-    
     logger.warning("⚠️ No hierarchy code found for any combination")
     return None
 
@@ -244,9 +215,20 @@ def _generate_next_suffix_code(base_code, tenant_id):
     """
     Generate next available code with format: {base_code}.{sequence}
     """
+    next_suffix = next_tenant_number(
+        str(tenant_id), f"ledger_suffix:{base_code}",
+        seed=lambda: _max_suffix(base_code, tenant_id)
+    )
+    next_code = f"{base_code}.{next_suffix:03d}"
+    logger.info(f"✅ Generated suffix code: {next_code}")
+    return next_code
+
+
+def _max_suffix(base_code, tenant_id):
+    """Largest direct child suffix already issued under base_code ('{base_code}.NNN')"""
     query_prefix = f"{base_code}."
     
-    logger.debug(f"🔍 Finding siblings with prefix: {query_prefix}")
+    logger.debug(f"🔍 Seeding ledger_suffix:{base_code} from siblings with prefix: {query_prefix}")
     
     # Find all direct children (codes starting with base_code.)
     siblings = MasterLedger.objects.filter(
@@ -254,37 +236,29 @@ def _generate_next_suffix_code(base_code, tenant_id):
         code__startswith=query_prefix
     ).values_list('code', flat=True)
     
-    logger.debug(f"Found {len(siblings)} existing siblings")
-    
     max_suffix = 0
     for code in siblings:
-        if code.startswith(query_prefix):
-            # Extract the immediate suffix after base_code
-            remainder = code[len(query_prefix):]
-            # Only consider direct children (no additional dots in first segment)
-            parts = remainder.split('.')
-            if parts and parts[0].isdigit():
-                try:
-                    suffix_num = int(parts[0])
-                    max_suffix = max(max_suffix, suffix_num)
-                    logger.debug(f"  - Found suffix: {suffix_num} in code: {code}")
-                except ValueError:
-                    logger.warning(f"  - Invalid suffix in code: {code}")
-                    continue
-    
-    next_code = f"{base_code}.{max_suffix + 1:03d}"
-    logger.info(
-        f"✅ Generated suffix code: {next_code} "
-        f"(max existing suffix: {max_suffix})"
-    )
-    return next_code
+        # Only consider direct children (no additional dots in first segment)
+        suffix = code[len(query_prefix):].split('.')[0]
+        if suffix.isdigit():
+            max_suffix = max(max_suffix, int(suffix))
+    return max_suffix
 
 
 def _generate_fallback_code(tenant_id):
     """
     Generate fallback code in 9000+ range for unclassified ledgers.
     """
-    logger.debug("🔍 Finding max code in fallback range (9000-9999)")
+    next_code = str(9000 + next_tenant_number(
+        str(tenant_id), 'ledger_fallback', seed=lambda: _max_fallback(tenant_id)
+    ))
+    logger.info(f"✅ Generated fallback code: {next_code}")
+    return next_code
+
+
+def _max_fallback(tenant_id):
+    """Largest fallback code already issued (9000-9999), minus 9000"""
+    logger.debug("🔍 Seeding ledger_fallback from max code in fallback range (9000-9999)")
     
     # Find max code in custom range (9000-9999, flat codes only)
     max_ledger = MasterLedger.objects.filter(
@@ -293,20 +267,7 @@ def _generate_fallback_code(tenant_id):
     ).aggregate(Max('code'))
     
     max_code_value = max_ledger.get('code__max')
-    
-    if max_code_value:
-        try:
-            next_code = str(int(max_code_value) + 1)
-            logger.info(
-                f"✅ Generated fallback code: {next_code} "
-                f"(previous max: {max_code_value})"
-            )
-            return next_code
-        except ValueError:
-            logger.error(f"❌ Invalid max code value: {max_code_value}")
-    
-    logger.info("✅ Using default fallback code: 9001")
-    return "9001"
+    return int(max_code_value) - 9000 if max_code_value else 0
 
 
 # ============================================================================
@@ -1,5 +1,7 @@
+from django.db import transaction
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from core.utils import TenantQuerysetMixin, IsTenantMember
@@ -11,6 +13,8 @@ from .serializers import (
     MasterLedgerGroupSerializer, MasterLedgerSerializer, MasterVoucherConfigSerializer,
     MasterHierarchyRawSerializer, VoucherSerializer, JournalEntrySerializer
 )
+from .ledger_balances import post_journal_entries, reverse_journal_entries
+from .voucher_posting import get_voucher_posting_settings, post_vouchers
 
 # ============================================================================
 # MASTER VIEWSETS
@@ -48,10 +52,11 @@ class MasterLedgerViewSet(TenantQuerysetMixin, viewsets.ModelViewSet):
             raise
     
     def create(self, request, *args, **kwargs):
-        """Create a new ledger with auto-generated code and retry logic"""
+        """Create a new ledger with auto-generated code"""
         import logging
-        from django.db import IntegrityError, transaction
-        from .utils import generate_ledger_code
+        from django.db import IntegrityError
+        from rest_framework import serializers as drf_serializers
+        from .utils import generate_ledger_code, ledger_conflict_errors
         
         logger = logging.getLogger('accounting.views')
         
@@ -64,45 +69,20 @@ class MasterLedgerViewSet(TenantQuerysetMixin, viewsets.ModelViewSet):
             # TEMPORARY: Use default tenant_id if user is not authenticated
             tenant_id = getattr(request.user, 'tenant_id', 1)
             
-            # Retry logic for code generation (handles race conditions)
-            max_retries = 3
-            ledger = None
-            
-            for attempt in range(max_retries):
+            # Codes come from atomic per-tenant counters; a rollback also undoes the
+            # counter, so a conflict is reported instead of retried
+            with transaction.atomic():
+                ledger_code = generate_ledger_code(serializer.validated_data, tenant_id)
+                logger.info(f"🔢 Generated ledger code: {ledger_code}")
                 try:
                     with transaction.atomic():
-                        # Generate code
-                        ledger_code = generate_ledger_code(
-                            serializer.validated_data, 
-                            tenant_id
-                        )
-                        logger.info(
-                            f"🔢 Generated ledger code: {ledger_code} "
-                            f"(attempt {attempt + 1}/{max_retries})"
-                        )
-                        
-                        # Save with generated code
                         ledger = serializer.save(code=ledger_code)
-                        logger.info(f"✅ Ledger saved successfully with code: {ledger_code}")
-                        break  # Success, exit retry loop
-                        
                 except IntegrityError as e:
-                    if attempt == max_retries - 1:
-                        # Last attempt failed
-                        logger.error(
-                            f"❌ Failed to generate unique code after {max_retries} attempts. "
-                            f"Error: {str(e)}"
-                        )
-                        from rest_framework import serializers as drf_serializers
-                        raise drf_serializers.ValidationError({
-                            'code': 'Failed to generate unique ledger code. Please try again.'
-                        })
-                    
-                    # Retry on next iteration
-                    logger.warning(
-                        f"⚠️ Code collision detected on attempt {attempt + 1}, retrying..."
+                    logger.error(f"❌ Ledger conflict for code {ledger_code}: {e}")
+                    raise drf_serializers.ValidationError(
+                        ledger_conflict_errors(serializer.validated_data, tenant_id)
                     )
-                    continue
+                logger.info(f"✅ Ledger saved successfully with code: {ledger_code}")
             
             # Re-serialize to include the code in response
             response_serializer = self.get_serializer(ledger)
@@ -175,14 +155,44 @@ class VoucherViewSet(TenantQuerysetMixin, viewsets.ModelViewSet):
     
     @action(detail=False, methods=['post'], url_path='bulk')
     def bulk_create(self, request):
-        """Create multiple vouchers at once"""
+        """
+        Create multiple vouchers at once (see accounting.voucher_posting).
+
+        Any invalid row rejects the whole batch with per-row errors, unless
+        ?partial=true, which posts the valid rows and reports the rest.
+        """
         vouchers_data = request.data if isinstance(request.data, list) else [request.data]
+        max_rows = get_voucher_posting_settings()['MAX_ROWS']
+        if len(vouchers_data) > max_rows:
+            return Response(
+                {'success': False, 'error': f'At most {max_rows} vouchers per request'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
         
-        serializer = self.get_serializer(data=vouchers_data, many=True)
-        serializer.is_valid(raise_exception=True)
-        serializer.save()
+        partial = request.query_params.get('partial', '').lower() in ('1', 'true', 'yes')
+        result = post_vouchers(request.user.tenant_id, vouchers_data, self.get_serializer(), partial=partial)
         
-        return Response({'success': True, 'count': len(vouchers_data)}, status=status.HTTP_201_CREATED)
+        success = bool(result['count']) or not result['errors']
+        return Response(
+            {'success': success, **result},
+            status=status.HTTP_201_CREATED if success else status.HTTP_400_BAD_REQUEST
+        )
+    
+    def perform_update(self, serializer):
+        """Move journal entry totals to the new period if the voucher date changes"""
+        old_date = serializer.instance.date
+        with transaction.atomic():
+            voucher = serializer.save()
+            if voucher.date != old_date:
+                entries = list(voucher.journal_entries.all())
+                reverse_journal_entries(entries, entry_date=old_date)
+                post_journal_entries(entries, entry_date=voucher.date)
+    
+    def perform_destroy(self, instance):
+        """Remove the voucher's journal entries from ledger balances before deleting"""
+        with transaction.atomic():
+            reverse_journal_entries(instance.journal_entries.all(), entry_date=instance.date)
+            instance.delete()
 
 
 class JournalEntryViewSet(TenantQuerysetMixin, viewsets.ModelViewSet):
@@ -190,3 +200,25 @@ class JournalEntryViewSet(TenantQuerysetMixin, viewsets.ModelViewSet):
     serializer_class = JournalEntrySerializer
     permission_classes = [IsAuthenticated, IsTenantMember]
     required_permission = 'ACCOUNTING_VOUCHERS'
+
+    def perform_create(self, serializer):
+        """Post new entries to ledger balances, like entries created with their voucher"""
+        tenant_id = self.request.user.tenant_id
+        # The serializer checks the voucher's tenant; here it is only required
+        if serializer.validated_data.get('voucher') is None:
+            raise ValidationError({'voucher': 'A voucher of this tenant is required.'})
+        with transaction.atomic():
+            entry = serializer.save(tenant_id=tenant_id)
+            post_journal_entries([entry])
+
+    def perform_update(self, serializer):
+        """Keep ledger balances in step with edited entries"""
+        with transaction.atomic():
+            reverse_journal_entries([serializer.instance])
+            entry = serializer.save()
+            post_journal_entries([entry])
+
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            reverse_journal_entries([instance])
+            instance.delete()
@@ -9,6 +9,7 @@ from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
 from django.db import connection
+from accounting.hierarchy_index import get_hierarchy_index
 import json
 import re
 
@@ -79,57 +80,24 @@ class LedgerQuestionsView(APIView):
     
     def get_hierarchy_node(self, category, group, sub_group_1, sub_group_2, sub_group_3, ledger_type):
         """
-        Get hierarchy node from master_hierarchy_raw.
-        Returns the code and full hierarchy path.
+        Get hierarchy node from master_hierarchy_raw (in-memory index, see
+        accounting.hierarchy_index). Returns the code and full hierarchy path.
         """
-        with connection.cursor() as cursor:
-            # Build dynamic WHERE clause
-            where_clauses = []
-            params = []
-            
-            if category:
-                where_clauses.append("major_group_1 = %s")
-                params.append(category)
-            if group:
-                where_clauses.append("group_1 = %s")
-                params.append(group)
-            if sub_group_1:
-                where_clauses.append("sub_group_1_1 = %s")
-                params.append(sub_group_1)
-            if sub_group_2:
-                where_clauses.append("sub_group_2_1 = %s")
-                params.append(sub_group_2)
-            if sub_group_3:
-                where_clauses.append("sub_group_3_1 = %s")
-                params.append(sub_group_3)
-            if ledger_type:
-                where_clauses.append("ledger_1 = %s")
-                params.append(ledger_type)
-            
-            if not where_clauses:
-                return None
-            
-            query = f"""
-                SELECT code, major_group_1, group_1, sub_group_1_1, 
-                       sub_group_2_1, sub_group_3_1, ledger_1
-                FROM master_hierarchy_raw
-                WHERE {' AND '.join(where_clauses)}
-                LIMIT 1
-            """
-            
-            cursor.execute(query, params)
-            row = cursor.fetchone()
-            
-            if row:
-                return {
-                    'code': row[0],
-                    'category': row[1],
-                    'group': row[2],
-                    'sub_group_1': row[3],
-                    'sub_group_2': row[4],
-                    'sub_group_3': row[5],
-                    'ledger_type': row[6]
-                }
+        path = [category, group, sub_group_1, sub_group_2, sub_group_3, ledger_type]
+        if not any(path):
+            return None
+        
+        row = get_hierarchy_index().find(path)
+        if row:
+            return {
+                'code': row[1],
+                'category': row[2],
+                'group': row[3],
+                'sub_group_1': row[4],
+                'sub_group_2': row[5],
+                'sub_group_3': row[6],
+                'ledger_type': row[7]
+            }
         
         return None
     
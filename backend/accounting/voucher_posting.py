@@ -0,0 +1,232 @@
+"""
+Voucher Posting - Bulk import of unified vouchers with batched journal entries.
+
+VoucherSerializer.create writes one voucher at a time: one INSERT for the
+voucher, one per journal entry and a ledger_balances update per ledger, so a
+50k-voucher import was 150k+ single-row INSERTs. post_vouchers instead:
+
+1. validates every row up front with the serializer (per-row errors, nothing
+   written yet), including duplicate voucher numbers within the batch and
+   against the tenant's existing vouchers (one query per chunk)
+2. allocates all missing voucher numbers in one step
+   ({PREFIX}-AUTO-{batch id}-{n}, unique without a round trip per row)
+3. inside one transaction, bulk_creates the vouchers and then their journal
+   entries in chunks, and posts all entries to ledger_balances at once
+   (post_journal_entries aggregates them per ledger and period)
+
+build_journal_entries holds the double-entry rules and is shared with
+VoucherSerializer, so single and bulk posting produce the same entries.
+
+Configuration (settings.VOUCHER_POSTING):
+    CHUNK_SIZE: rows per INSERT statement (default 1000)
+    MAX_ROWS:   largest batch accepted in one request (default 50000)
+"""
+
+import logging
+import time
+import uuid
+
+from django.conf import settings
+from django.db import transaction
+from rest_framework import serializers
+
+from accounting.ledger_balances import post_journal_entries
+from accounting.models import JournalEntry, Voucher
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_SIZE = 1000
+DEFAULT_MAX_ROWS = 50000
+
+VOUCHER_NUMBER_PREFIXES = {
+    'sales': 'SALES',
+    'purchase': 'PURCH',
+    'payment': 'PAY',
+    'receipt': 'REC',
+    'contra': 'CONTRA',
+    'journal': 'JV',
+}
+
+
+def get_voucher_posting_settings():
+    config = getattr(settings, 'VOUCHER_POSTING', {})
+    return {
+        'CHUNK_SIZE': config.get('CHUNK_SIZE', DEFAULT_CHUNK_SIZE),
+        'MAX_ROWS': config.get('MAX_ROWS', DEFAULT_MAX_ROWS),
+    }
+
+
+def auto_voucher_number(voucher_type, suffix):
+    return f"{VOUCHER_NUMBER_PREFIXES.get(voucher_type, 'VCH')}-AUTO-{suffix}"
+
+
+def build_journal_entries(voucher, entries_data=()):
+    """
+    Unsaved journal entries for a voucher.
+
+    sales: Party Dr / Sales Cr, purchase: Purchase Dr / Party Cr,
+    payment: Party Dr / Account Cr, receipt: Account Dr / Party Cr,
+    contra: To Account Dr / From Account Cr (all for total or amount);
+    journal vouchers carry their own entries.
+    """
+    voucher_type = voucher.type
+    party = voucher.party or 'Unknown'
+    account = voucher.account or 'Cash'
+
+    if voucher_type == 'sales':
+        total = voucher.total or 0
+        lines = [(party, total, 0), ('Sales', 0, total)]
+    elif voucher_type == 'purchase':
+        total = voucher.total or 0
+        lines = [('Purchase', total, 0), (party, 0, total)]
+    elif voucher_type == 'payment':
+        amount = voucher.amount or 0
+        lines = [(party, amount, 0), (account, 0, amount)]
+    elif voucher_type == 'receipt':
+        amount = voucher.amount or 0
+        lines = [(account, amount, 0), (party, 0, amount)]
+    elif voucher_type == 'contra':
+        amount = voucher.amount or 0
+        lines = [(voucher.to_account or 'Bank', amount, 0), (voucher.from_account or 'Cash', 0, amount)]
+    elif voucher_type == 'journal':
+        lines = [(entry.get('ledger'), entry.get('debit', 0), entry.get('credit', 0)) for entry in entries_data]
+    else:
+        lines = []
+
+    return [
+        JournalEntry(voucher=voucher, ledger=ledger, debit=debit, credit=credit, tenant_id=voucher.tenant_id)
+        for ledger, debit, credit in lines
+    ]
+
+
+def _chunks(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def _validate_rows(rows, serializer):
+    """Run the serializer over each row; returns ([(index, validated_data)], [row error])"""
+    valid, errors = [], []
+    for index, row in enumerate(rows):
+        try:
+            valid.append((index, serializer.run_validation(row)))
+        except serializers.ValidationError as exc:
+            errors.append({'index': index, 'errors': exc.detail})
+    return valid, errors
+
+
+def _check_voucher_numbers(tenant_id, valid, chunk_size):
+    """Drop rows whose voucher number repeats in the batch or already exists; returns row errors"""
+    errors = []
+    seen = {}
+    for index, data in valid:
+        number = data.get('voucher_number') or data.get('invoice_no')
+        if not number:
+            continue
+        key = (data.get('type'), number)
+        if key in seen:
+            errors.append({'index': index, 'errors': {
+                'voucher_number': [f"Duplicate of row {seen[key]} in this batch"]
+            }})
+        else:
+            seen[key] = index
+
+    existing = set()
+    for numbers in _chunks(sorted({number for _, number in seen}), chunk_size):
+        existing.update(
+            Voucher.objects.filter(tenant_id=tenant_id, voucher_number__in=numbers)
+            .values_list('type', 'voucher_number')
+        )
+    for key in sorted(existing & seen.keys(), key=seen.get):
+        errors.append({'index': seen[key], 'errors': {
+            'voucher_number': [f"Voucher {key[1]} already exists"]
+        }})
+
+    rejected = {error['index'] for error in errors}
+    valid[:] = [(index, data) for index, data in valid if index not in rejected]
+    return errors
+
+
+def _build_voucher(tenant_id, data, batch_id, sequence):
+    data = dict(data)
+    items_data = data.pop('items', [])
+    entries_data = data.pop('entries', [])
+    if data.get('type') in ('sales', 'purchase'):
+        data['items_data'] = items_data
+    if not data.get('voucher_number'):
+        data['voucher_number'] = data.get('invoice_no') or auto_voucher_number(
+            data.get('type'), f"{batch_id}-{sequence}"
+        )
+    data['tenant_id'] = tenant_id
+    return Voucher(**data), entries_data
+
+
+def _save_vouchers(tenant_id, vouchers):
+    """bulk_create one chunk; backends that don't return ids (MySQL) get them from one SELECT"""
+    Voucher.objects.bulk_create(vouchers)
+    missing = [voucher for voucher in vouchers if voucher.pk is None]
+    if missing:
+        ids = dict(
+            ((voucher_type, number), pk) for voucher_type, number, pk in Voucher.objects.filter(
+                tenant_id=tenant_id, voucher_number__in=[voucher.voucher_number for voucher in missing]
+            ).values_list('type', 'voucher_number', 'id')
+        )
+        for voucher in missing:
+            voucher.pk = ids[(voucher.type, voucher.voucher_number)]
+
+
+def post_vouchers(tenant_id, rows, serializer, partial=False, chunk_size=None):
+    """
+    Validate and post a batch of voucher rows.
+
+    Args:
+        tenant_id: Tenant that owns the vouchers
+        rows: Voucher payloads, as accepted by VoucherSerializer
+        serializer: Unbound VoucherSerializer (with request context) used to validate each row
+        partial: Post the valid rows even if others failed; by default any
+            error rejects the whole batch
+        chunk_size: Rows per INSERT (default settings.VOUCHER_POSTING['CHUNK_SIZE'])
+
+    Returns:
+        {'count', 'journal_entries', 'errors': [{'index', 'errors'}], 'elapsed_seconds', 'vouchers_per_second'}
+    """
+    chunk_size = chunk_size or get_voucher_posting_settings()['CHUNK_SIZE']
+    started = time.monotonic()
+
+    valid, errors = _validate_rows(rows, serializer)
+    errors.extend(_check_voucher_numbers(tenant_id, valid, chunk_size))
+    errors.sort(key=lambda error: error['index'])
+
+    count = journal_entries = 0
+    if valid and (partial or not errors):
+        batch_id = uuid.uuid4().hex[:8]
+        vouchers = [
+            _build_voucher(tenant_id, data, batch_id, sequence)
+            for sequence, (_, data) in enumerate(valid, start=1)
+        ]
+        with transaction.atomic():
+            entries = []
+            for chunk in _chunks(vouchers, chunk_size):
+                _save_vouchers(tenant_id, [voucher for voucher, _ in chunk])
+                chunk_entries = [
+                    entry for voucher, entries_data in chunk
+                    for entry in build_journal_entries(voucher, entries_data)
+                ]
+                JournalEntry.objects.bulk_create(chunk_entries, batch_size=chunk_size)
+                entries.extend(chunk_entries)
+            post_journal_entries(entries)
+        count, journal_entries = len(vouchers), len(entries)
+
+    elapsed = time.monotonic() - started
+    result = {
+        'count': count,
+        'journal_entries': journal_entries,
+        'errors': errors,
+        'elapsed_seconds': round(elapsed, 3),
+        'vouchers_per_second': round(count / elapsed, 1) if elapsed and count else 0,
+    }
+    logger.info(
+        f"Posted {count} vouchers ({journal_entries} journal entries) for tenant {tenant_id} "
+        f"in {elapsed:.2f}s, {len(errors)} rejected rows"
+    )
+    return result
@@ -71,6 +71,7 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'backend.wsgi.application'
+ASGI_APPLICATION = 'backend.asgi.application'
 
 DATABASES = {
     'default': {
@@ -81,8 +82,10 @@ DATABASES = {
         # For 50K users: Use ProxySQL endpoint instead of direct MySQL for better multiplexing
         'HOST': os.getenv('DB_HOST', 'localhost'),
         'PORT': os.getenv('DB_PORT', '3306'),
-        # PRODUCTION: Persistent connections to reduce handshake overhead
-        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', '1200')),  # 20 minutes
+        # Served through ASGI (gunicorn_config.py): sync views run in a new thread per
+        # request, so persistent connections would never be reused and pile up until
+        # MySQL's connection limit. Close them per request; ProxySQL pools upstream.
+        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', '0')),
         'CONN_HEALTH_CHECKS': True,  # Test connections before use to prevent crashes
         'OPTIONS': {
             'init_command': "SET sql_mode='STRICT_TRANS_TABLES', INTERACTIVE_TIMEOUT=1200, WAIT_TIMEOUT=1200",
@@ -223,6 +226,105 @@ CACHES = {
     }
 }
 
+# Authenticated user identity cache (see core/user_cache.py)
+# Set USER_IDENTITY_CACHE_BACKEND to a CACHES alias to share it across workers
+USER_IDENTITY_CACHE = {
+    'TTL': int(os.getenv('USER_IDENTITY_CACHE_TTL', '60')),
+    'MAX_ENTRIES': int(os.getenv('USER_IDENTITY_CACHE_MAX_ENTRIES', '10000')),
+    'BACKEND': os.getenv('USER_IDENTITY_CACHE_BACKEND') or None,
+}
+
+# AI execution engine (see core/ai_engine.py)
+# Requests beyond MAX_CONCURRENCY wait in a FIFO queue of MAX_WAITING entries;
+# REQUEST_TIMEOUT bounds queueing, upstream calls and retry backoff together
+AI_ENGINE = {
+    'MAX_CONCURRENCY': int(os.getenv('AI_ENGINE_MAX_CONCURRENCY', '5')),
+    'MAX_WAITING': int(os.getenv('AI_ENGINE_MAX_WAITING', '50')),
+    'REQUEST_TIMEOUT': float(os.getenv('AI_ENGINE_REQUEST_TIMEOUT', '60')),
+    'MODEL_UNAVAILABLE_TTL': int(os.getenv('AI_ENGINE_MODEL_UNAVAILABLE_TTL', '3600')),
+    'KEY_RECHECK_INTERVAL': int(os.getenv('AI_ENGINE_KEY_RECHECK_INTERVAL', '90')),
+    'KEY_RECHECK_MAX_INTERVAL': int(os.getenv('AI_ENGINE_KEY_RECHECK_MAX_INTERVAL', '900')),
+}
+
+# Cross-process AI result cache (see core/ai_cache.py)
+# One SQLite file shared by all workers; invoice results are keyed by file MD5
+AI_CACHE = {
+    'PATH': os.getenv('AI_CACHE_PATH') or str(BASE_DIR / 'ai_cache.sqlite3'),
+    'TTL': int(os.getenv('AI_CACHE_TTL', '300')),
+    'INVOICE_TTL': int(os.getenv('AI_CACHE_INVOICE_TTL', str(30 * 24 * 60 * 60))),
+    'MAX_ENTRIES': int(os.getenv('AI_CACHE_MAX_ENTRIES', '10000')),
+    'MAX_BYTES': int(os.getenv('AI_CACHE_MAX_BYTES', str(256 * 1024 * 1024))),
+}
+
+# Server-built AI agent context (see core/ai_context.py)
+# Replaces the client's contextData dump with a cached, token-budgeted summary
+AI_CONTEXT = {
+    'ENABLED': os.getenv('AI_CONTEXT_ENABLED', 'True') == 'True',
+    'TOKEN_BUDGET': int(os.getenv('AI_CONTEXT_TOKEN_BUDGET', '4000')),
+    'MONTHS': int(os.getenv('AI_CONTEXT_MONTHS', '12')),
+    'TOP_N': int(os.getenv('AI_CONTEXT_TOP_N', '10')),
+    'TTL': int(os.getenv('AI_CONTEXT_TTL', '600')),
+}
+
+# AI rate limits and circuit breaker shared by all workers (see core/ai_limits.py)
+AI_LIMITS = {
+    'PATH': os.getenv('AI_LIMITS_PATH') or str(BASE_DIR / 'ai_limits.sqlite3'),
+    'USER_PER_MINUTE': int(os.getenv('AI_LIMITS_USER_PER_MINUTE', '50')),
+    'TENANT_PER_MINUTE': int(os.getenv('AI_LIMITS_TENANT_PER_MINUTE', '200')),
+    'GLOBAL_PER_MINUTE': int(os.getenv('AI_LIMITS_GLOBAL_PER_MINUTE', '1000')),
+    'FAILURE_THRESHOLD': int(os.getenv('AI_LIMITS_FAILURE_THRESHOLD', '5')),
+    'RESET_TIMEOUT': int(os.getenv('AI_LIMITS_RESET_TIMEOUT', '300')),
+}
+
+# Batch invoice extraction (see core/invoice_batches.py)
+# Uploads are spooled and job state kept on local disk under ROOT
+INVOICE_BATCHES = {
+    'ROOT': os.getenv('INVOICE_BATCHES_ROOT') or str(BASE_DIR / 'invoice_batches'),
+    'WORKERS': int(os.getenv('INVOICE_BATCHES_WORKERS', '2')),
+    'PARALLELISM': int(os.getenv('INVOICE_BATCHES_PARALLELISM', '4')),
+    'MAX_FILES': int(os.getenv('INVOICE_BATCHES_MAX_FILES', '50')),
+    'MAX_FILE_BYTES': int(os.getenv('INVOICE_BATCHES_MAX_FILE_BYTES', str(10 * 1024 * 1024))),
+    'JOB_TTL': int(os.getenv('INVOICE_BATCHES_JOB_TTL', '86400')),
+    'STALE_AFTER': int(os.getenv('INVOICE_BATCHES_STALE_AFTER', '900')),
+}
+
+# Aggregate agent questions answered from SQL without the LLM (see core/ai_intents.py)
+AI_INTENTS = {
+    'ENABLED': os.getenv('AI_INTENTS_ENABLED', 'True') == 'True',
+}
+
+# Background report jobs (see reports/jobs.py)
+# Artifacts and job state live on local disk under ROOT; no broker is needed
+REPORT_JOBS = {
+    'ROOT': os.getenv('REPORT_JOBS_ROOT') or str(BASE_DIR / 'report_jobs'),
+    'WORKERS': int(os.getenv('REPORT_JOBS_WORKERS', '2')),
+    'ARTIFACT_TTL': int(os.getenv('REPORT_JOBS_ARTIFACT_TTL', '86400')),
+    'STALE_AFTER': int(os.getenv('REPORT_JOBS_STALE_AFTER', '900')),
+}
+
+# Bulk voucher import (see accounting/voucher_posting.py)
+VOUCHER_POSTING = {
+    'CHUNK_SIZE': int(os.getenv('VOUCHER_POSTING_CHUNK_SIZE', '1000')),
+    'MAX_ROWS': int(os.getenv('VOUCHER_POSTING_MAX_ROWS', '50000')),
+}
+
+# Document number counters (see core/sequences.py)
+# Blocks above 1 cut round trips on hot series but leave gaps when a process exits
+SEQUENCES = {
+    'BLOCK_SIZES': {
+        'voucher_configurations': int(os.getenv('SEQUENCES_VOUCHER_BLOCK_SIZE', '1')),
+        'customer_masters_salesquotation': int(os.getenv('SEQUENCES_QUOTATION_BLOCK_SIZE', '1')),
+        'vendor_master_posettings': int(os.getenv('SEQUENCES_PO_BLOCK_SIZE', '1')),
+        'tenant_sequences': int(os.getenv('SEQUENCES_TENANT_BLOCK_SIZE', '1')),
+    },
+}
+
+# In-memory master_hierarchy_raw index (see accounting/hierarchy_index.py)
+# Run "manage.py master_hierarchy invalidate" after reloading the table
+HIERARCHY_INDEX = {
+    'CHECK_INTERVAL': int(os.getenv('HIERARCHY_INDEX_CHECK_INTERVAL', '60')),
+}
+
 # Twilio SMS Configuration (Optional - falls back to mock SMS if not configured)
 TWILIO_ACCOUNT_SID = os.getenv('TWILIO_ACCOUNT_SID', None)
 TWILIO_AUTH_TOKEN = os.getenv('TWILIO_AUTH_TOKEN', None)
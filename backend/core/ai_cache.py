@@ -0,0 +1,140 @@
+"""
+AI Result Cache - AI responses shared by all worker processes on a host
+SQLite-backed, so no Redis is needed.
+
+The default django cache is LocMemCache, which gives every gunicorn worker
+its own cold copy. This store is one SQLite file (WAL mode) that all
+workers read and write:
+
+    ai_results(key, value, size, expires_at, accessed_at)
+
+Entries expire after their TTL and are evicted least-recently-used first
+once the store exceeds MAX_ENTRIES or MAX_BYTES. Invoice extractions are
+keyed by the MD5 of the uploaded file (see ai_proxy.generate_cache_key) and
+kept for INVOICE_TTL (only replies that parse as invoices), so re-uploading
+a known invoice is answered locally.
+
+Configuration (settings.AI_CACHE):
+    PATH:        SQLite file (default BASE_DIR/ai_cache.sqlite3)
+    TTL:         seconds for agent replies (default 300)
+    INVOICE_TTL: seconds for invoice extractions (default 30 days)
+    MAX_ENTRIES: entry cap (default 10000)
+    MAX_BYTES:   total value size cap (default 256 MB)
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+
+from django.conf import settings
+
+from .shared_sqlite import SharedState
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TTL = 300
+DEFAULT_INVOICE_TTL = 30 * 24 * 60 * 60
+DEFAULT_MAX_ENTRIES = 10000
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+# Reads refresh accessed_at at most this often, so hot keys don't turn every
+# hit into a write
+TOUCH_INTERVAL = 60
+
+
+class AIResultCache(SharedState):
+    """JSON values in a SQLite file with TTL expiry and LRU size caps"""
+
+    schema = (
+        "CREATE TABLE IF NOT EXISTS ai_results ("
+        "key TEXT PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL, "
+        "expires_at REAL NOT NULL, accessed_at REAL NOT NULL)",
+        "CREATE INDEX IF NOT EXISTS ai_results_accessed ON ai_results (accessed_at)",
+    )
+
+    def __init__(self, path, max_entries=DEFAULT_MAX_ENTRIES, max_bytes=DEFAULT_MAX_BYTES):
+        super().__init__(path)
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+
+    def get(self, key):
+        """Return the cached value for key, or None if missing or expired"""
+        now = time.time()
+        conn = self._connect()
+        row = conn.execute(
+            "SELECT value, expires_at, accessed_at FROM ai_results WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        value, expires_at, accessed_at = row
+        if expires_at <= now:
+            conn.execute("DELETE FROM ai_results WHERE key = ? AND expires_at <= ?", (key, now))
+            return None
+        if now - accessed_at > TOUCH_INTERVAL:
+            conn.execute("UPDATE ai_results SET accessed_at = ? WHERE key = ?", (now, key))
+        return json.loads(value)
+
+    def set(self, key, value, ttl=DEFAULT_TTL):
+        """Store a JSON-serializable value, evicting old entries past the caps"""
+        now = time.time()
+        data = json.dumps(value).encode()
+        conn = self._connect()
+        conn.execute(
+            "INSERT OR REPLACE INTO ai_results (key, value, size, expires_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+            (key, data, len(data), now + ttl, now)
+        )
+        self._evict(conn, now)
+
+    def delete(self, key):
+        self._connect().execute("DELETE FROM ai_results WHERE key = ?", (key,))
+
+    def _evict(self, conn, now):
+        conn.execute("DELETE FROM ai_results WHERE expires_at <= ?", (now,))
+        entries, total_bytes = self.usage(conn)
+        if entries <= self.max_entries and total_bytes <= self.max_bytes:
+            return
+
+        # Drop least recently used entries until both caps hold
+        removed = 0
+        for key, size in conn.execute("SELECT key, size FROM ai_results ORDER BY accessed_at").fetchall():
+            if entries <= self.max_entries and total_bytes <= self.max_bytes:
+                break
+            conn.execute("DELETE FROM ai_results WHERE key = ?", (key,))
+            entries -= 1
+            total_bytes -= size
+            removed += 1
+        logger.info(f"AI cache evicted {removed} entries")
+
+    def usage(self, conn=None):
+        """(entries, total value bytes)"""
+        conn = conn or self._connect()
+        return conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM ai_results").fetchone()
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_ai_cache_settings():
+    config = getattr(settings, 'AI_CACHE', {})
+    return {
+        'PATH': config.get('PATH') or os.path.join(settings.BASE_DIR, 'ai_cache.sqlite3'),
+        'TTL': config.get('TTL', DEFAULT_TTL),
+        'INVOICE_TTL': config.get('INVOICE_TTL', DEFAULT_INVOICE_TTL),
+        'MAX_ENTRIES': config.get('MAX_ENTRIES', DEFAULT_MAX_ENTRIES),
+        'MAX_BYTES': config.get('MAX_BYTES', DEFAULT_MAX_BYTES),
+    }
+
+
+def get_ai_result_cache():
+    """Process-wide cache built from settings.AI_CACHE on first use"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            config = get_ai_cache_settings()
+            _cache = AIResultCache(
+                config['PATH'], max_entries=config['MAX_ENTRIES'], max_bytes=config['MAX_BYTES']
+            )
+        return _cache
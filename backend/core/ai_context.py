@@ -0,0 +1,310 @@
+"""
+AI Agent Context - Server-side context for agent prompts
+Replaces the client's raw data dump with a summary that fits a token budget.
+
+The browser used to send every voucher, ledger, stock item, vendor and
+customer as contextData. For large tenants that made prompts huge, slow and
+expensive. The context is now built from the database instead:
+
+    company        name, state, GSTIN, financial year start
+    totals         voucher count / amount per type, all time
+    monthly        count / amount per type and month, last MONTHS months
+    topParties     TOP_N parties by amount for sales, purchases, payments, receipts
+    ledgers, vendors, customers, stockItems   first TOP_N * 5 names (+ counts)
+    tables         table names, for schema questions
+
+Sections are listed most important first. If the JSON exceeds TOKEN_BUDGET
+(estimated at 4 characters per token), lists are halved starting from the
+least important until it fits.
+
+Built contexts are kept per tenant in the shared AI result cache (see
+core/ai_cache.py) for TTL seconds. Saving or deleting a voucher or master
+record drops the tenant's entry in every worker (see invalidate_agent_context).
+
+Configuration (settings.AI_CONTEXT):
+    ENABLED:      build context on the server (default True); when False the
+                  client's contextData is used as before
+    TOKEN_BUDGET: approximate tokens for the context (default 4000)
+    MONTHS:       months of monthly totals (default 12)
+    TOP_N:        parties per voucher type (default 10)
+    TTL:          seconds a built context is reused (default 600)
+"""
+
+import json
+import logging
+from datetime import date
+
+from django.apps import apps
+from django.conf import settings
+
+from core.ai_cache import get_ai_result_cache
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TOKEN_BUDGET = 4000
+DEFAULT_MONTHS = 12
+DEFAULT_TOP_N = 10
+DEFAULT_TTL = 600
+
+CHARS_PER_TOKEN = 4
+
+# Master lists carry this many times TOP_N entries before trimming
+MASTER_LIST_FACTOR = 5
+
+TOP_PARTY_TYPES = ('Sales', 'Purchase', 'Payment', 'Receipt')
+
+# Lists trimmed first when over budget, least important first
+TRIM_ORDER = (
+    ('tables',),
+    ('stockItems',),
+    ('customers',),
+    ('vendors',),
+    ('ledgers',),
+    ('topParties', 'Receipt'),
+    ('topParties', 'Payment'),
+    ('topParties', 'Purchase'),
+    ('topParties', 'Sales'),
+    ('monthly',),
+)
+
+
+def get_ai_context_settings():
+    config = getattr(settings, 'AI_CONTEXT', {})
+    return {
+        'ENABLED': config.get('ENABLED', True),
+        'TOKEN_BUDGET': config.get('TOKEN_BUDGET', DEFAULT_TOKEN_BUDGET),
+        'MONTHS': config.get('MONTHS', DEFAULT_MONTHS),
+        'TOP_N': config.get('TOP_N', DEFAULT_TOP_N),
+        'TTL': config.get('TTL', DEFAULT_TTL),
+    }
+
+
+def estimate_tokens(text):
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def _cache_key(tenant_id):
+    return f"agent_context:{tenant_id}"
+
+
+def _money(value):
+    return float(value or 0)
+
+
+def _months_back(today, months):
+    year, month = today.year, today.month - (months - 1)
+    while month < 1:
+        month += 12
+        year -= 1
+    return date(year, month, 1)
+
+
+# ============================================================================
+# SECTIONS
+# ============================================================================
+
+def _company(tenant_id):
+    from core.models import CompanyFullInfo
+
+    company = CompanyFullInfo.objects.filter(tenant_id=tenant_id).values(
+        'company_name', 'state', 'gstin', 'financial_year_start'
+    ).first()
+    if not company:
+        return None
+    fy_start = company['financial_year_start']
+    return {
+        'name': company['company_name'],
+        'state': company['state'],
+        'gstin': company['gstin'],
+        'financialYearStart': fy_start.isoformat() if fy_start else None,
+    }
+
+
+def _voucher_sections(tenant_id, today, months, top_n):
+    from reports.database import get_top_parties, get_voucher_totals
+
+    totals = {
+        row['type']: {'count': row['count'], 'total': _money(row['total'])}
+        for row in get_voucher_totals(tenant_id)
+        if row['count']
+    }
+    monthly = [
+        {'month': row['month'].strftime('%Y-%m'), 'type': row['type'], 'count': row['count'], 'total': _money(row['total'])}
+        for row in get_voucher_totals(tenant_id, start_date=_months_back(today, months), by_month=True)
+        if row['month'] is not None
+    ]
+    # Newest first, so trimming drops the oldest months
+    monthly.sort(key=lambda row: row['month'], reverse=True)
+    top_parties = {
+        voucher_type: [
+            {'party': row['party'], 'count': row['count'], 'total': _money(row['total'])}
+            for row in get_top_parties(tenant_id, voucher_type, limit=top_n)
+        ]
+        for voucher_type in TOP_PARTY_TYPES
+    }
+    return totals, monthly, top_parties
+
+
+def _master_list(queryset, fields, names, limit):
+    """(first `limit` rows renamed by `names`, total count)"""
+    rows = [
+        {name: row[field] for field, name in zip(fields, names)}
+        for row in queryset.values(*fields)[:limit]
+    ]
+    return rows, queryset.count()
+
+
+def _master_sections(tenant_id, limit):
+    from accounting.models import MasterLedger
+    from customerportal.database import CustomerMasterCustomerBasicDetails
+    from inventory.models import InventoryItem
+    from vendors.models import VendorMasterBasicDetail
+
+    sections = {}
+    counts = {}
+    specs = {
+        'ledgers': (
+            MasterLedger.objects.filter(tenant_id=tenant_id).order_by('name'),
+            ('name', 'group'), ('name', 'group'),
+        ),
+        'vendors': (
+            VendorMasterBasicDetail.objects.filter(tenant_id=tenant_id, is_active=True).order_by('vendor_name'),
+            ('vendor_name', 'email', 'contact_no'), ('name', 'email', 'phone'),
+        ),
+        'customers': (
+            CustomerMasterCustomerBasicDetails.objects.filter(
+                tenant_id=tenant_id, is_deleted=False
+            ).order_by('customer_name'),
+            ('customer_name', 'email_address', 'contact_number'), ('name', 'email', 'phone'),
+        ),
+        'stockItems': (
+            InventoryItem.objects.filter(tenant_id=tenant_id, is_active=True).order_by('item_name'),
+            ('item_code', 'item_name', 'uom', 'rate'), ('code', 'name', 'uom', 'rate'),
+        ),
+    }
+    for section, (queryset, fields, names) in specs.items():
+        sections[section], counts[section] = _master_list(queryset, fields, names, limit)
+    for item in sections['stockItems']:
+        item['rate'] = _money(item['rate'])
+    return sections, counts
+
+
+def _tables():
+    """Tenant-scoped tables, for "what tables are there?" questions"""
+    return sorted(
+        model._meta.db_table for model in apps.get_models()
+        if any(field.name == 'tenant_id' for field in model._meta.fields)
+    )
+
+
+# ============================================================================
+# BUILD / TRIM
+# ============================================================================
+
+def build_context_data(tenant_id, today=None, months=DEFAULT_MONTHS, top_n=DEFAULT_TOP_N):
+    """Untrimmed context dict for a tenant (without currentDate)."""
+    today = today or date.today()
+    totals, monthly, top_parties = _voucher_sections(tenant_id, today, months, top_n)
+    masters, counts = _master_sections(tenant_id, top_n * MASTER_LIST_FACTOR)
+    return {
+        'company': _company(tenant_id),
+        'totals': totals,
+        'monthly': monthly,
+        'topParties': top_parties,
+        **masters,
+        'counts': counts,
+        'tables': _tables(),
+    }
+
+
+def _get_path(data, path):
+    for key in path:
+        data = data.get(key) if isinstance(data, dict) else None
+    return data
+
+
+def _set_path(data, path, value):
+    for key in path[:-1]:
+        data = data[key]
+    data[path[-1]] = value
+
+
+def trim_to_budget(data, token_budget):
+    """
+    Halve lists in TRIM_ORDER until the JSON fits token_budget.
+
+    Returns:
+        (json text, truncated: bool)
+    """
+    text = json.dumps(data, separators=(',', ':'), default=str)
+    truncated = False
+    for path in TRIM_ORDER:
+        while estimate_tokens(text) > token_budget:
+            items = _get_path(data, path)
+            if not items:
+                break
+            _set_path(data, path, items[:len(items) // 2])
+            truncated = True
+            text = json.dumps(data, separators=(',', ':'), default=str)
+        if estimate_tokens(text) <= token_budget:
+            break
+    return text, truncated
+
+
+def get_agent_context(tenant_id, today=None):
+    """
+    Context JSON for the agent prompt: cached per tenant, trimmed to the
+    token budget, with today's date.
+    """
+    config = get_ai_context_settings()
+    today = today or date.today()
+    cache = get_ai_result_cache()
+
+    data = None
+    try:
+        data = cache.get(_cache_key(tenant_id))
+    except Exception as e:
+        logger.warning(f"Agent context cache unavailable: {e}")
+
+    if data is None:
+        data = build_context_data(tenant_id, today, config['MONTHS'], config['TOP_N'])
+        try:
+            cache.set(_cache_key(tenant_id), data, config['TTL'])
+        except Exception as e:
+            logger.warning(f"Agent context cache unavailable: {e}")
+
+    data = dict(data, currentDate=today.isoformat())
+    text, truncated = trim_to_budget(data, config['TOKEN_BUDGET'])
+    if truncated:
+        logger.info(f"Agent context for tenant {tenant_id} trimmed to ~{estimate_tokens(text)} tokens")
+    return text
+
+
+# ============================================================================
+# INVALIDATION (signal receiver, connected in CoreConfig.ready)
+# ============================================================================
+
+def get_context_source_models():
+    """Models whose writes change what the agent context shows"""
+    from accounting.models import MasterLedger
+    from core.models import CompanyFullInfo
+    from customerportal.database import CustomerMasterCustomerBasicDetails
+    from inventory.models import InventoryItem
+    from reports.database import SPLIT_VOUCHER_SOURCE_MODELS
+    from vendors.models import VendorMasterBasicDetail
+
+    return SPLIT_VOUCHER_SOURCE_MODELS + [
+        MasterLedger, VendorMasterBasicDetail, CustomerMasterCustomerBasicDetails,
+        InventoryItem, CompanyFullInfo,
+    ]
+
+
+def invalidate_agent_context(sender, instance, **kwargs):
+    """post_save / post_delete: drop the tenant's cached context in all workers."""
+    tenant_id = getattr(instance, 'tenant_id', None)
+    if not tenant_id:
+        return
+    try:
+        get_ai_result_cache().delete(_cache_key(tenant_id))
+    except Exception as e:
+        logger.warning(f"Could not invalidate agent context for tenant {tenant_id}: {e}")
@@ -0,0 +1,550 @@
+"""
+AI Execution Engine - Asyncio execution of Gemini requests
+Runs upstream calls, model fallback and retry backoff on one event loop.
+
+The engine owns a background thread running an asyncio loop. Callers hand it
+a prompt and get the reply text back, either by blocking (run, for WSGI
+views) or by awaiting (arun, for async views). Backoff between retries is an
+asyncio.sleep on that loop, so a request waiting out a 429 costs a pending
+coroutine instead of a parked web worker thread.
+
+At most MAX_CONCURRENCY requests talk to Gemini at once. Further requests
+wait in a FIFO queue of at most MAX_WAITING entries; a full queue rejects
+immediately (QueueFullError). Every request carries a deadline covering
+queueing, upstream calls and backoff; when it passes the request fails with
+DeadlineExceeded instead of sleeping past it.
+
+astream yields the reply in chunks as Gemini generates it (for SSE views).
+A streamed request retries and falls back to another model only until its
+first chunk is out; after that an upstream error ends the stream.
+
+The Gemini SDK is only touched through the client object (GeminiClient), so
+tests drive the engine with a fake client. GeminiClient keeps one service
+client per API key instead of calling genai.configure (process-global) for
+every attempt.
+
+A ModelRegistry remembers, per API key, which candidate model last answered
+and which returned NotFound / "not supported". The fallback chain starts at
+the model that worked and skips dead models until their negative entry
+expires, so a request normally costs one upstream call.
+
+Keys benched after quota errors are re-probed by one KeyHealthScheduler
+thread per process. It keeps a heap of due probes, at most one per key, and
+backs off exponentially with jitter while a key stays unhealthy. A 429 storm
+therefore adds no threads and makes no process-global SDK calls.
+
+Configuration (settings.AI_ENGINE):
+    MAX_CONCURRENCY: upstream requests in flight per process (default 5)
+    MAX_WAITING:     requests allowed to wait for a slot (default 50)
+    REQUEST_TIMEOUT: seconds per request, queueing included (default 60)
+    MODEL_UNAVAILABLE_TTL: seconds a NotFound / unsupported model is skipped
+                     for a key (default 3600)
+    KEY_RECHECK_INTERVAL:     seconds before an unhealthy key is first
+                     probed (default 90)
+    KEY_RECHECK_MAX_INTERVAL: cap on the probe backoff (default 900)
+"""
+
+import asyncio
+import concurrent.futures
+import heapq
+import logging
+import random
+import threading
+import time
+from collections import deque
+
+import google.generativeai as genai
+from django.conf import settings
+from google.ai import generativelanguage as glm
+from google.api_core import exceptions
+from google.api_core.client_options import ClientOptions
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_CONCURRENCY = 5
+DEFAULT_MAX_WAITING = 50
+DEFAULT_REQUEST_TIMEOUT = 60
+DEFAULT_MODEL_UNAVAILABLE_TTL = 60 * 60
+DEFAULT_KEY_RECHECK_INTERVAL = 90
+DEFAULT_KEY_RECHECK_MAX_INTERVAL = 15 * 60
+
+# Probe delays vary by +/- this fraction so processes don't probe in lockstep
+PROBE_JITTER = 0.2
+HEALTH_PROBE_MODEL = 'gemini-flash-latest'
+
+MAX_ATTEMPTS = 5
+BASE_DELAY = 5
+MAX_RETRY_AFTER = 60
+
+# Models to try in order of preference: flash first (fast/cheap), then pro
+CANDIDATE_MODELS = (
+    'gemini-2.0-flash-exp',
+    'gemini-2.0-flash-lite',
+    'gemini-2.0-flash',
+    'gemini-1.5-flash',
+    'gemini-1.5-flash-latest',
+    'gemini-1.5-pro',
+    'gemini-1.5-pro-latest',
+    'gemini-pro-latest',
+)
+
+
+class QueueFullError(Exception):
+    """No execution slot free and the wait queue is at capacity"""
+
+
+class DeadlineExceeded(Exception):
+    """The request ran out of time while queued, calling upstream or backing off"""
+
+
+class GeminiClient:
+    """
+    Async Gemini calls through google.generativeai with one service client
+    per API key.
+
+    Async gRPC clients are bound to the loop they were created on; the engine
+    only calls generate() from its own loop.
+    """
+
+    def __init__(self):
+        self._service_clients = {}  # api_key -> GenerativeServiceAsyncClient
+        self._models = {}  # (api_key, model_name) -> GenerativeModel
+        self._probe_models = {}  # api_key -> GenerativeModel on a sync client
+        self._probe_lock = threading.Lock()
+
+    def _model(self, api_key: str, model_name: str):
+        model = self._models.get((api_key, model_name))
+        if model is None:
+            service_client = self._service_clients.get(api_key)
+            if service_client is None:
+                service_client = glm.GenerativeServiceAsyncClient(client_options=ClientOptions(api_key=api_key))
+                self._service_clients[api_key] = service_client
+            model = genai.GenerativeModel(model_name)
+            model._async_client = service_client
+            self._models[(api_key, model_name)] = model
+        return model
+
+    async def generate(self, api_key: str, model_name: str, prompt) -> str:
+        response = await self._model(api_key, model_name).generate_content_async(prompt)
+        return response.text.strip()
+
+    async def generate_stream(self, api_key: str, model_name: str, prompt):
+        """Async iterator over reply text chunks"""
+        response = await self._model(api_key, model_name).generate_content_async(prompt, stream=True)
+        async for chunk in response:
+            if chunk.text:
+                yield chunk.text
+
+    def probe(self, api_key: str, model_name: str = HEALTH_PROBE_MODEL):
+        """Blocking minimal request on api_key's own client; raises if the key can't serve."""
+        with self._probe_lock:
+            model = self._probe_models.get(api_key)
+            if model is None:
+                model = genai.GenerativeModel(model_name)
+                model._client = glm.GenerativeServiceClient(client_options=ClientOptions(api_key=api_key))
+                self._probe_models[api_key] = model
+        model.generate_content("test")
+
+
+class ModelRegistry:
+    """
+    Per-key model availability: the last model that answered, and models
+    that returned NotFound / unsupported until their entry expires.
+    """
+
+    def __init__(self, unavailable_ttl=DEFAULT_MODEL_UNAVAILABLE_TTL):
+        self.unavailable_ttl = unavailable_ttl
+        self._unavailable = {}  # (api_key, model_name) -> expires_at (monotonic)
+        self._preferred = {}  # api_key -> model_name
+        self._lock = threading.Lock()
+
+    def candidates(self, api_key: str, models) -> list:
+        """Models worth trying for api_key, the last one that worked first."""
+        now = time.monotonic()
+        with self._lock:
+            preferred = self._preferred.get(api_key)
+            ordered = sorted(models, key=lambda name: name != preferred)
+            available = []
+            for name in ordered:
+                expires_at = self._unavailable.get((api_key, name))
+                if expires_at is not None and expires_at <= now:
+                    del self._unavailable[(api_key, name)]
+                    expires_at = None
+                if expires_at is None:
+                    available.append(name)
+            return available
+
+    def mark_available(self, api_key: str, model_name: str):
+        with self._lock:
+            self._preferred[api_key] = model_name
+            self._unavailable.pop((api_key, model_name), None)
+
+    def mark_unavailable(self, api_key: str, model_name: str):
+        with self._lock:
+            self._unavailable[(api_key, model_name)] = time.monotonic() + self.unavailable_ttl
+            if self._preferred.get(api_key) == model_name:
+                del self._preferred[api_key]
+
+
+class KeyHealthScheduler:
+    """
+    One thread per process that re-probes unhealthy API keys.
+
+    schedule(key) queues a probe after `interval` seconds, or does nothing if
+    the key is already queued. probe(key) failing reschedules it with double
+    the delay (capped at max_interval); succeeding calls on_healthy(key).
+    All delays are jittered by PROBE_JITTER.
+    """
+
+    def __init__(self, probe, on_healthy, interval=DEFAULT_KEY_RECHECK_INTERVAL,
+                 max_interval=DEFAULT_KEY_RECHECK_MAX_INTERVAL):
+        self.probe = probe
+        self.on_healthy = on_healthy
+        self.interval = interval
+        self.max_interval = max_interval
+        self._heap = []  # (due, api_key), monotonic time
+        self._delays = {}  # api_key -> current delay, present while scheduled
+        self._condition = threading.Condition()
+        self._thread = None
+
+    def __len__(self):
+        with self._condition:
+            return len(self._delays)
+
+    def _jittered(self, delay: float) -> float:
+        return delay * random.uniform(1 - PROBE_JITTER, 1 + PROBE_JITTER)
+
+    def schedule(self, api_key: str) -> bool:
+        """Queue a probe for api_key; False if one is already queued."""
+        with self._condition:
+            if api_key in self._delays:
+                return False
+            self._delays[api_key] = self.interval
+            heapq.heappush(self._heap, (time.monotonic() + self._jittered(self.interval), api_key))
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='ai-key-health', daemon=True)
+                self._thread.start()
+            self._condition.notify()
+            return True
+
+    def _next_due(self):
+        """Block until a probe is due and pop it"""
+        with self._condition:
+            while True:
+                if not self._heap:
+                    self._condition.wait()
+                    continue
+                due, api_key = self._heap[0]
+                wait = due - time.monotonic()
+                if wait > 0:
+                    self._condition.wait(wait)
+                    continue
+                heapq.heappop(self._heap)
+                return api_key
+
+    def _run(self):
+        while True:
+            self.run_probe(self._next_due())
+
+    def run_probe(self, api_key: str):
+        try:
+            self.probe(api_key)
+        except Exception as e:
+            with self._condition:
+                delay = min(self._delays.get(api_key, self.interval) * 2, self.max_interval)
+                self._delays[api_key] = delay
+                heapq.heappush(self._heap, (time.monotonic() + self._jittered(delay), api_key))
+            logger.warning(f"API key {api_key[:10]}... still unhealthy, next probe in ~{delay:.0f}s ({e})")
+            return
+        with self._condition:
+            self._delays.pop(api_key, None)
+        self.on_healthy(api_key)
+        logger.info(f"Rechecked API key {api_key[:10]}... - now healthy")
+
+
+class WaitQueue:
+    """
+    FIFO admission to a fixed number of execution slots.
+
+    Only used from the engine loop, so it needs no locking; size() is safe to
+    read from other threads.
+    """
+
+    def __init__(self, slots: int, max_waiting: int):
+        self.slots = slots
+        self.max_waiting = max_waiting
+        self.active = 0
+        self._waiters = deque()
+
+    def size(self) -> int:
+        """Requests waiting for a slot"""
+        return len(self._waiters)
+
+    async def acquire(self, deadline: float):
+        """
+        Take a slot, waiting in line until deadline (loop time).
+
+        Raises:
+            QueueFullError: Wait queue is at capacity
+            DeadlineExceeded: No slot freed up before the deadline
+        """
+        loop = asyncio.get_running_loop()
+        if self.active < self.slots and not self._waiters:
+            self.active += 1
+            return
+        if len(self._waiters) >= self.max_waiting:
+            raise QueueFullError()
+
+        waiter = loop.create_future()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(waiter, timeout=max(deadline - loop.time(), 0))
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if waiter.done() and not waiter.cancelled():
+                # A slot was handed over just as we gave up; pass it on
+                self.release()
+            else:
+                try:
+                    self._waiters.remove(waiter)
+                except ValueError:
+                    pass
+            if isinstance(e, asyncio.TimeoutError):
+                raise DeadlineExceeded('Timed out waiting for an AI execution slot')
+            raise
+
+    def release(self):
+        """Hand the slot to the oldest waiter, or free it."""
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.active -= 1
+
+
+class StreamSink:
+    """
+    Forwards chunks from the engine loop to a consumer on another loop.
+    `started` is set once a chunk has gone out; from then on the request
+    must not be retried.
+    """
+
+    def __init__(self, loop, queue):
+        self.loop = loop
+        self.queue = queue
+        self.started = False
+
+    def put(self, item):
+        self.loop.call_soon_threadsafe(self.queue.put_nowait, item)
+
+    def send(self, text: str):
+        self.started = True
+        self.put(text)
+
+
+def _streamed(sink) -> bool:
+    """True once part of a streamed reply has gone out; it can't be retried then"""
+    return sink is not None and sink.started
+
+
+class AIExecutionEngine:
+    """Bounded, deadline-aware execution of Gemini requests on a private event loop"""
+
+    def __init__(self, client, key_manager, max_concurrency=DEFAULT_MAX_CONCURRENCY,
+                 max_waiting=DEFAULT_MAX_WAITING, request_timeout=DEFAULT_REQUEST_TIMEOUT,
+                 max_attempts=MAX_ATTEMPTS, base_delay=BASE_DELAY, models=CANDIDATE_MODELS,
+                 model_unavailable_ttl=DEFAULT_MODEL_UNAVAILABLE_TTL):
+        self.client = client
+        self.key_manager = key_manager
+        self.model_registry = ModelRegistry(model_unavailable_ttl)
+        self.request_timeout = request_timeout
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.models = models
+        self.queue = WaitQueue(max_concurrency, max_waiting)
+        self._loop = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_settings(cls, client, key_manager):
+        config = getattr(settings, 'AI_ENGINE', {})
+        return cls(
+            client, key_manager,
+            max_concurrency=config.get('MAX_CONCURRENCY', DEFAULT_MAX_CONCURRENCY),
+            max_waiting=config.get('MAX_WAITING', DEFAULT_MAX_WAITING),
+            request_timeout=config.get('REQUEST_TIMEOUT', DEFAULT_REQUEST_TIMEOUT),
+            model_unavailable_ttl=config.get('MODEL_UNAVAILABLE_TTL', DEFAULT_MODEL_UNAVAILABLE_TTL),
+        )
+
+    # ------------------------------------------------------------------
+    # Entry points
+    # ------------------------------------------------------------------
+
+    def _get_loop(self):
+        with self._lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name='ai-engine', daemon=True).start()
+                self._loop = loop
+            return self._loop
+
+    def submit(self, prompt, timeout=None) -> concurrent.futures.Future:
+        """Schedule a request on the engine loop; the future resolves to the reply text."""
+        timeout = self.request_timeout if timeout is None else timeout
+        return asyncio.run_coroutine_threadsafe(self.execute(prompt, timeout), self._get_loop())
+
+    def run(self, prompt, timeout=None) -> str:
+        """Blocking call for sync callers; raises whatever execute raises."""
+        return self.submit(prompt, timeout).result()
+
+    async def arun(self, prompt, timeout=None) -> str:
+        """Await a request from any event loop (e.g. an async view under ASGI)."""
+        return await asyncio.wrap_future(self.submit(prompt, timeout))
+
+    async def astream(self, prompt, timeout=None):
+        """
+        Async iterator over reply chunks, for any event loop.
+
+        Raises whatever execute raises, at the point the stream fails.
+        Closing the iterator early cancels the upstream request.
+        """
+        timeout = self.request_timeout if timeout is None else timeout
+        queue = asyncio.Queue()
+        sink = StreamSink(asyncio.get_running_loop(), queue)
+        done = object()
+
+        async def produce():
+            try:
+                await self.execute(prompt, timeout, sink)
+            except BaseException as e:
+                sink.put(e)
+                raise
+            sink.put(done)
+
+        future = asyncio.run_coroutine_threadsafe(produce(), self._get_loop())
+        try:
+            while True:
+                item = await queue.get()
+                if item is done:
+                    return
+                if isinstance(item, BaseException):
+                    raise item
+                yield item
+        finally:
+            future.cancel()
+
+    # ------------------------------------------------------------------
+    # Execution (engine loop)
+    # ------------------------------------------------------------------
+
+    async def execute(self, prompt, timeout: float, sink: StreamSink = None) -> str:
+        """
+        Queue for a slot, then generate with model fallback and retries.
+        With a sink, chunks are sent to it as they arrive.
+
+        Raises:
+            QueueFullError, DeadlineExceeded, or the last upstream error
+        """
+        deadline = asyncio.get_running_loop().time() + timeout
+        await self.queue.acquire(deadline)
+        try:
+            return await self._generate_with_retry(prompt, deadline, sink)
+        finally:
+            self.queue.release()
+
+    def _remaining(self, deadline: float) -> float:
+        return deadline - asyncio.get_running_loop().time()
+
+    async def _sleep(self, delay: float, deadline: float):
+        if delay >= self._remaining(deadline):
+            raise DeadlineExceeded(f'Retry in {delay:.1f}s would pass the request deadline')
+        logger.info(f"Retrying AI request in {delay:.2f} seconds")
+        await asyncio.sleep(delay)
+
+    def _backoff(self, attempt: int, error) -> float:
+        retry_after = getattr(error, 'retry_after', None)
+        if retry_after and isinstance(retry_after, (int, float)):
+            return min(retry_after, MAX_RETRY_AFTER)
+        return self.base_delay * (2 ** attempt) + (0.5 * attempt)  # Add jitter
+
+    async def _stream(self, api_key: str, model_name: str, prompt, sink: StreamSink) -> str:
+        chunks = []
+        async for text in self.client.generate_stream(api_key, model_name, prompt):
+            chunks.append(text)
+            sink.send(text)
+        return ''.join(chunks).strip()
+
+    async def _generate_any_model(self, api_key: str, prompt, deadline: float, sink: StreamSink = None) -> str:
+        """Try the models the registry still considers available for this key, in turn."""
+        last_resource_exhausted_error = None
+        for model_name in self.model_registry.candidates(api_key, self.models):
+            remaining = self._remaining(deadline)
+            if remaining <= 0:
+                raise DeadlineExceeded('AI request deadline passed')
+            if sink is None:
+                call = self.client.generate(api_key, model_name, prompt)
+            else:
+                call = self._stream(api_key, model_name, prompt, sink)
+            try:
+                logger.info(f"Attempting with model: {model_name} (Key: {api_key[:4]}...)")
+                reply = await asyncio.wait_for(call, remaining)
+            except asyncio.TimeoutError:
+                raise DeadlineExceeded(f'Model {model_name} did not answer before the request deadline')
+            except exceptions.NotFound:
+                if _streamed(sink):
+                    raise
+                logger.warning(f"Model {model_name} not found, skipping it for this key")
+                self.model_registry.mark_unavailable(api_key, model_name)
+                continue
+            except exceptions.InvalidArgument as e:
+                if "not supported" not in str(e).lower() or _streamed(sink):
+                    raise
+                logger.warning(f"Model {model_name} doesn't support this request, skipping it for this key")
+                self.model_registry.mark_unavailable(api_key, model_name)
+                continue
+            except exceptions.ResourceExhausted as e:
+                if _streamed(sink):
+                    raise
+                logger.warning(f"Model {model_name} quota exhausted (or limit 0), trying next model...")
+                last_resource_exhausted_error = e
+                continue
+            self.model_registry.mark_available(api_key, model_name)
+            return reply
+
+        if last_resource_exhausted_error:
+            raise last_resource_exhausted_error
+        raise Exception("All available Gemini models failed (404/Invalid)")
+
+    async def _generate_with_retry(self, prompt, deadline: float, sink: StreamSink = None) -> str:
+        """Exponential backoff honouring retry_after, switching keys on quota errors."""
+        api_key = self.key_manager.get_healthy_key()
+        if not api_key:
+            raise Exception("No healthy API keys")
+
+        for attempt in range(self.max_attempts):
+            try:
+                return await self._generate_any_model(api_key, prompt, deadline, sink)
+            except DeadlineExceeded:
+                raise
+            except exceptions.ResourceExhausted as e:
+                logger.warning(f"Resource exhausted on attempt {attempt + 1}")
+                if attempt == self.max_attempts - 1 or _streamed(sink):
+                    raise
+                await self._sleep(self._backoff(attempt, e), deadline)
+
+                # Try a different key if available, otherwise bench this one
+                new_key = self.key_manager.get_healthy_key()
+                if new_key and new_key != api_key:
+                    logger.info("Switching to alternative API key")
+                    api_key = new_key
+                    continue
+                self.key_manager.mark_key_unhealthy(api_key)
+                api_key = self.key_manager.get_healthy_key()
+                if not api_key:
+                    raise Exception("All API keys unhealthy")
+            except Exception as e:
+                logger.error(f"AI request error on attempt {attempt + 1}: {e}")
+                if attempt == self.max_attempts - 1 or _streamed(sink):
+                    raise
+
+        raise Exception("All retries failed")
@@ -0,0 +1,351 @@
+"""
+AI Intent Fast Path - Answer aggregate questions with SQL before the LLM
+
+Common agent questions are plain aggregates: "total sales last month",
+"how much did we pay XYZ Traders this year", "pending receivables",
+"top 5 customers". Asking Gemini to add up a JSON dump for these is slow and
+unreliable. answer_aggregate_question recognizes them with a few patterns
+and answers from the per-type aggregate queries in reports.database.
+A question is only answered when every word of it is accounted for: the
+voucher type, period and party, plus aggregate wording and a short list of
+filler words. A party only counts if the tenant has a ledger, customer or
+vendor of that name, so "sales to date" or "sales for the quarter" are not
+read as parties. Anything else (actions, open-ended questions, filters the
+patterns do not understand such as "GST" or "by item") returns None and goes
+to the LLM as before.
+
+Recognized intents:
+    totals       total / count of a voucher type, optionally for a party and
+                 a period (today, yesterday, this/last month, this/last
+                 financial year, last N days, a named month)
+    outstanding  receivables (sales - receipts) or payables (purchases -
+                 payments), overall or for one party
+    top parties  top N customers (by sales) or vendors (by purchases)
+
+Configuration (settings.AI_INTENTS):
+    ENABLED: answer recognized questions without the LLM (default True)
+"""
+
+import calendar
+import re
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.conf import settings
+
+# Keywords per voucher type, matched as whole words
+VOUCHER_TYPE_WORDS = {
+    'Sales': ('sales', 'sale', 'sell', 'sold', 'revenue', 'turnover'),
+    'Purchase': ('purchases', 'purchase', 'purchased', 'bought'),
+    'Payment': ('payments', 'payment', 'pay', 'paid'),
+    'Receipt': ('receipts', 'receipt', 'receive', 'received', 'collections', 'collected'),
+    'Contra': ('contra', 'contras'),
+    'Journal': ('journals', 'journal'),
+}
+
+TYPE_LABELS = {
+    'Sales': 'sales', 'Purchase': 'purchases', 'Payment': 'payments',
+    'Receipt': 'receipts', 'Contra': 'contra vouchers', 'Journal': 'journal vouchers',
+}
+
+# Party preposition per type ("sales to X", "purchases from X")
+PARTY_PREPOSITIONS = {'Sales': 'to', 'Purchase': 'from', 'Payment': 'to', 'Receipt': 'from'}
+
+# Requests to do something go to the LLM (tool use)
+ACTION_PATTERN = re.compile(
+    r'\b(create|add|new|delete|remove|navigate|go to|open|edit|update|record|make|enter|post|cancel)\b'
+)
+AGGREGATE_PATTERN = re.compile(r'\b(total|totals|sum|how much|how many|count|number of|amount of|value of)\b')
+OUTSTANDING_PATTERN = re.compile(r'\b(outstanding|receivables?|payables?|unpaid|balance due)\b')
+PAYABLE_PATTERN = re.compile(r'\b(payables?|vendors?|suppliers?|purchases?|payments?|we owe|to pay)\b')
+TOP_PATTERN = re.compile(
+    r'\b(?:top|best|biggest|largest)\s*(\d+)?\s*(customers?|clients?|buyers?|vendors?|suppliers?)\b'
+)
+# A party follows a preposition, or directly a payment verb ("pay XYZ Traders")
+PARTY_PREFIX_PATTERN = re.compile(r'\b(?:to|from|for|of|with|pay|paid)\s+(?:the\s+|our\s+|my\s+)?')
+PARTY_END_PATTERN = re.compile(r'[?.!,]')
+# Words after a preposition that are not a party name
+NOT_PARTIES = {
+    'me', 'us', 'it', 'them', 'all', 'everyone', 'customer', 'customers', 'client', 'clients',
+    'vendor', 'vendors', 'supplier', 'suppliers', 'party', 'parties',
+}
+
+WORD_PATTERN = re.compile(r"[\w'&-]+")
+# Words a recognized question may contain besides its type, period and party
+FILLER_WORDS = {
+    'what', "what's", 'whats', 'how', 'much', 'many', 'is', 'are', 'was', 'were', 'the', 'a', 'an',
+    'our', 'my', 'we', 'i', 'me', 'us', 'you', 'did', 'do', 'does', 'have', 'has', 'had', 'can',
+    'could', 'please', 'show', 'tell', 'give', 'get', 'list', 'to', 'from', 'for', 'of', 'with',
+    'in', 'so', 'far', 'all', 'overall', 'there', 'any', 'made', 'done', 'been',
+}
+AGGREGATE_WORDS = {'total', 'totals', 'sum', 'count', 'number', 'amount', 'value'}
+OUTSTANDING_WORDS = {
+    'outstanding', 'receivable', 'receivables', 'payable', 'payables', 'unpaid', 'balance', 'balances',
+    'due', 'dues', 'pending', 'owe', 'owed', 'owes',
+}
+TOP_WORDS = {
+    'top', 'best', 'biggest', 'largest', 'customer', 'customers', 'client', 'clients', 'buyer',
+    'buyers', 'vendor', 'vendors', 'supplier', 'suppliers', 'by',
+}
+TYPE_WORDS = {word for words in VOUCHER_TYPE_WORDS.values() for word in words}
+
+MONTHS = {name.lower(): number for number, name in enumerate(calendar.month_name) if name}
+MONTHS.update({name.lower(): number for number, name in enumerate(calendar.month_abbr) if name})
+
+MONTH_PATTERN = re.compile(r'\b(?:in|for|during|of)?\s*(' + '|'.join(sorted(MONTHS, key=len, reverse=True)) + r')\b(?:\s+(\d{4}))?')
+LAST_DAYS_PATTERN = re.compile(r'\b(?:in the |over the |for the )?(?:last|past)\s+(\d+)\s+days?\b')
+
+DEFAULT_TOP_N = 5
+MAX_TOP_N = 50
+
+
+def is_enabled():
+    return getattr(settings, 'AI_INTENTS', {}).get('ENABLED', True)
+
+
+def _fmt(amount):
+    return f"{Decimal(amount or 0):,.2f}"
+
+
+def _fmt_date(day):
+    return day.strftime('%d %b %Y')
+
+
+# ============================================================================
+# PARSING
+# ============================================================================
+
+def _financial_year(tenant_id, day):
+    from reports.period_close import get_period_bounds
+    return get_period_bounds(tenant_id, 'year', day)
+
+
+def parse_period(tenant_id, text, today):
+    """
+    Find a period in lower-cased text.
+
+    Returns:
+        (label, start, end, matched span) or None for all time
+    """
+    fixed = [
+        (r'\btoday\b', 'today', lambda: (today, today)),
+        (r'\byesterday\b', 'yesterday', lambda: (today - timedelta(days=1),) * 2),
+        (r'\b(?:this|current) month\b', 'this month', lambda: (today.replace(day=1), today)),
+        (r'\b(?:last|previous|past) month\b', 'last month', lambda: (
+            (today.replace(day=1) - timedelta(days=1)).replace(day=1), today.replace(day=1) - timedelta(days=1)
+        )),
+        (r'\b(?:this|current) (?:financial |fiscal )?year\b|\bthis fy\b|\bytd\b|\byear to date\b', 'this financial year',
+         lambda: (_financial_year(tenant_id, today)[0], today)),
+        (r'\b(?:last|previous|past) (?:financial |fiscal )?year\b|\blast fy\b', 'last financial year',
+         lambda: _financial_year(tenant_id, _financial_year(tenant_id, today)[0] - timedelta(days=1))),
+    ]
+    for pattern, label, bounds in fixed:
+        match = re.search(pattern, text)
+        if match:
+            start, end = bounds()
+            return label, start, end, match.span()
+
+    match = LAST_DAYS_PATTERN.search(text)
+    if match:
+        days = int(match.group(1))
+        return f"the last {days} days", today - timedelta(days=days - 1), today, match.span()
+
+    match = MONTH_PATTERN.search(text)
+    # "may" is also a verb; only take it with a year or a preposition
+    if match and (match.group(1) != 'may' or match.group(2) or match.group(0).strip() != 'may'):
+        month = MONTHS[match.group(1)]
+        year = int(match.group(2)) if match.group(2) else (today.year if month <= today.month else today.year - 1)
+        start = date(year, month, 1)
+        end = date(year, month, calendar.monthrange(year, month)[1])
+        return start.strftime('%B %Y'), start, end, match.span()
+
+    return None
+
+
+def parse_voucher_types(text):
+    return [
+        voucher_type for voucher_type, words in VOUCHER_TYPE_WORDS.items()
+        if re.search(r'\b(' + '|'.join(words) + r')\b', text)
+    ]
+
+
+def is_known_party(tenant_id, name):
+    """True if the tenant has a ledger, customer or vendor called name (any case)"""
+    from accounting.models import MasterLedger
+    from customerportal.database import CustomerMasterCustomerBasicDetails
+    from vendors.models import VendorMasterBasicDetail
+
+    return any(
+        model.objects.filter(tenant_id=tenant_id, **{f'{field}__iexact': name}).exists()
+        for model, field in (
+            (MasterLedger, 'name'),
+            (CustomerMasterCustomerBasicDetails, 'customer_name'),
+            (VendorMasterBasicDetail, 'vendor_name'),
+        )
+    )
+
+
+def parse_party(tenant_id, original, lowered_without_period):
+    """
+    Party name after to/from/for/of/with or pay/paid, taken from the
+    original-case message. The first candidate that is not a voucher type or
+    a generic word and names one of the tenant's parties wins ("count of
+    receipts from ABC Ltd" -> "ABC Ltd").
+
+    Returns:
+        (party, span) or None
+    """
+    for prefix in PARTY_PREFIX_PATTERN.finditer(lowered_without_period):
+        start = prefix.end()
+        stop = PARTY_END_PATTERN.search(lowered_without_period, start)
+        end = stop.start() if stop else len(lowered_without_period)
+        party = original[start:end].strip()
+        candidate = party.lower()
+        if not party or candidate in NOT_PARTIES or parse_voucher_types(candidate) or PARTY_PREFIX_PATTERN.search(candidate):
+            continue
+        if not is_known_party(tenant_id, party):
+            continue
+        return party, (end - len(original[start:end].lstrip()), end)
+    return None
+
+
+def is_fully_understood(text, spans, allowed):
+    """True if every word outside the matched spans is an allowed word"""
+    for start, end in spans:
+        text = text[:start] + ' ' * (end - start) + text[end:]
+    return all(word in allowed for word in WORD_PATTERN.findall(text))
+
+
+# ============================================================================
+# ANSWERS
+# ============================================================================
+
+def _period_suffix(period):
+    if period is None:
+        return ''
+    label, start, end, _ = period
+    if start == end:
+        return f" for {label} ({_fmt_date(start)})"
+    return f" for {label} ({_fmt_date(start)} - {_fmt_date(end)})"
+
+
+def answer_totals(tenant_id, voucher_types, period, party):
+    from reports.database import get_voucher_totals
+
+    start, end = (period[1], period[2]) if period else (None, None)
+    lines = []
+    for row in get_voucher_totals(tenant_id, voucher_types, start, end, party=party):
+        label = TYPE_LABELS[row['type']]
+        party_text = f" {PARTY_PREPOSITIONS.get(row['type'], 'for')} {party}" if party else ''
+        lines.append(
+            f"Total {label}{party_text}{_period_suffix(period)}: "
+            f"{_fmt(row['total'])} across {row['count']} voucher{'s' if row['count'] != 1 else ''}."
+        )
+    return '\n'.join(lines)
+
+
+def _outstanding_by_party(tenant_id, payable, end):
+    from reports.database import get_party_totals
+
+    billed_type, settled_type = ('Purchase', 'Payment') if payable else ('Sales', 'Receipt')
+    balances = {}
+    names = {}
+    for voucher_type, sign in ((billed_type, 1), (settled_type, -1)):
+        for party, total in get_party_totals(tenant_id, voucher_type, end_date=end).items():
+            key = party.strip().lower()
+            names.setdefault(key, party.strip())
+            balances[key] = balances.get(key, Decimal('0')) + sign * Decimal(total)
+    return {names[key]: balance for key, balance in balances.items()}
+
+
+def answer_outstanding(tenant_id, payable, period, party):
+    end = period[2] if period else None
+    balances = _outstanding_by_party(tenant_id, payable, end)
+    kind = 'payable' if payable else 'receivable'
+    as_of = f" as of {_fmt_date(end)}" if end else ''
+
+    if party:
+        balance = next((value for name, value in balances.items() if name.lower() == party.strip().lower()), None)
+        if balance is None:
+            return f"No {kind} transactions found for {party}."
+        return f"Outstanding {kind} for {party}{as_of}: {_fmt(balance)}."
+
+    open_balances = sorted(
+        ((name, value) for name, value in balances.items() if value > 0), key=lambda item: (-item[1], item[0])
+    )
+    if not open_balances:
+        return f"There are no outstanding {kind}s{as_of}."
+    total = sum(value for _, value in open_balances)
+    heading = 'Vendor' if payable else 'Customer'
+    rows = '\n'.join(f"| {name} | {_fmt(value)} |" for name, value in open_balances[:DEFAULT_TOP_N * 2])
+    return (
+        f"Outstanding {kind}s{as_of}: {_fmt(total)} across {len(open_balances)} "
+        f"{heading.lower()}{'s' if len(open_balances) != 1 else ''}.\n\n"
+        f"| {heading} | Outstanding |\n|---|---|\n{rows}"
+    )
+
+
+def answer_top_parties(tenant_id, vendors, limit, period):
+    from reports.database import get_top_parties
+
+    voucher_type = 'Purchase' if vendors else 'Sales'
+    start, end = (period[1], period[2]) if period else (None, None)
+    rows = get_top_parties(tenant_id, voucher_type, limit=limit, start_date=start, end_date=end)
+    heading = 'Vendor' if vendors else 'Customer'
+    if not rows:
+        return f"No {TYPE_LABELS[voucher_type]} found{_period_suffix(period)}."
+    table = '\n'.join(
+        f"| {rank} | {row['party']} | {_fmt(row['total'])} | {row['count']} |"
+        for rank, row in enumerate(rows, 1)
+    )
+    return (
+        f"Top {len(rows)} {heading.lower()}s by {TYPE_LABELS[voucher_type]}{_period_suffix(period)}:\n\n"
+        f"| # | {heading} | {TYPE_LABELS[voucher_type].title()} | Vouchers |\n|---|---|---|---|\n{table}"
+    )
+
+
+def answer_aggregate_question(tenant_id, message, today=None):
+    """
+    Answer an aggregate question from the database.
+
+    Returns:
+        str reply, or None when the question should go to the LLM
+    """
+    original = (message or '').strip()
+    text = original.lower()
+    if not text or ACTION_PATTERN.search(text):
+        return None
+    today = today or date.today()
+
+    period = parse_period(tenant_id, text, today)
+    # Blank out the period so "for April" is not taken as a party
+    without_period = text
+    if period:
+        start, end = period[3]
+        without_period = text[:start] + ' ' * (end - start) + text[end:]
+        original = original[:start] + ' ' * (end - start) + original[end:]
+
+    found = parse_party(tenant_id, original, without_period)
+    party, party_span = found if found else (None, None)
+    spans = [span for span in (period and period[3], party_span) if span]
+    allowed = FILLER_WORDS | AGGREGATE_WORDS
+
+    top = TOP_PATTERN.search(text)
+    if top:
+        if not is_fully_understood(text, spans + [top.span()], allowed | TOP_WORDS | TYPE_WORDS):
+            return None
+        limit = min(int(top.group(1) or DEFAULT_TOP_N), MAX_TOP_N)
+        return answer_top_parties(tenant_id, top.group(2).startswith(('vendor', 'supplier')), limit, period)
+
+    if OUTSTANDING_PATTERN.search(text):
+        if not is_fully_understood(text, spans, allowed | OUTSTANDING_WORDS | TYPE_WORDS | TOP_WORDS):
+            return None
+        return answer_outstanding(tenant_id, bool(PAYABLE_PATTERN.search(text)), period, party)
+
+    voucher_types = parse_voucher_types(without_period)
+    if not voucher_types or not is_fully_understood(text, spans, allowed | TYPE_WORDS):
+        return None
+    # Aggregate wording, or a terse "sales this month?"
+    if not AGGREGATE_PATTERN.search(text) and not (period and len(text.split()) <= 6):
+        return None
+    return answer_totals(tenant_id, voucher_types, period, party)
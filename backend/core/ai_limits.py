@@ -0,0 +1,224 @@
+"""
+AI Limits - Rate limiter and circuit breaker shared by all worker processes
+SQLite-backed (WAL), like the AI result cache, so no Redis is needed.
+
+Each gunicorn worker used to keep its own in-memory counters, so a
+"1000/min global" limit really allowed 1000/min per worker, and a provider
+outage had to trip the breaker once per worker. The state now lives in one
+SQLite file on the host:
+
+    rate_buckets(key, tokens, updated_at, expires_at)
+    circuit_state(name, failures, last_failure)
+
+Rate limits are token buckets: a key holds up to `limit` tokens, refilled
+at limit/window per second, and each request takes one. A check is one
+primary-key read and write inside a short write transaction. A bucket idle
+for a full window is full again, so it is the same as no row; such rows are
+swept every SWEEP_INTERVAL seconds instead of growing without bound.
+
+Configuration (settings.AI_LIMITS):
+    PATH:              SQLite file (default BASE_DIR/ai_limits.sqlite3)
+    USER_PER_MINUTE:   requests per user (default 50)
+    TENANT_PER_MINUTE: requests per tenant (default 200)
+    GLOBAL_PER_MINUTE: requests for the whole host (default 1000)
+    FAILURE_THRESHOLD: provider failures that open the breaker (default 5)
+    RESET_TIMEOUT:     seconds the breaker stays open (default 300)
+"""
+
+import logging
+import math
+import os
+import sqlite3
+import threading
+import time
+
+from django.conf import settings
+
+from .shared_sqlite import SharedState
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_USER_PER_MINUTE = 50
+DEFAULT_TENANT_PER_MINUTE = 200
+DEFAULT_GLOBAL_PER_MINUTE = 1000
+DEFAULT_FAILURE_THRESHOLD = 5
+DEFAULT_RESET_TIMEOUT = 300
+
+# Seconds between sweeps of idle buckets (per process)
+SWEEP_INTERVAL = 60
+
+
+class RateLimiter(SharedState):
+    """Token-bucket rate limits shared across processes"""
+
+    schema = (
+        "CREATE TABLE IF NOT EXISTS rate_buckets ("
+        "key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated_at REAL NOT NULL, expires_at REAL NOT NULL)",
+        "CREATE INDEX IF NOT EXISTS rate_buckets_expires ON rate_buckets (expires_at)",
+    )
+
+    def __init__(self, path):
+        super().__init__(path)
+        self._last_sweep = 0
+
+    def check_rate_limits(self, limits, window: int = 60) -> dict:
+        """
+        Take one token from every bucket in limits, or from none.
+
+        Args:
+            limits: [(key, limit), ...]; each key allows `limit` requests per window
+
+        Returns:
+            {'allowed': bool, 'retry_after': seconds, 'key': first exhausted key or None}
+        """
+        now = time.time()
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            buckets = []
+            for key, limit in limits:
+                rate = limit / window
+                row = conn.execute("SELECT tokens, updated_at FROM rate_buckets WHERE key = ?", (key,)).fetchone()
+                tokens = limit if row is None else min(limit, row[0] + (now - row[1]) * rate)
+                if tokens < 1:
+                    conn.execute("ROLLBACK")
+                    return {'allowed': False, 'retry_after': math.ceil((1 - tokens) / rate), 'key': key}
+                buckets.append((key, tokens - 1, now, now + (limit - tokens + 1) / rate))
+            conn.executemany(
+                "INSERT OR REPLACE INTO rate_buckets (key, tokens, updated_at, expires_at) VALUES (?, ?, ?, ?)",
+                buckets
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+
+        if now - self._last_sweep > SWEEP_INTERVAL:
+            self._last_sweep = now
+            self.sweep(now)
+        return {'allowed': True, 'retry_after': 0, 'key': None}
+
+    def check_rate_limit(self, key: str, limit: int, window: int = 60) -> dict:
+        """Check if request is allowed. Returns {'allowed': bool, 'retry_after': int}"""
+        result = self.check_rate_limits([(key, limit)], window)
+        return {'allowed': result['allowed'], 'retry_after': result['retry_after']}
+
+    def sweep(self, now=None):
+        """Drop buckets that have refilled completely; returns rows removed"""
+        cursor = self._connect().execute("DELETE FROM rate_buckets WHERE expires_at <= ?", (now or time.time(),))
+        return cursor.rowcount
+
+    def size(self) -> int:
+        return self._connect().execute("SELECT COUNT(*) FROM rate_buckets").fetchone()[0]
+
+
+class CircuitBreaker(SharedState):
+    """
+    Circuit breaker to stop requests when provider is failing.
+
+    Failures from every process count towards one threshold. State errors
+    are logged and treated as a closed breaker, so a broken state file
+    cannot take the AI service down.
+    """
+
+    schema = (
+        "CREATE TABLE IF NOT EXISTS circuit_state ("
+        "name TEXT PRIMARY KEY, failures INTEGER NOT NULL, last_failure REAL NOT NULL)",
+    )
+
+    def __init__(self, path, failure_threshold=DEFAULT_FAILURE_THRESHOLD,
+                 reset_timeout=DEFAULT_RESET_TIMEOUT, name='gemini'):
+        super().__init__(path)
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.name = name
+
+    def _state(self):
+        row = self._connect().execute(
+            "SELECT failures, last_failure FROM circuit_state WHERE name = ?", (self.name,)
+        ).fetchone()
+        return row or (0, 0)
+
+    @property
+    def failures(self) -> int:
+        try:
+            return self._state()[0]
+        except sqlite3.Error as e:
+            logger.warning(f"Circuit breaker state unavailable: {e}")
+            return 0
+
+    def is_open(self) -> bool:
+        """Check if circuit breaker is open (blocking requests)"""
+        try:
+            failures, last_failure = self._state()
+            if failures < self.failure_threshold:
+                return False
+            if time.time() - last_failure < self.reset_timeout:
+                return True
+            # Reset, unless another process recorded a failure meanwhile
+            self._connect().execute(
+                "UPDATE circuit_state SET failures = 0, last_failure = 0 WHERE name = ? AND last_failure = ?",
+                (self.name, last_failure)
+            )
+        except sqlite3.Error as e:
+            logger.warning(f"Circuit breaker state unavailable: {e}")
+        return False
+
+    def record_failure(self):
+        """Record a failure"""
+        try:
+            self._connect().execute(
+                "INSERT INTO circuit_state (name, failures, last_failure) VALUES (?, 1, ?) "
+                "ON CONFLICT(name) DO UPDATE SET failures = failures + 1, last_failure = excluded.last_failure",
+                (self.name, time.time())
+            )
+        except sqlite3.Error as e:
+            logger.warning(f"Circuit breaker state unavailable: {e}")
+
+    def record_success(self):
+        """Record a success to potentially close circuit"""
+        try:
+            self._connect().execute(
+                "UPDATE circuit_state SET failures = failures - 1 WHERE name = ? AND failures > 0", (self.name,)
+            )
+        except sqlite3.Error as e:
+            logger.warning(f"Circuit breaker state unavailable: {e}")
+
+
+_rate_limiter = None
+_circuit_breaker = None
+_limits_lock = threading.Lock()
+
+
+def get_ai_limits_settings():
+    config = getattr(settings, 'AI_LIMITS', {})
+    return {
+        'PATH': config.get('PATH') or os.path.join(settings.BASE_DIR, 'ai_limits.sqlite3'),
+        'USER_PER_MINUTE': config.get('USER_PER_MINUTE', DEFAULT_USER_PER_MINUTE),
+        'TENANT_PER_MINUTE': config.get('TENANT_PER_MINUTE', DEFAULT_TENANT_PER_MINUTE),
+        'GLOBAL_PER_MINUTE': config.get('GLOBAL_PER_MINUTE', DEFAULT_GLOBAL_PER_MINUTE),
+        'FAILURE_THRESHOLD': config.get('FAILURE_THRESHOLD', DEFAULT_FAILURE_THRESHOLD),
+        'RESET_TIMEOUT': config.get('RESET_TIMEOUT', DEFAULT_RESET_TIMEOUT),
+    }
+
+
+def get_rate_limiter():
+    """Process-wide limiter over settings.AI_LIMITS['PATH'], built on first use"""
+    global _rate_limiter
+    with _limits_lock:
+        if _rate_limiter is None:
+            _rate_limiter = RateLimiter(get_ai_limits_settings()['PATH'])
+        return _rate_limiter
+
+
+def get_circuit_breaker():
+    """Process-wide breaker over settings.AI_LIMITS['PATH'], built on first use"""
+    global _circuit_breaker
+    with _limits_lock:
+        if _circuit_breaker is None:
+            config = get_ai_limits_settings()
+            _circuit_breaker = CircuitBreaker(
+                config['PATH'], failure_threshold=config['FAILURE_THRESHOLD'], reset_timeout=config['RESET_TIMEOUT']
+            )
+        return _circuit_breaker
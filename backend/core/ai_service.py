@@ -3,7 +3,6 @@ import os
 import json
 import logging
 import hashlib
-import base64
 from django.core.files.uploadedfile import UploadedFile
 
 logger = logging.getLogger(__name__)
@@ -69,22 +68,8 @@ def extract_invoice_data(image_file: UploadedFile, mime_type='image/jpeg'):
         return {"error": str(e)}
 
 
-def create_invoice_processing_request(image_file: UploadedFile, mime_type='image/jpeg', user_id='', tenant_id='') -> dict:
-    """
-    Creates a properly formatted request for invoice processing through the AI proxy
-    """
-    try:
-        # Read file content
-        image_content = image_file.read()
-
-        # Calculate file hash for deduplication
-        file_hash = hashlib.md5(image_content).hexdigest()
-
-        # Encode image for text-based queuing (workaround - proper implementation would handle files)
-        # In production, files might be stored temporarily and referenced
-        image_b64 = base64.b64encode(image_content).decode('utf-8')
-
-        prompt = """
+# Shared by single and batch extraction so results are cached under the same key
+INVOICE_EXTRACTION_PROMPT = """
         Extract invoice data from this image and return as a JSON ARRAY containing a SINGLE object representing the entire invoice.
         
         DO NOT create multiple objects for line items - consolidate all line items into arrays within a single invoice object.
@@ -128,12 +113,51 @@ def create_invoice_processing_request(image_file: UploadedFile, mime_type='image
         Return ONLY the JSON array. Do not include markdown formatting.
         """
 
-        request_data = {
-            'prompt': prompt,
-            'file_hash': file_hash,
-            'mime_type': mime_type,
-            'image_data': image_b64  # Pass full image data
-        }
+
+def parse_extraction(reply):
+    """
+    Invoice dicts from a model reply (a JSON array, or one object), with
+    markdown code fences stripped.
+
+    Raises:
+        ValueError: The reply is not JSON objects
+    """
+    text = (reply or '').strip()
+    if text.startswith('```'):
+        text = text.split('\n', 1)[1] if '\n' in text else ''
+        text = text.rsplit('```', 1)[0].strip()
+    data = json.loads(text)
+    invoices = data if isinstance(data, list) else [data]
+    if not all(isinstance(invoice, dict) for invoice in invoices):
+        raise ValueError('Extraction is not a list of invoice objects')
+    return invoices
+
+
+def build_invoice_request(image_file: UploadedFile, mime_type='image/jpeg') -> dict:
+    """
+    The AI proxy request_data for an uploaded invoice
+    """
+    # Read file content, hashing as it streams in
+    file_hash = hashlib.md5()
+    chunks = []
+    for chunk in image_file.chunks():
+        file_hash.update(chunk)
+        chunks.append(chunk)
+
+    return {
+        'prompt': INVOICE_EXTRACTION_PROMPT,
+        'file_hash': file_hash.hexdigest(),
+        'mime_type': mime_type,
+        'image_bytes': b''.join(chunks)  # Raw bytes; the SDK sends them as-is
+    }
+
+
+def create_invoice_processing_request(image_file: UploadedFile, mime_type='image/jpeg', user_id='', tenant_id='') -> dict:
+    """
+    Creates a properly formatted request for invoice processing through the AI proxy
+    """
+    try:
+        request_data = build_invoice_request(image_file, mime_type)
 
         # Import here to avoid circular imports
         from .ai_proxy import ai_service
@@ -4,4 +4,17 @@ class CoreConfig(AppConfig):
     name = 'core'
 
     def ready(self):
-        pass
+        from django.db.models.signals import post_save, post_delete
+        from core.models import User
+        from core.user_cache import evict_user
+
+        # Keep the authentication identity cache in step with user changes
+        post_save.connect(evict_user, sender=User, dispatch_uid='core_user_cache_save')
+        post_delete.connect(evict_user, sender=User, dispatch_uid='core_user_cache_delete')
+
+        # Voucher and master writes drop the tenant's cached AI agent context
+        from core.ai_context import get_context_source_models, invalidate_agent_context
+        for model in get_context_source_models():
+            uid = f'ai_context_{model.__name__}'
+            post_save.connect(invalidate_agent_context, sender=model, dispatch_uid=f'{uid}_save')
+            post_delete.connect(invalidate_agent_context, sender=model, dispatch_uid=f'{uid}_delete')
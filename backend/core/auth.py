@@ -1,12 +1,47 @@
 """
 Authentication Module - JWT Authentication Logic
 Extracted from core/authentication.py for clean separation.
+
+The authentication result is memoized on the underlying Django request, so
+TenantMiddleware, DRF authentication and the tenant decorators share a single
+token validation and user lookup per request.
 """
 
 from rest_framework_simplejwt.authentication import JWTAuthentication
 from rest_framework.exceptions import AuthenticationFailed
 
 
+# Attribute on the Django HttpRequest holding the memoized (user, token) tuple
+# (or None when the request carried no usable token).
+REQUEST_AUTH_ATTR = '_jwt_auth_result'
+
+
+def get_django_request(request):
+    """
+    Return the underlying Django HttpRequest.
+    DRF wraps the HttpRequest in its own Request object; middleware sees the raw one.
+    """
+    return getattr(request, '_request', request)
+
+
+def get_request_auth(request):
+    """
+    Return the memoized authentication result for this request.
+
+    Returns:
+        tuple: (found: bool, result: (user, token) tuple or None)
+    """
+    django_request = get_django_request(request)
+    if hasattr(django_request, REQUEST_AUTH_ATTR):
+        return True, getattr(django_request, REQUEST_AUTH_ATTR)
+    return False, None
+
+
+def set_request_auth(request, result):
+    """Memoize the authentication result on the underlying Django request."""
+    setattr(get_django_request(request), REQUEST_AUTH_ATTR, result)
+
+
 class CustomJWTAuthentication(JWTAuthentication):
     """
     Custom JWT Authentication supporting both header and cookie-based tokens.
@@ -17,7 +52,17 @@ class CustomJWTAuthentication(JWTAuthentication):
         """
         Authenticate request using JWT from header or cookie.
         Returns (user, validated_token) tuple or None.
+        The token is validated and the user loaded at most once per request.
         """
+        found, result = get_request_auth(request)
+        if found:
+            return result
+
+        result = self._authenticate(request)
+        set_request_auth(request, result)
+        return result
+
+    def _authenticate(self, request):
         try:
             # 1. Try to get token from header (standard Bearer)
             header = self.get_header(request)
@@ -44,10 +89,12 @@ class CustomJWTAuthentication(JWTAuthentication):
         """
         Find and return user using validated token.
         Only supports User (Owner) model.
+        Also attaches tenant_id from token to user object for easy access.
         """
         from rest_framework_simplejwt.settings import api_settings
         from rest_framework_simplejwt.exceptions import InvalidToken, AuthenticationFailed
         from django.contrib.auth import get_user_model
+        from core.user_cache import get_cached_user
 
         try:
             user_id = validated_token[api_settings.USER_ID_CLAIM]
@@ -58,11 +105,18 @@ class CustomJWTAuthentication(JWTAuthentication):
         user_model = get_user_model()  # User (Owner)
 
         try:
-            user = user_model.objects.get(**{api_settings.USER_ID_FIELD: user_id})
+            # Identity is served from the user cache; other fields load lazily
+            user = get_cached_user(user_model, user_id)
         except user_model.DoesNotExist:
             raise AuthenticationFailed("User not found", code="user_not_found")
 
         if not user.is_active:
             raise AuthenticationFailed("User is inactive", code="user_inactive")
 
+        # IMPORTANT: Ensure tenant_id is set on user object from token
+        # This is crucial for tenant validation in flow layers
+        token_tenant_id = validated_token.get('tenant_id')
+        if token_tenant_id and getattr(user, 'tenant_id', None) != token_tenant_id:
+            user.tenant_id = token_tenant_id
+
         return user
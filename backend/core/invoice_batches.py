@@ -0,0 +1,483 @@
+"""
+Invoice Batches - Background extraction of many uploaded invoices
+A POST spools the files, a worker extracts them, clients poll the job.
+
+Uploads are copied to disk in chunks and MD5-hashed in the same pass, so no
+file is held in memory or base64-encoded. The model gets the raw bytes, read
+from the spool file when its request runs (see ai_proxy.build_prompt).
+
+Per batch:
+    - files repeated within the batch are extracted once
+    - files this tenant already extracted (ExtractedInvoice.additional_fields
+      'file_hash') are reported as duplicates and skipped
+    - files extracted before by anyone are answered from the AI result cache
+      (keyed by the same MD5), without an upstream call
+    - at most PARALLELISM files are in flight at once
+    - requests are not charged to the uploading user's rate limit (the
+      batch itself was the user's request); a RATE_LIMIT answer from the
+      tenant/global limits or the provider is retried after a wait
+    - all ExtractedInvoice rows are written with one bulk_create
+
+Job state is a JSON file per token under ROOT (the report job store, see
+reports/jobs.py), so any worker can answer a status poll. A running batch
+saves its state as each file finishes; a poll that finds no save for
+STALE_AFTER seconds fails the batch, as reports/jobs.py does for reports:
+
+    jobs/<token>.json       status, per-file results, summary
+    uploads/<token>/<n>     spooled files, removed when the job finishes
+
+Configuration (settings.INVOICE_BATCHES):
+    ROOT:           directory for job state and spooled uploads
+    WORKERS:        batch jobs run at once per process (0 runs jobs inline)
+    PARALLELISM:    files extracted at once per batch (default 4)
+    MAX_FILES:      files per batch (default 50)
+    MAX_FILE_BYTES: size limit per file (default 10 MB)
+    JOB_TTL:        seconds job state is kept (default 86400)
+    STALE_AFTER:    seconds without a heartbeat after which a queued/running
+                    batch is failed, its worker having died (default 900)
+
+A file's MIME type is the upload's content type, or else inferred from its
+first bytes or its name; files of unknown type fail without a request.
+"""
+
+import hashlib
+import json
+import logging
+import mimetypes
+import os
+import secrets
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connections, transaction
+
+from reports.jobs import (
+    DEFAULT_STALE_AFTER, PURGE_INTERVAL, STATUS_DONE, STATUS_FAILED, STATUS_QUEUED, STATUS_RUNNING,
+    ReportJobStore, is_stale,
+)
+
+from .ai_service import parse_extraction
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WORKERS = 2
+DEFAULT_PARALLELISM = 4
+DEFAULT_MAX_FILES = 50
+DEFAULT_MAX_FILE_BYTES = 10 * 1024 * 1024
+DEFAULT_JOB_TTL = 24 * 60 * 60
+
+# Per-file outcomes
+FILE_PENDING = 'pending'
+FILE_EXTRACTED = 'extracted'
+FILE_DUPLICATE = 'duplicate'
+FILE_FAILED = 'failed'
+
+BULK_BATCH_SIZE = 500
+
+# RATE_LIMIT answers are retried this often, waiting retryAfter seconds (capped)
+RATE_LIMIT_RETRIES = 3
+RATE_LIMIT_DEFAULT_WAIT = 5
+RATE_LIMIT_MAX_WAIT = 60
+
+GENERIC_MIME_TYPES = {'', 'application/octet-stream', 'binary/octet-stream'}
+# Leading bytes of the file types invoices arrive as
+FILE_SIGNATURES = (
+    (b'%PDF', 'application/pdf'),
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'GIF87a', 'image/gif'),
+    (b'GIF89a', 'image/gif'),
+)
+
+# Extraction keys stored in ExtractedInvoice columns; everything else goes to
+# additional_fields
+EXTRACTED_INVOICE_FIELDS = {
+    'Voucher Date': 'voucher_date',
+    'Invoice Number': 'invoice_number',
+    'Purchase Order No.': 'po_number',
+    'PO Date': 'po_date',
+    'Supplier Name': 'supplier_name',
+    'Supplier Address - Bill from': 'bill_from_address',
+    'Supplier Address - Ship from': 'ship_from_address',
+    'Email': 'email',
+    'Email ID': 'email',
+    'Phone Number': 'phone',
+    'Sales Person': 'sales_person',
+    'GSTIN': 'gstin',
+    'PAN': 'pan',
+    'MSME Number': 'msme_number',
+    'Mode/Terms of Payment': 'payment_terms',
+    'Terms of Delivery': 'delivery_terms',
+    'Ledger Amount': 'ledger_amount',
+    'Ledger Rate': 'ledger_rate',
+    'Ledger Amount Dr/Cr': 'ledger_dr_cr',
+    'Ledger Narration': 'ledger_narration',
+    'Description of Ledger': 'ledger_description',
+    'Type of Tax Payment': 'tax_payment_type',
+    'Item Code': 'item_code',
+    'Item/Description': 'item_description',
+    'Quantity': 'quantity',
+    'Quantity UOM': 'uom',
+    'Item Rate': 'item_rate',
+    'Disc%': 'discount_pct',
+    'Item Amount': 'item_amount',
+    'Marks': 'marks',
+    'No. of Packages': 'num_packages',
+    'Freight Charges': 'freight_charges',
+    'HSN/SAC Details': 'hsn_sac',
+    'GST Rate': 'gst_rate',
+    'IGST Amount': 'igst_amount',
+    'CGST Amount': 'cgst_amount',
+    'SGST/UTGST Amount': 'sgst_amount',
+    'Cess Rate': 'cess_rate',
+    'Cess Amount': 'cess_amount',
+    'State Cess Rate': 'state_cess_rate',
+    'State Cess Amount': 'state_cess_amount',
+    'Applicable for Reverse Charge': 'reverse_charge',
+    'Taxable Value': 'taxable_value',
+    'Invoice Value': 'invoice_value',
+}
+
+
+class UploadTooLarge(Exception):
+    """An uploaded file exceeds MAX_FILE_BYTES"""
+
+
+def guess_mime_type(name, path):
+    """MIME type of a spooled upload from its first bytes, else its name; None if unknown"""
+    with open(path, 'rb') as f:
+        head = f.read(16)
+    for signature, mime_type in FILE_SIGNATURES:
+        if head.startswith(signature):
+            return mime_type
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'image/webp'
+    return mimetypes.guess_type(name or '')[0]
+
+
+def build_extracted_invoice(tenant_id, data, source):
+    """Unsaved ExtractedInvoice for one extracted invoice dict"""
+    from accounting.models import ExtractedInvoice
+
+    fields = {}
+    additional = {}
+    for key, value in data.items():
+        if value in (None, ''):
+            continue
+        field_name = EXTRACTED_INVOICE_FIELDS.get(key)
+        if field_name is None:
+            additional[key] = value
+            continue
+        value = json.dumps(value) if isinstance(value, (list, dict)) else str(value)
+        max_length = ExtractedInvoice._meta.get_field(field_name).max_length
+        if max_length and len(value) > max_length:
+            additional[key] = value  # Keep the full value
+            value = value[:max_length]
+        fields[field_name] = value
+    additional.update(source)
+    return ExtractedInvoice(tenant_id=tenant_id, additional_fields=additional, **fields)
+
+
+class InvoiceBatchStore(ReportJobStore):
+    """Report job store plus a spool directory per batch"""
+
+    def __init__(self, root):
+        super().__init__(root)
+        self.uploads_dir = os.path.join(root, 'uploads')
+        os.makedirs(self.uploads_dir, exist_ok=True)
+
+    def upload_dir(self, token):
+        return os.path.join(self.uploads_dir, token)
+
+    def spool(self, token, index, uploaded_file, max_bytes):
+        """
+        Copy an upload to disk chunk by chunk, hashing as it goes.
+
+        Returns:
+            (path, md5 hex, size)
+
+        Raises:
+            UploadTooLarge
+        """
+        directory = self.upload_dir(token)
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, str(index))
+        digest = hashlib.md5()
+        size = 0
+        with open(path, 'wb') as f:
+            for chunk in uploaded_file.chunks():
+                size += len(chunk)
+                if size > max_bytes:
+                    break
+                digest.update(chunk)
+                f.write(chunk)
+        if size > max_bytes:
+            os.remove(path)
+            raise UploadTooLarge(f'File is larger than {max_bytes // (1024 * 1024)} MB')
+        return path, digest.hexdigest(), size
+
+    def discard_uploads(self, token):
+        shutil.rmtree(self.upload_dir(token), ignore_errors=True)
+
+    def purge(self, max_age):
+        """Job files older than max_age, plus upload directories left by dead jobs"""
+        removed = super().purge(max_age)
+        cutoff = time.time() - max_age
+        for entry in os.scandir(self.uploads_dir):
+            try:
+                if entry.is_dir() and entry.stat().st_mtime < cutoff:
+                    shutil.rmtree(entry.path, ignore_errors=True)
+                    removed += 1
+            except FileNotFoundError:
+                pass
+        return removed
+
+
+class InvoiceBatchQueue:
+    """In-process runner for invoice batches over an InvoiceBatchStore"""
+
+    def __init__(self, store, workers=DEFAULT_WORKERS, parallelism=DEFAULT_PARALLELISM,
+                 max_files=DEFAULT_MAX_FILES, max_file_bytes=DEFAULT_MAX_FILE_BYTES, job_ttl=DEFAULT_JOB_TTL,
+                 stale_after=DEFAULT_STALE_AFTER):
+        self.store = store
+        self.workers = workers
+        self.parallelism = parallelism
+        self.max_files = max_files
+        self.max_file_bytes = max_file_bytes
+        self.job_ttl = job_ttl
+        self.stale_after = stale_after
+        self._executor = None
+        self._lock = threading.Lock()
+        self._last_purge = 0
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='invoice-batch')
+            return self._executor
+
+    def _maybe_purge(self):
+        now = time.time()
+        if now - self._last_purge < PURGE_INTERVAL:
+            return
+        self._last_purge = now
+        try:
+            removed = self.store.purge(self.job_ttl)
+            if removed:
+                logger.info(f"Purged {removed} expired invoice batch files")
+        except OSError as e:
+            logger.warning(f"Invoice batch purge failed: {e}")
+
+    def submit(self, tenant_id, user_id, uploaded_files):
+        """
+        Spool the uploads and queue their extraction.
+
+        Returns:
+            dict: job state
+
+        Raises:
+            ValueError: No files, or more than max_files
+        """
+        if not uploaded_files:
+            raise ValueError('No files provided.')
+        if len(uploaded_files) > self.max_files:
+            raise ValueError(f'At most {self.max_files} files per batch.')
+
+        self._maybe_purge()
+
+        token = secrets.token_urlsafe(24)
+        files = []
+        for index, uploaded_file in enumerate(uploaded_files):
+            entry = {
+                'name': uploaded_file.name,
+                'mime_type': uploaded_file.content_type or 'application/octet-stream',
+                'size': None,
+                'file_hash': None,
+                'status': FILE_PENDING,
+                'error': None,
+                'invoices': 0,
+            }
+            try:
+                path, entry['file_hash'], entry['size'] = self.store.spool(
+                    token, index, uploaded_file, self.max_file_bytes
+                )
+            except UploadTooLarge as e:
+                entry['status'], entry['error'] = FILE_FAILED, str(e)
+            else:
+                if entry['mime_type'] in GENERIC_MIME_TYPES:
+                    entry['mime_type'] = guess_mime_type(uploaded_file.name, path)
+                if entry['mime_type'] is None:
+                    entry['status'], entry['error'] = FILE_FAILED, 'Unsupported file type'
+            files.append(entry)
+
+        job = {
+            'token': token,
+            'tenant_id': str(tenant_id),
+            'user_id': str(user_id),
+            'status': STATUS_QUEUED,
+            'files': files,
+            'summary': None,
+            'error': None,
+            'created_at': time.time(),
+        }
+        self.store.save(job)
+
+        if self.workers > 0:
+            self._get_executor().submit(self._run_in_worker, token)
+        else:
+            self.run(token)
+        return self.store.get(token)
+
+    def _run_in_worker(self, token):
+        try:
+            self.run(token)
+        finally:
+            # Worker threads own their DB connections
+            connections.close_all()
+
+    def _extract(self, job, index):
+        """One upstream (or cached) extraction; returns (invoice dicts, error)"""
+        from core.ai_proxy import ai_service
+        from core.ai_service import INVOICE_EXTRACTION_PROMPT
+
+        entry = job['files'][index]
+        request_data = {
+            'prompt': INVOICE_EXTRACTION_PROMPT,
+            'file_hash': entry['file_hash'],
+            'mime_type': entry['mime_type'],
+            'image_path': os.path.join(self.store.upload_dir(job['token']), str(index)),
+        }
+        try:
+            for attempt in range(RATE_LIMIT_RETRIES + 1):
+                result = ai_service.make_request(
+                    'invoice', request_data, job['user_id'], job['tenant_id'], user_rate_limit=False
+                )
+                if result.get('code') != 'RATE_LIMIT' or attempt == RATE_LIMIT_RETRIES:
+                    break
+                wait = min(result.get('retryAfter') or RATE_LIMIT_DEFAULT_WAIT, RATE_LIMIT_MAX_WAIT)
+                logger.info(f"Invoice batch {job['token']}: {entry['name']} rate limited, retrying in {wait}s")
+                time.sleep(wait)
+            if 'error' in result:
+                return None, result['error']
+            return parse_extraction(result['reply']), None
+        except Exception as e:
+            logger.warning(f"Invoice batch {job['token']}: {entry['name']} failed: {e}")
+            return None, str(e)
+        finally:
+            connections.close_all()
+
+    def run(self, token):
+        """Extract a queued batch and store its invoices."""
+        from accounting.models import ExtractedInvoice
+
+        job = self.store.get(token)
+        if job is None or job['status'] != STATUS_QUEUED:
+            return
+
+        job['status'] = STATUS_RUNNING
+        self.store.save(job)
+        started = time.time()
+        files = job['files']
+
+        try:
+            # First file per hash is extracted; repeats point at it
+            first_by_hash = {}
+            for index, entry in enumerate(files):
+                if entry['status'] != FILE_PENDING:
+                    continue
+                first = first_by_hash.setdefault(entry['file_hash'], index)
+                if first != index:
+                    entry['status'], entry['duplicate_of'] = FILE_DUPLICATE, first
+
+            already_extracted = set(
+                ExtractedInvoice.objects.filter(
+                    tenant_id=job['tenant_id'], additional_fields__file_hash__in=list(first_by_hash)
+                ).values_list('additional_fields__file_hash', flat=True)
+            )
+            pending = []
+            for file_hash, index in first_by_hash.items():
+                if file_hash in already_extracted:
+                    files[index]['status'] = FILE_DUPLICATE
+                    files[index]['error'] = 'Already extracted'
+                else:
+                    pending.append(index)
+
+            rows = []
+            with ThreadPoolExecutor(max_workers=self.parallelism, thread_name_prefix='invoice-extract') as pool:
+                outcomes = pool.map(lambda index: self._extract(job, index), pending)
+                for index, (invoices, error) in zip(pending, outcomes):
+                    entry = files[index]
+                    if error is not None:
+                        entry['status'], entry['error'] = FILE_FAILED, error
+                    else:
+                        entry['status'], entry['invoices'] = FILE_EXTRACTED, len(invoices)
+                        source = {'file_hash': entry['file_hash'], 'source_file': entry['name'], 'batch': token}
+                        rows.extend(build_extracted_invoice(job['tenant_id'], data, source) for data in invoices)
+                    # Heartbeat (see get), and progress for polls
+                    self.store.save(job)
+
+            with transaction.atomic():
+                ExtractedInvoice.objects.bulk_create(rows, batch_size=BULK_BATCH_SIZE)
+
+            elapsed = time.time() - started
+            job['summary'] = {
+                'files': len(files),
+                'extracted': sum(entry['status'] == FILE_EXTRACTED for entry in files),
+                'duplicates': sum(entry['status'] == FILE_DUPLICATE for entry in files),
+                'failed': sum(entry['status'] == FILE_FAILED for entry in files),
+                'invoices_created': len(rows),
+                'elapsed_seconds': round(elapsed, 2),
+            }
+            job['status'] = STATUS_DONE
+            logger.info(f"Invoice batch {token}: {job['summary']}")
+        except Exception as e:
+            logger.exception(f"Invoice batch {token} failed")
+            job['status'] = STATUS_FAILED
+            job['error'] = str(e)
+        finally:
+            self.store.discard_uploads(token)
+
+        self.store.save(job)
+
+    def get(self, token, tenant_id):
+        """Return a batch visible to tenant_id, or None"""
+        job = self.store.get(token)
+        if job is None or job['tenant_id'] != str(tenant_id):
+            return None
+        if is_stale(job, self.stale_after):
+            self._fail_stale(job)
+        return job
+
+    def _fail_stale(self, job):
+        """Fail a batch whose worker stopped saving it; nothing was stored, so it can be uploaded again"""
+        logger.warning(f"Invoice batch {job['token']} stale since {job['updated_at']:.0f}, failing it")
+        job['status'] = STATUS_FAILED
+        job['error'] = 'The batch stopped before it finished. Please upload the files again.'
+        self.store.save(job)
+        self.store.discard_uploads(job['token'])
+
+
+_queue = None
+_queue_lock = threading.Lock()
+
+
+def get_invoice_batch_queue():
+    """Process-wide queue built from settings.INVOICE_BATCHES on first use"""
+    global _queue
+    with _queue_lock:
+        if _queue is None:
+            config = getattr(settings, 'INVOICE_BATCHES', {})
+            root = config.get('ROOT') or os.path.join(settings.BASE_DIR, 'invoice_batches')
+            _queue = InvoiceBatchQueue(
+                InvoiceBatchStore(root),
+                workers=config.get('WORKERS', DEFAULT_WORKERS),
+                parallelism=config.get('PARALLELISM', DEFAULT_PARALLELISM),
+                max_files=config.get('MAX_FILES', DEFAULT_MAX_FILES),
+                max_file_bytes=config.get('MAX_FILE_BYTES', DEFAULT_MAX_FILE_BYTES),
+                job_ttl=config.get('JOB_TTL', DEFAULT_JOB_TTL),
+                stale_after=config.get('STALE_AFTER', DEFAULT_STALE_AFTER),
+            )
+        return _queue
@@ -0,0 +1,27 @@
+# Generated by Django 5.0.14 on 2026-10-17 18:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_delete_module_delete_role_delete_rolemodule_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TenantSequence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tenant_id', models.CharField(max_length=36)),
+                ('name', models.CharField(max_length=100)),
+                ('current_number', models.PositiveBigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True, null=True)),
+            ],
+            options={
+                'db_table': 'tenant_sequences',
+                'unique_together': {('tenant_id', 'name')},
+            },
+        ),
+    ]
@@ -109,3 +109,21 @@ class CompanyFullInfo(BaseModel):
 
     class Meta:
         db_table = 'company_informations'
+
+
+class TenantSequence(models.Model):
+    """
+    Per-tenant document number series (customer codes, quotations, invoices, ...).
+    current_number is the last number issued; see core.sequences.next_tenant_number.
+    """
+    tenant_id = models.CharField(max_length=36)
+    name = models.CharField(max_length=100)
+    current_number = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True, null=True, blank=True)
+
+    class Meta:
+        db_table = 'tenant_sequences'
+        unique_together = ('tenant_id', 'name')
+
+    def __str__(self):
+        return f"{self.name} ({self.tenant_id}): {self.current_number}"
@@ -0,0 +1,222 @@
+"""
+Sequences - Atomic document number counters (vouchers, quotations, POs).
+
+Numbering series keep their counter in the series row itself
+(voucher_configurations.current_number, ...). Reading the counter,
+incrementing it in Python and saving raced: two requests could be handed the
+same number, or one increment could overwrite another. SELECT ... FOR UPDATE
+fixes that by serializing every posting on one hot row. SequenceAllocator
+instead increments in one statement and reads the new value back on the same
+connection, so nothing is read before it is written:
+
+    UPDATE <table> SET <column> = <column> + n WHERE id = %s ... RETURNING <column>
+
+MySQL has no UPDATE ... RETURNING, so there the statement assigns
+LAST_INSERT_ID(<column> + n) and the value is read with SELECT LAST_INSERT_ID(),
+which is per connection. Other backends UPDATE then SELECT in one transaction.
+
+High-volume series can reserve a block of numbers per round trip
+(settings.SEQUENCES['BLOCK_SIZES']). The rest of the block stays in process
+memory and is handed out without touching the database. Numbers reserved
+inside a transaction are only added to that pool once it commits, so a
+rollback, which also undoes the counter, never leaves a number that can be
+issued twice. Numbers still pooled when a process exits are never issued, so
+block sizes above 1 leave gaps and are not for series that must be gapless.
+With blocks, numbers are unique but no longer increase across processes.
+
+Allocators hand out raw counter values: the value of the column right after
+it was incremented. Series whose counter holds the *next* number to issue
+subtract one.
+
+Series without a configuration row of their own (customer codes, quotation,
+order and invoice numbers, ...) live in tenant_sequences, one row per
+(tenant, series), through next_tenant_number. The row is created on first
+use, seeded from the last code already issued, so switching a series from
+"parse the latest row" over to the table continues the existing numbering.
+
+Configuration (settings.SEQUENCES):
+    BLOCK_SIZES: {db_table: numbers reserved per round trip} (default 1)
+"""
+
+import os
+import re
+import threading
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.utils import timezone
+
+from core.models import TenantSequence
+
+# (alias, table, column, row id, tenant id) -> [[next, last], ...] reserved but not issued yet
+_blocks = {}
+_blocks_pid = os.getpid()
+_blocks_lock = threading.Lock()
+
+
+def get_block_size(table):
+    return getattr(settings, 'SEQUENCES', {}).get('BLOCK_SIZES', {}).get(table, 1)
+
+
+def format_number(number, prefix='', digits=0, suffix=''):
+    """PREFIX + zero-padded number + SUFFIX, as every numbering series formats them"""
+    return f"{prefix or ''}{str(number).zfill(digits or 0)}{suffix or ''}"
+
+
+def _pool():
+    """Reserved blocks of this process (a forked child must not reuse its parent's)"""
+    global _blocks, _blocks_pid
+    if _blocks_pid != os.getpid():
+        _blocks, _blocks_pid = {}, os.getpid()
+    return _blocks
+
+
+class SequenceAllocator:
+    """
+    Counter column of one table, incremented atomically.
+
+    Args:
+        table: Table holding the series rows
+        column: Counter column
+        touch: Timestamp column set on every increment (e.g. 'updated_at')
+        block_size: Numbers reserved per round trip (default from settings)
+        using: Database alias
+    """
+
+    def __init__(self, table, column='current_number', touch=None, block_size=None, using=DEFAULT_DB_ALIAS):
+        self.table = table
+        self.column = column
+        self.touch = touch
+        self.block_size = block_size
+        self.using = using
+
+    def next(self, row_id, tenant_id=None):
+        """Next counter value of a row, or None if there is no such row"""
+        numbers = self.allocate(row_id, 1, tenant_id=tenant_id)
+        return numbers[0] if numbers else None
+
+    def allocate(self, row_id, count=1, tenant_id=None):
+        """
+        Reserve `count` counter values of a row.
+
+        Args:
+            row_id: Primary key of the series row
+            count: How many values to take
+            tenant_id: Also require the row to belong to this tenant
+
+        Returns:
+            List of values (ascending within each reserved block), or None if no row matched
+        """
+        key = (self.using, self.table, self.column, row_id, tenant_id)
+        numbers = []
+        with _blocks_lock:
+            blocks = _pool().get(key, [])
+            while blocks and len(numbers) < count:
+                block = blocks[0]
+                take = min(count - len(numbers), block[1] - block[0] + 1)
+                numbers.extend(range(block[0], block[0] + take))
+                block[0] += take
+                if block[0] > block[1]:
+                    blocks.pop(0)
+
+        remaining = count - len(numbers)
+        if remaining:
+            reserve = max(remaining, self.block_size or get_block_size(self.table))
+            last = self._increment(row_id, reserve, tenant_id)
+            if last is None:
+                return None
+            first = last - reserve + 1
+            numbers.extend(range(first, first + remaining))
+            if reserve > remaining:
+                spare = [first + remaining, last]
+                transaction.on_commit(lambda: self._release(key, spare), using=self.using)
+        return numbers
+
+    def _release(self, key, block):
+        with _blocks_lock:
+            _pool().setdefault(key, []).append(block)
+
+    def _increment(self, row_id, count, tenant_id):
+        connection = connections[self.using]
+        quote = connection.ops.quote_name
+        table, column = quote(self.table), quote(self.column)
+
+        assignments, params = [], []
+        if connection.vendor == 'mysql':
+            assignments.append(f"{column} = LAST_INSERT_ID({column} + %s)")
+        else:
+            assignments.append(f"{column} = {column} + %s")
+        params.append(count)
+        if self.touch:
+            assignments.append(f"{quote(self.touch)} = %s")
+            params.append(connection.ops.adapt_datetimefield_value(timezone.now()))
+
+        where = "id = %s"
+        params.append(row_id)
+        if tenant_id is not None:
+            where += " AND tenant_id = %s"
+            params.append(tenant_id)
+        update = f"UPDATE {table} SET {', '.join(assignments)} WHERE {where}"
+
+        with connection.cursor() as cursor:
+            if connection.vendor == 'mysql':
+                cursor.execute(update, params)
+                if cursor.rowcount == 0:
+                    return None
+                cursor.execute("SELECT LAST_INSERT_ID()")
+                return cursor.fetchone()[0]
+            if connection.vendor in ('postgresql', 'sqlite') and connection.features.can_return_columns_from_insert:
+                # PostgreSQL and SQLite 3.35+ support UPDATE ... RETURNING
+                cursor.execute(f"{update} RETURNING {column}", params)
+                row = cursor.fetchone()
+                return row[0] if row else None
+            with transaction.atomic(using=self.using):
+                cursor.execute(update, params)
+                if cursor.rowcount == 0:
+                    return None
+                cursor.execute(f"SELECT {column} FROM {table} WHERE id = %s", [row_id])
+                return cursor.fetchone()[0]
+
+
+# ============================================================================
+# PER-TENANT SERIES
+# ============================================================================
+
+tenant_numbers = SequenceAllocator(TenantSequence._meta.db_table, touch='updated_at')
+
+# (tenant_id, series name) -> tenant_sequences.id
+_series_ids = {}
+
+
+def last_number(code):
+    """Trailing number of an issued code ('SQ-2025-00042' -> 42); 0 for none"""
+    match = re.search(r'(\d+)$', code or '')
+    return int(match.group(1)) if match else 0
+
+
+def next_tenant_number(tenant_id, name, seed=None):
+    """
+    Next number of a per-tenant series, one atomic UPDATE per call.
+
+    Args:
+        tenant_id: Tenant identifier
+        name: Series name, e.g. 'customer_code'
+        seed: Called only when the series row is created; returns the last
+            number already in use
+    """
+    key = (tenant_id, name)
+    for _ in range(2):
+        row_id = _series_ids.get(key)
+        if row_id is None:
+            sequence, _ = TenantSequence.objects.get_or_create(
+                tenant_id=tenant_id, name=name, defaults={'current_number': seed or 0}
+            )
+            row_id = sequence.id
+            # A row created in a transaction that rolls back must not stay cached
+            transaction.on_commit(lambda: _series_ids.__setitem__(key, sequence.id))
+        number = tenant_numbers.next(row_id, tenant_id)
+        if number is not None:
+            return number
+        # The cached row was deleted
+        _series_ids.pop(key, None)
+    raise TenantSequence.DoesNotExist(f"Sequence {name} for tenant {tenant_id} could not be created")
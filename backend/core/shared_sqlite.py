@@ -0,0 +1,45 @@
+"""
+Shared SQLite - Connections to a SQLite file used by every worker process
+Base of the AI result cache (core/ai_cache.py) and the AI rate limiter and
+circuit breaker (core/ai_limits.py).
+
+The file runs in WAL mode, so readers don't block the writer, and with a
+busy timeout, so concurrent writers wait instead of failing. sqlite3
+connections can't be shared between threads or carried across a fork, so
+each thread of each process opens its own.
+"""
+
+import os
+import sqlite3
+import threading
+
+# Seconds a writer waits for another process's write lock
+BUSY_TIMEOUT = 5
+
+
+class SharedState:
+    """Per-thread (and per-process) connections to the shared SQLite file"""
+
+    # CREATE statements run once when an instance opens the file
+    schema = ()
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = self._connect()
+        for statement in self.schema:
+            conn.execute(statement)
+
+    def _connect(self):
+        """Connection for this thread (and process; connections do not survive fork)"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
@@ -4,20 +4,37 @@ Centralized tenant management logic.
 """
 
 from django.http import JsonResponse
-from .auth import CustomJWTAuthentication
+from .auth import CustomJWTAuthentication, get_django_request
+
+
+# Attribute on the Django HttpRequest holding the resolved tenant id
+REQUEST_TENANT_ATTR = '_resolved_tenant_id'
 
 
 def get_tenant_from_request(request):
     """
     Extract tenant_id from request.
     Checks header X-Tenant-ID first, then JWT claim 'tenant_id'.
+    The result is memoized on the request, so repeated calls from middleware,
+    decorators and views resolve the tenant only once.
     
     Args:
-        request: Django request object
+        request: Django or DRF request object
     
     Returns:
         str or None: Tenant ID if found, None otherwise
     """
+    django_request = get_django_request(request)
+    if hasattr(django_request, REQUEST_TENANT_ATTR):
+        return getattr(django_request, REQUEST_TENANT_ATTR)
+
+    tenant_id = _resolve_tenant(request)
+    setattr(django_request, REQUEST_TENANT_ATTR, tenant_id)
+    return tenant_id
+
+
+def _resolve_tenant(request):
+    """Resolve tenant_id from header, authenticated token or raw cookie."""
     # 1. Check header override (useful for testing/Postman)
     header_tid = request.META.get('HTTP_X_TENANT_ID')
     if header_tid:
@@ -0,0 +1,46 @@
+"""
+Test helpers shared by the apps' test modules.
+
+Tests that touch the AI proxy, or save vouchers and masters (whose signals
+drop the tenant's cached agent context), point the host-wide SQLite stores
+at temporary files with these instead of writing BASE_DIR/ai_*.sqlite3.
+"""
+
+from unittest.mock import patch
+
+
+def temp_dir(test_case):
+    """A temporary directory removed when the test finishes"""
+    import tempfile
+
+    tmp = tempfile.TemporaryDirectory()
+    test_case.addCleanup(tmp.cleanup)
+    return tmp.name
+
+
+def use_temp_ai_limits(test_case, directory=None):
+    """Point the proxy's shared rate limiter and circuit breaker at a temporary file"""
+    from core.ai_limits import CircuitBreaker, RateLimiter
+
+    path = f'{directory or temp_dir(test_case)}/limits.sqlite3'
+    for target, value in (('core.ai_proxy.get_rate_limiter', RateLimiter(path)),
+                          ('core.ai_proxy.get_circuit_breaker', CircuitBreaker(path))):
+        limits_patch = patch(target, return_value=value)
+        limits_patch.start()
+        test_case.addCleanup(limits_patch.stop)
+
+
+# The proxy, and the signal that drops a tenant's agent context on writes
+AI_CACHE_TARGETS = ('core.ai_proxy.get_ai_result_cache', 'core.ai_context.get_ai_result_cache')
+
+
+def use_temp_ai_cache(test_case, *targets):
+    """Point get_ai_result_cache (AI_CACHE_TARGETS by default) at one fresh cache in a temporary file"""
+    from core.ai_cache import AIResultCache
+
+    cache = AIResultCache(f'{temp_dir(test_case)}/ai.sqlite3')
+    for target in targets or AI_CACHE_TARGETS:
+        cache_patch = patch(target, return_value=cache)
+        cache_patch.start()
+        test_case.addCleanup(cache_patch.stop)
+    return cache
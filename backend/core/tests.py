@@ -1,3 +1,942 @@
-from django.test import TestCase
+from unittest.mock import patch, MagicMock
 
-# Create your tests here.
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, RequestFactory, override_settings
+from rest_framework.request import Request
+from rest_framework_simplejwt.tokens import AccessToken
+
+from core.auth import CustomJWTAuthentication
+from core.models import User
+from core.testing import temp_dir, use_temp_ai_cache, use_temp_ai_limits
+from core.tenant import get_tenant_from_request
+from core.user_cache import user_identity_cache, get_cached_user
+
+
+class RequestScopedAuthenticationTest(SimpleTestCase):
+    def setUp(self):
+        token = AccessToken()
+        token['user_id'] = 1
+        token['tenant_id'] = 'tenant-1'
+        self.request = RequestFactory().get('/api/masters/ledgers/')
+        self.request.COOKIES['access_token'] = str(token)
+
+    @patch.object(CustomJWTAuthentication, 'get_user')
+    def test_token_and_user_resolved_once_per_request(self, mock_get_user):
+        mock_get_user.return_value = MagicMock(tenant_id='tenant-1')
+
+        # Middleware path, then DRF path on the wrapped request, then views
+        self.assertEqual(get_tenant_from_request(self.request), 'tenant-1')
+        drf_request = Request(self.request)
+        user, token = CustomJWTAuthentication().authenticate(drf_request)
+        self.assertEqual(get_tenant_from_request(drf_request), 'tenant-1')
+
+        self.assertEqual(token['tenant_id'], 'tenant-1')
+        self.assertIs(user, mock_get_user.return_value)
+        self.assertEqual(mock_get_user.call_count, 1)
+
+    @patch.object(CustomJWTAuthentication, 'get_validated_token')
+    def test_missing_token_is_memoized(self, mock_validate):
+        request = RequestFactory().get('/api/health/')
+        auth = CustomJWTAuthentication()
+
+        self.assertIsNone(auth.authenticate(request))
+        self.assertIsNone(auth.authenticate(Request(request)))
+        mock_validate.assert_not_called()
+
+
+class UserIdentityCacheTest(TestCase):
+    def setUp(self):
+        user_identity_cache.clear()
+        self.user = User.objects.create_user(
+            username='owner', password='secret', tenant_id='tenant-1'
+        )
+
+    def test_identity_served_from_cache(self):
+        get_cached_user(User, self.user.id)
+        with self.assertNumQueries(0):
+            user = get_cached_user(User, str(self.user.id))
+        self.assertEqual(user.tenant_id, 'tenant-1')
+        self.assertTrue(user.is_active)
+
+    def test_profile_fields_need_no_query(self):
+        User.objects.filter(id=self.user.id).update(company_name='Owner Co', selected_plan='Pro')
+        get_cached_user(User, self.user.id)
+        with self.assertNumQueries(0):
+            user = get_cached_user(User, self.user.id)
+            self.assertEqual((user.username, user.company_name, user.selected_plan), ('owner', 'Owner Co', 'Pro'))
+        self.assertIn('password', user.get_deferred_fields())
+
+    def test_deactivation_evicts_identity(self):
+        get_cached_user(User, self.user.id)
+        self.user.is_active = False
+        self.user.save()
+        with self.assertNumQueries(1):
+            user = get_cached_user(User, self.user.id)
+        self.assertFalse(user.is_active)
+
+
+class FakeGeminiClient:
+    """Stands in for GeminiClient: scripted outcomes per prompt, records calls"""
+
+    def __init__(self, outcomes=None, delay=0, missing_models=()):
+        self.outcomes = outcomes or {}
+        self.delay = delay
+        self.missing_models = missing_models
+        self.calls = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def generate(self, api_key, model_name, prompt):
+        import asyncio
+
+        self.calls.append((api_key, model_name, prompt))
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.delay)
+            if model_name in self.missing_models:
+                from google.api_core import exceptions
+                raise exceptions.NotFound(model_name)
+            scripted = self.outcomes.get(prompt)
+            outcome = scripted.pop(0) if scripted else f'reply to {prompt}'
+            if isinstance(outcome, Exception):
+                raise outcome
+            return outcome
+        finally:
+            self.in_flight -= 1
+
+    async def generate_stream(self, api_key, model_name, prompt):
+        """Words of the reply; a scripted list of chunks may hold an exception mid-stream"""
+        reply = await self.generate(api_key, model_name, prompt)
+        for chunk in reply if isinstance(reply, list) else reply.split(' '):
+            if isinstance(chunk, Exception):
+                raise chunk
+            yield chunk if isinstance(reply, list) else chunk + ' '
+
+
+class AIExecutionEngineTest(SimpleTestCase):
+    def engine(self, client, **kwargs):
+        from core.ai_engine import AIExecutionEngine
+
+        key_manager = MagicMock()
+        key_manager.get_healthy_key.return_value = 'key-1'
+        kwargs.setdefault('max_concurrency', 2)
+        kwargs.setdefault('max_waiting', 10)
+        kwargs.setdefault('request_timeout', 5)
+        return AIExecutionEngine(client, key_manager, models=('model-a', 'model-b'), **kwargs)
+
+    def test_requests_beyond_concurrency_wait_in_fifo_order(self):
+        client = FakeGeminiClient(delay=0.05)
+        engine = self.engine(client)
+
+        futures = [engine.submit(f'q{i}') for i in range(6)]
+        self.assertEqual([f.result(timeout=5) for f in futures], [f'reply to q{i}' for i in range(6)])
+        self.assertEqual(client.max_in_flight, 2)
+        self.assertEqual([prompt for _, _, prompt in client.calls], [f'q{i}' for i in range(6)])
+        self.assertEqual((engine.queue.active, engine.queue.size()), (0, 0))
+
+    def test_full_queue_and_deadline(self):
+        from core.ai_engine import DeadlineExceeded, QueueFullError
+
+        client = FakeGeminiClient(delay=0.5)
+        engine = self.engine(client, max_concurrency=1, max_waiting=1)
+
+        running = engine.submit('slow')
+        waiting = engine.submit('queued', timeout=0.1)
+        rejected = engine.submit('rejected')
+        with self.assertRaises(QueueFullError):
+            rejected.result(timeout=5)
+        with self.assertRaises(DeadlineExceeded):
+            waiting.result(timeout=5)
+        self.assertEqual(running.result(timeout=5), 'reply to slow')
+        self.assertEqual([prompt for _, _, prompt in client.calls], ['slow'])
+
+    def test_backoff_does_not_block_other_requests(self):
+        import time
+        from google.api_core import exceptions
+
+        # First request: both models exhausted, then succeeds after backoff
+        client = FakeGeminiClient(outcomes={
+            'first': [exceptions.ResourceExhausted('quota'), exceptions.ResourceExhausted('quota'), 'late']
+        })
+        engine = self.engine(client, max_concurrency=2, base_delay=0.3)
+
+        backing_off = engine.submit('first')
+        time.sleep(0.05)
+        started = time.monotonic()
+        self.assertEqual(engine.run('second'), 'reply to second')
+        self.assertLess(time.monotonic() - started, 0.2)
+        self.assertEqual(backing_off.result(timeout=5), 'late')
+
+    def test_backoff_past_deadline_fails_fast(self):
+        from core.ai_engine import DeadlineExceeded
+        from google.api_core import exceptions
+
+        client = FakeGeminiClient(outcomes={'q': [exceptions.ResourceExhausted('quota')] * 2})
+        engine = self.engine(client, base_delay=30, request_timeout=1)
+        with self.assertRaises(DeadlineExceeded):
+            engine.run('q')
+
+
+    def collect_stream(self, engine, prompt):
+        import asyncio
+
+        async def collect():
+            return [chunk async for chunk in engine.astream(prompt)]
+        return asyncio.run(collect())
+
+    def test_stream_retries_only_before_first_chunk(self):
+        from google.api_core import exceptions
+
+        client = FakeGeminiClient(outcomes={
+            'q': [exceptions.ResourceExhausted('quota'), 'streamed reply'],
+            'broken': [['partial ', exceptions.ServiceUnavailable('reset')]],
+        })
+        engine = self.engine(client)
+        self.assertEqual(self.collect_stream(engine, 'q'), ['streamed ', 'reply '])
+        self.assertEqual([model for _, model, _ in client.calls], ['model-a', 'model-b'])
+
+        client.calls.clear()
+        with self.assertRaises(exceptions.ServiceUnavailable):
+            self.collect_stream(engine, 'broken')
+        self.assertEqual(len(client.calls), 1)
+        self.assertEqual((engine.queue.active, engine.queue.size()), (0, 0))
+
+
+class ModelRegistryTest(SimpleTestCase):
+    def test_dead_models_skipped_until_ttl_expires(self):
+        import time
+        from core.ai_engine import AIExecutionEngine
+
+        key_manager = MagicMock()
+        key_manager.get_healthy_key.return_value = 'key-1'
+        client = FakeGeminiClient(missing_models=('model-a', 'model-b'))
+        engine = AIExecutionEngine(client, key_manager, models=('model-a', 'model-b', 'model-c'))
+
+        engine.run('q1')
+        engine.run('q2')
+        self.assertEqual(
+            [model for _, model, _ in client.calls], ['model-a', 'model-b', 'model-c', 'model-c']
+        )
+
+        # Negative entries expire; the working model stays first
+        later = time.monotonic() + engine.model_registry.unavailable_ttl + 1
+        with patch('core.ai_engine.time.monotonic', return_value=later):
+            self.assertEqual(
+                engine.model_registry.candidates('key-1', engine.models), ['model-c', 'model-a', 'model-b']
+            )
+        self.assertEqual(engine.model_registry.candidates('key-2', engine.models), list(engine.models))
+
+
+class KeyHealthSchedulerTest(SimpleTestCase):
+    def test_one_thread_with_backoff_until_healthy(self):
+        import threading
+        from core.ai_engine import KeyHealthScheduler
+
+        healthy = threading.Event()
+        probes = []
+
+        def probe(api_key):
+            probes.append(api_key)
+            if len(probes) < 3:
+                raise Exception('429')
+
+        scheduler = KeyHealthScheduler(probe, lambda api_key: healthy.set(), interval=0.01, max_interval=0.05)
+        threads_before = threading.active_count()
+        self.assertTrue(scheduler.schedule('key-1'))
+        for _ in range(100):
+            self.assertFalse(scheduler.schedule('key-1'))  # a storm of failures queues one probe
+        self.assertEqual(threading.active_count(), threads_before + 1)
+
+        self.assertTrue(healthy.wait(5))
+        self.assertEqual(probes, ['key-1'] * 3)
+        self.assertEqual(len(scheduler), 0)
+
+    def test_backoff_doubles_up_to_cap(self):
+        from core.ai_engine import KeyHealthScheduler
+
+        scheduler = KeyHealthScheduler(MagicMock(side_effect=Exception('429')), MagicMock(), interval=10, max_interval=30)
+        scheduler._delays['key-1'] = 10
+        delays = []
+        for _ in range(3):
+            scheduler.run_probe('key-1')
+            delays.append(scheduler._delays['key-1'])
+        self.assertEqual(delays, [20, 30, 30])
+        scheduler.on_healthy.assert_not_called()
+
+
+@override_settings(AI_CONTEXT={'ENABLED': False})
+class SingleFlightTest(SimpleTestCase):
+    def setUp(self):
+        use_temp_ai_cache(self)
+        use_temp_ai_limits(self)
+
+    @patch('core.ai_proxy.api_key_manager')
+    def test_identical_concurrent_requests_share_one_upstream_call(self, mock_key_manager):
+        import threading
+        from core.ai_engine import AIExecutionEngine
+        from core.ai_proxy import AIServiceProxy
+
+        mock_key_manager.api_keys = ['key-1']
+        mock_key_manager.get_healthy_key.return_value = 'key-1'
+        client = FakeGeminiClient(delay=0.2)
+        service = AIServiceProxy(AIExecutionEngine(client, mock_key_manager, models=('model-a',)))
+
+        request_data = {'message': 'single flight total sales?', 'contextData': 'tenant-1'}
+        results = []
+
+        def ask(user_id):
+            results.append(service.make_request('agent', request_data, user_id, 'tenant-1'))
+
+        threads = [threading.Thread(target=ask, args=(f'user-{i}',)) for i in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(client.calls), 1)
+        self.assertEqual(len(results), 5)
+        self.assertTrue(all(result == results[0] and 'reply' in result for result in results))
+        self.assertEqual(service.stats['upstream_requests'], 1)
+        self.assertEqual(service.stats['single_flight_shared'], 4)
+        self.assertEqual(len(service.single_flight), 0)
+
+
+@override_settings(AI_CONTEXT={'ENABLED': False})
+class AgentStreamViewTest(SimpleTestCase):
+    def setUp(self):
+        self.cache = use_temp_ai_cache(self)
+        use_temp_ai_limits(self)
+        auth_patch = patch('core.views.CustomJWTAuthentication.authenticate',
+                           return_value=(MagicMock(id=7, tenant_id='t1'), None))
+        auth_patch.start()
+        self.addCleanup(auth_patch.stop)
+
+    def post(self, message):
+        import asyncio
+        import json
+        from django.test import AsyncRequestFactory
+        from core.views import agent_message_stream
+
+        async def call():
+            request = AsyncRequestFactory().post(
+                '/api/ai/agent-message/stream/', {'message': message}, content_type='application/json'
+            )
+            response = await agent_message_stream(request)
+            return response, [chunk.decode() async for chunk in response.streaming_content]
+
+        response, chunks = asyncio.run(call())
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        return [
+            (event.split('\n')[0][len('event: '):], json.loads(event.split('\n')[1][len('data: '):]))
+            for event in chunks
+        ]
+
+    @patch('core.ai_proxy.api_key_manager')
+    def test_streams_chunks_then_caches_reply(self, mock_key_manager):
+        from core.ai_engine import AIExecutionEngine
+        from core.ai_proxy import AIServiceProxy
+
+        mock_key_manager.api_keys = ['key-1']
+        mock_key_manager.get_healthy_key.return_value = 'key-1'
+        client = FakeGeminiClient(outcomes={})
+        service = AIServiceProxy(AIExecutionEngine(client, mock_key_manager, models=('model-a',)))
+
+        with patch('core.views.ai_service', service), patch('core.ai_proxy.build_prompt', side_effect=lambda r: r['message']):
+            events = self.post('hello there')
+            self.assertEqual(events[:-1], [('chunk', {'text': 'reply '}), ('chunk', {'text': 'to '}),
+                                           ('chunk', {'text': 'hello '}), ('chunk', {'text': 'there '})])
+            self.assertEqual(events[-1], ('done', {'reply': 'reply to hello there'}))
+
+            # Repeats are answered from the cache in one event
+            self.assertEqual(self.post('hello there'), [('done', {'reply': 'reply to hello there'})])
+        self.assertEqual(len(client.calls), 1)
+
+    def test_asgi_entrypoint_sends_chunks_before_generation_finishes(self):
+        import asyncio
+        import json
+        from backend.asgi import application
+
+        async def call():
+            first_chunk_sent = asyncio.Event()
+            sent = []
+
+            async def astream_request(*args):
+                yield {'chunk': 'first '}
+                # Generation only finishes once the first chunk reached the client
+                await asyncio.wait_for(first_chunk_sent.wait(), timeout=5)
+                yield {'reply': 'first second'}
+
+            requests = [{'type': 'http.request', 'body': json.dumps({'message': 'hi'}).encode()}]
+
+            async def receive():
+                if requests:
+                    return requests.pop()
+                await asyncio.Event().wait()  # The client stays connected
+
+            async def send(message):
+                sent.append(message)
+                if b'event: chunk' in message.get('body', b''):
+                    first_chunk_sent.set()
+
+            scope = {
+                'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'POST',
+                'scheme': 'http', 'path': '/api/ai/agent-message/stream/', 'raw_path': b'/api/ai/agent-message/stream/',
+                'query_string': b'', 'root_path': '', 'server': ('testserver', 80), 'client': ('127.0.0.1', 1),
+                'headers': [(b'host', b'testserver'), (b'content-type', b'application/json')],
+            }
+            with patch('core.views.ai_service', MagicMock(astream_request=astream_request)):
+                await application(scope, receive, send)
+            return sent
+
+        sent = asyncio.run(call())
+        bodies = [message['body'] for message in sent if message['type'] == 'http.response.body' and message.get('body')]
+        self.assertEqual(sent[0]['status'], 200)
+        self.assertTrue(bodies[0].startswith(b'event: chunk'), bodies)
+        self.assertTrue(bodies[1].startswith(b'event: done'), bodies)
+
+
+class AsyncAIViewTest(SimpleTestCase):
+    """AgentMessageView and AIProxyView await amake_request"""
+
+    def setUp(self):
+        from unittest.mock import AsyncMock
+
+        auth_patch = patch('core.views.CustomJWTAuthentication.authenticate',
+                           return_value=(MagicMock(id=7, tenant_id='t1', is_staff=False), None))
+        auth_patch.start()
+        self.addCleanup(auth_patch.stop)
+        self.service = MagicMock(amake_request=AsyncMock(return_value={'reply': 'hi'}),
+                                 make_request=MagicMock(side_effect=AssertionError('blocking call')))
+        service_patch = patch('core.views.ai_service', self.service)
+        service_patch.start()
+        self.addCleanup(service_patch.stop)
+
+    def call(self, view, request, **kwargs):
+        import asyncio
+        import json
+
+        response = asyncio.run(view(request, **kwargs))
+        return response.status_code, json.loads(response.content)
+
+    def test_agent_message(self):
+        from django.test import AsyncRequestFactory
+        from core.views import AgentMessageView
+
+        request = AsyncRequestFactory().post('/api/agent/message/', {'message': ' hello '},
+                                             content_type='application/json')
+        self.assertEqual(self.call(AgentMessageView.as_view(), request), (200, {'reply': 'hi'}))
+        self.service.amake_request.assert_awaited_once_with(
+            'agent', {'message': 'hello', 'contextData': '', 'useGrounding': False}, '7', 't1'
+        )
+
+        request = AsyncRequestFactory().post('/api/agent/message/', {}, content_type='application/json')
+        self.assertEqual(self.call(AgentMessageView.as_view(), request)[0], 429)
+
+    def test_extract_invoice(self):
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        from django.test import AsyncRequestFactory
+        from core.views import AIProxyView
+
+        upload = SimpleUploadedFile('inv.pdf', b'%PDF-1.4 invoice', content_type='application/pdf')
+        request = AsyncRequestFactory().post('/api/ai/extract-invoice/', {'file': upload})
+        self.assertEqual(self.call(AIProxyView.as_view(), request, action='extract-invoice')[0], 200)
+
+        request_type, request_data = self.service.amake_request.await_args.args[:2]
+        self.assertEqual(request_type, 'invoice')
+        self.assertEqual((request_data['mime_type'], request_data['image_bytes']),
+                         ('application/pdf', b'%PDF-1.4 invoice'))
+
+        request = AsyncRequestFactory().get('/api/ai/stats/')
+        self.assertEqual(self.call(AIProxyView.as_view(), request, action='stats')[0], 403)
+
+
+class AIResultCacheTest(SimpleTestCase):
+    def setUp(self):
+        directory = temp_dir(self)
+        self.path = f'{directory}/ai.sqlite3'
+        use_temp_ai_limits(self, directory)
+
+    def test_shared_between_instances_with_ttl(self):
+        from core.ai_cache import AIResultCache
+
+        writer, reader = AIResultCache(self.path), AIResultCache(self.path)
+        writer.set('k', {'reply': 'hi'}, ttl=60)
+        writer.set('expired', {'reply': 'old'}, ttl=-1)
+        self.assertEqual(reader.get('k'), {'reply': 'hi'})
+        self.assertIsNone(reader.get('expired'))
+        self.assertIsNone(reader.get('missing'))
+
+    def test_lru_eviction_under_caps(self):
+        from core.ai_cache import AIResultCache
+
+        cache = AIResultCache(self.path, max_entries=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        with patch('core.ai_cache.TOUCH_INTERVAL', -1):
+            cache.get('a')  # 'b' is now least recently used
+        cache.set('c', 3)
+        self.assertEqual((cache.get('a'), cache.get('b'), cache.get('c')), (1, None, 3))
+
+        cache = AIResultCache(self.path, max_bytes=10)
+        cache.set('big', 'x' * 20)
+        self.assertIsNone(cache.get('big'))
+
+    @patch('core.ai_proxy.api_key_manager')
+    @override_settings(AI_CONTEXT={'ENABLED': False})
+    def test_known_invoice_never_reaches_gemini(self, mock_key_manager):
+        from core.ai_cache import AIResultCache
+        from core.ai_engine import AIExecutionEngine
+        from core.ai_proxy import AIServiceProxy
+
+        mock_key_manager.api_keys = ['key-1']
+        mock_key_manager.get_healthy_key.return_value = 'key-1'
+        client = FakeGeminiClient(outcomes={
+            'good': ['[{"Invoice Number": "INV-1"}]'],
+            'bad': ['Sorry, I cannot read this.', '[{"Invoice Number": "INV-2"}]'],
+        })
+        with patch('core.ai_proxy.get_ai_result_cache', return_value=AIResultCache(self.path)), \
+                patch('core.ai_proxy.build_prompt', side_effect=lambda r: r['prompt']):
+            for prompt, file_hash in (('good', 'abc123'), ('bad', 'def456')):
+                for user_id in ('user-1', 'user-2'):
+                    service = AIServiceProxy(AIExecutionEngine(client, mock_key_manager, models=('model-a',)))
+                    result = service.make_request('invoice', {'prompt': prompt, 'file_hash': file_hash}, user_id, 't1')
+                    self.assertIn('reply', result)
+        # The unparseable reply was not cached, so its re-upload went upstream
+        self.assertEqual([call[2] for call in client.calls], ['good', 'bad', 'bad'])
+        self.assertIsNotNone(AIResultCache(self.path).get('invoice:abc123'))
+        self.assertEqual(AIResultCache(self.path).get('invoice:def456'), {'reply': '[{"Invoice Number": "INV-2"}]'})
+
+
+def _take_tokens(path, count):
+    from core.ai_limits import RateLimiter
+
+    limiter = RateLimiter(path)
+    return sum(limiter.check_rate_limit('global', 20)['allowed'] for _ in range(count))
+
+
+class AILimitsTest(SimpleTestCase):
+    def setUp(self):
+        self.path = f'{temp_dir(self)}/limits.sqlite3'
+
+    def test_limit_holds_across_processes(self):
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+
+        with ProcessPoolExecutor(4, mp_context=multiprocessing.get_context('fork')) as pool:
+            allowed = sum(pool.map(_take_tokens, [self.path] * 4, [10] * 4))
+        self.assertEqual(allowed, 20)
+
+    def test_token_bucket_refills_and_idle_keys_expire(self):
+        from core.ai_limits import RateLimiter
+
+        limiter = RateLimiter(self.path)
+        now = [1000.0]
+        with patch('core.ai_limits.time.time', side_effect=lambda: now[0]):
+            self.assertTrue(limiter.check_rate_limit('user:a', 2)['allowed'])
+            self.assertTrue(limiter.check_rate_limit('user:a', 2)['allowed'])
+            self.assertEqual(limiter.check_rate_limit('user:a', 2), {'allowed': False, 'retry_after': 30})
+
+            # All-or-nothing: a denied tenant does not use up the user's token
+            limiter.check_rate_limit('tenant:t', 1)
+            result = limiter.check_rate_limits([('user:b', 5), ('tenant:t', 1)])
+            self.assertEqual((result['allowed'], result['key']), (False, 'tenant:t'))
+
+            now[0] += 30
+            self.assertTrue(limiter.check_rate_limit('user:a', 2)['allowed'])
+            self.assertEqual(limiter.check_rate_limits([('user:b', 5)])['allowed'], True)
+
+            now[0] += 120
+            self.assertEqual(limiter.sweep(), 3)
+            self.assertEqual(limiter.size(), 0)
+
+    def test_circuit_breaker_shared(self):
+        from core.ai_limits import CircuitBreaker
+
+        first, second = CircuitBreaker(self.path, failure_threshold=2), CircuitBreaker(self.path, failure_threshold=2)
+        first.record_failure()
+        self.assertFalse(second.is_open())
+        second.record_failure()
+        self.assertTrue(first.is_open())
+        self.assertEqual(first.failures, 2)
+
+        with patch('core.ai_limits.time.time', return_value=10 ** 10):
+            self.assertFalse(second.is_open())
+        self.assertEqual(first.failures, 0)
+
+
+class AgentContextTest(TestCase):
+    tenant_id = 'tenant-1'
+
+    def setUp(self):
+        from datetime import date
+        from decimal import Decimal
+        from accounting.models import VoucherPaymentSingle, VoucherReceiptSingle
+
+        self.cache = use_temp_ai_cache(self)
+
+        for i, party in enumerate(['ABC Ltd', 'ABC Ltd', 'XYZ Traders']):
+            VoucherReceiptSingle.objects.create(
+                tenant_id=self.tenant_id, date=date(2025, 4, 1 + i), voucher_number=f'REC-{i}',
+                receive_from=party, receive_in='Bank', total_receipt=Decimal('100.00')
+            )
+        VoucherPaymentSingle.objects.create(
+            tenant_id='tenant-2', date=date(2025, 4, 2), voucher_number='PAY-X',
+            pay_from='Cash', pay_to='Other', total_payment=Decimal('999.00')
+        )
+        self.today = date(2025, 5, 15)
+
+    def test_summary_and_budget(self):
+        import json
+        from core.ai_context import estimate_tokens, get_agent_context
+
+        context = json.loads(get_agent_context(self.tenant_id, self.today))
+        self.assertEqual(context['currentDate'], '2025-05-15')
+        self.assertEqual(context['totals'], {'Receipt': {'count': 3, 'total': 300.0}})
+        self.assertEqual(context['monthly'], [{'month': '2025-04', 'type': 'Receipt', 'count': 3, 'total': 300.0}])
+        self.assertEqual(
+            context['topParties']['Receipt'],
+            [{'party': 'ABC Ltd', 'count': 2, 'total': 200.0}, {'party': 'XYZ Traders', 'count': 1, 'total': 100.0}]
+        )
+
+        with override_settings(AI_CONTEXT={'TOKEN_BUDGET': 150}):
+            text = get_agent_context(self.tenant_id, self.today)
+        self.assertLessEqual(estimate_tokens(text), 150)
+        self.assertEqual(json.loads(text)['totals'], context['totals'])
+
+    def test_cached_until_voucher_changes(self):
+        import json
+        from datetime import date
+        from decimal import Decimal
+        from accounting.models import VoucherReceiptSingle
+        from core.ai_context import get_agent_context
+
+        get_agent_context(self.tenant_id, self.today)
+        with self.assertNumQueries(0):
+            get_agent_context(self.tenant_id, self.today)
+
+        VoucherReceiptSingle.objects.create(
+            tenant_id=self.tenant_id, date=date(2025, 5, 1), voucher_number='REC-9',
+            receive_from='New Co', receive_in='Bank', total_receipt=Decimal('50.00')
+        )
+        context = json.loads(get_agent_context(self.tenant_id, self.today))
+        self.assertEqual(context['totals']['Receipt'], {'count': 4, 'total': 350.0})
+
+
+class AggregateIntentTest(TestCase):
+    tenant_id = 'tenant-1'
+
+    def setUp(self):
+        from datetime import date
+        from decimal import Decimal
+        from accounting.models import MasterLedger, VoucherReceiptSingle
+        from accounting.models_voucher_sales import VoucherSalesInvoiceDetails, VoucherSalesPaymentDetails
+
+        use_temp_ai_cache(self)
+        for party in ('ABC Ltd', 'XYZ Traders'):
+            MasterLedger.objects.create(tenant_id=self.tenant_id, name=party, group='Sundry Debtors')
+        for i, (party, amount) in enumerate([('ABC Ltd', '500.00'), ('ABC Ltd', '300.00'), ('XYZ Traders', '200.00')]):
+            invoice = VoucherSalesInvoiceDetails.objects.create(
+                tenant_id=self.tenant_id, date=date(2025, 4, 1 + i), sales_invoice_no=f'SI-{i}', customer_name=party
+            )
+            VoucherSalesPaymentDetails.objects.create(
+                tenant_id=self.tenant_id, invoice=invoice, payment_invoice_value=Decimal(amount)
+            )
+        VoucherReceiptSingle.objects.create(
+            tenant_id=self.tenant_id, date=date(2025, 5, 2), voucher_number='REC-1',
+            receive_from='ABC Ltd', receive_in='Bank', total_receipt=Decimal('600.00')
+        )
+        self.today = date(2025, 5, 15)
+
+    def ask(self, message):
+        from core.ai_intents import answer_aggregate_question
+        return answer_aggregate_question(self.tenant_id, message, self.today)
+
+    def test_totals(self):
+        self.assertEqual(
+            self.ask('What were total sales last month?'),
+            'Total sales for last month (01 Apr 2025 - 30 Apr 2025): 1,000.00 across 3 vouchers.'
+        )
+        self.assertEqual(self.ask('How much did we sell to ABC Ltd in April?'),
+                         'Total sales to ABC Ltd for April 2025 (01 Apr 2025 - 30 Apr 2025): 800.00 across 2 vouchers.')
+        self.assertIn('0.00 across 0 vouchers', self.ask('total receipts last month'))
+
+    def test_outstanding_and_top_parties(self):
+        self.assertEqual(self.ask('Outstanding receivable from ABC Ltd?'), 'Outstanding receivable for ABC Ltd: 200.00.')
+        reply = self.ask('show pending receivables')
+        self.assertIn('Outstanding receivables: 400.00 across 2 customers.', reply)
+        self.assertIn('| XYZ Traders | 200.00 |', reply)
+
+        reply = self.ask('top 1 customers')
+        self.assertIn('| 1 | ABC Ltd | 800.00 | 2 |', reply)
+        self.assertNotIn('XYZ Traders', reply)
+
+    def test_other_questions_go_to_llm(self):
+        self.assertIsNone(self.ask('Create a sales voucher for ABC Ltd'))
+        self.assertIsNone(self.ask('Why did sales drop compared to the previous quarter and what should we do about it?'))
+        self.assertIsNone(self.ask('hello'))
+
+    def test_party_without_preposition(self):
+        reply = self.ask('How much did we pay XYZ Traders this year?')
+        self.assertTrue(reply.startswith('Total payments to XYZ Traders for this financial year'), reply)
+
+    def test_unrecognized_words_go_to_llm(self):
+        for message in (
+            'What is the due date of invoice INV-5?',
+            'Explain what a payable is',
+            'How much GST did we pay last month?',
+            'Can you show the total of sales by item for April?',
+            'How much do we owe XYZ Traders?',
+            # Words after to/for/of that are not one of the tenant's parties
+            'total sales to date',
+            'total sales for the year',
+            'what are total sales for the quarter',
+            'total sales of each customer',
+            'total sales to Unknown Corp',
+        ):
+            self.assertIsNone(self.ask(message), message)
+
+    def test_proxy_answers_without_upstream(self):
+        from core.ai_proxy import AIServiceProxy
+
+        use_temp_ai_limits(self)
+        engine = MagicMock()
+        proxy = AIServiceProxy(engine=engine)
+        with patch('core.ai_proxy.api_key_manager') as key_manager:
+            key_manager.api_keys = ['key']
+            result = proxy.make_request('agent', {'message': 'top customers'}, 'user-1', self.tenant_id)
+        self.assertEqual(result['source'], 'database')
+        self.assertIn('ABC Ltd', result['reply'])
+        self.assertEqual(proxy.stats['fast_path'], 1)
+        engine.run.assert_not_called()
+
+    @override_settings(AI_LIMITS={'USER_PER_MINUTE': 1})
+    def test_background_requests_skip_user_rate_limit(self):
+        from core.ai_proxy import AIServiceProxy
+
+        use_temp_ai_limits(self)
+        proxy = AIServiceProxy(engine=MagicMock())
+        ask = lambda **kwargs: proxy.make_request('agent', {'message': 'top customers'}, 'user-1', self.tenant_id, **kwargs)
+
+        self.assertEqual(ask()['source'], 'database')
+        self.assertEqual(ask()['code'], 'RATE_LIMIT')
+        self.assertEqual(ask(user_rate_limit=False)['source'], 'database')
+
+
+class InvoiceBatchTest(TestCase):
+    tenant_id = 'tenant-1'
+
+    def setUp(self):
+        from core.invoice_batches import InvoiceBatchQueue, InvoiceBatchStore
+
+        self.store = InvoiceBatchStore(temp_dir(self))
+        self.queue = InvoiceBatchQueue(self.store, workers=0, parallelism=2, max_file_bytes=1024)
+        self.requests = []
+        self.rate_limited = 0
+
+        def make_request(request_type, request_data, user_id, tenant_id, user_rate_limit=True):
+            from core.ai_proxy import build_prompt
+
+            self.assertFalse(user_rate_limit)
+            self.requests.append(request_data)
+            _, image = build_prompt(dict(request_data, type=request_type))
+            if image['data'] == b'broken':
+                return {'error': 'AI service busy.'}
+            if self.rate_limited:
+                self.rate_limited -= 1
+                return {'error': 'Rate limit exceeded for your organization.', 'code': 'RATE_LIMIT', 'retryAfter': 2}
+            return {'reply': '```json\n[{"Invoice Number": "%s", "GSTIN": "29ABCDE1234F1Z5XX", "Bank - Bank Name": "SBI"}]\n```'
+                             % image['data'].decode()}
+
+        service_patch = patch('core.ai_proxy.ai_service', MagicMock(make_request=make_request))
+        service_patch.start()
+        self.addCleanup(service_patch.stop)
+
+    def upload(self, name, content):
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        return SimpleUploadedFile(name, content, content_type='image/png')
+
+    def test_batch_dedupes_and_bulk_creates(self):
+        import os
+        from accounting.models import ExtractedInvoice
+        from core.invoice_batches import FILE_DUPLICATE, FILE_EXTRACTED, FILE_FAILED
+
+        job = self.queue.submit(self.tenant_id, 7, [
+            self.upload('a.png', b'INV-1'), self.upload('copy.png', b'INV-1'),
+            self.upload('b.png', b'broken'), self.upload('huge.png', b'x' * 2048),
+        ])
+        self.assertEqual(job['status'], 'done')
+        self.assertEqual([entry['status'] for entry in job['files']],
+                         [FILE_EXTRACTED, FILE_DUPLICATE, FILE_FAILED, FILE_FAILED])
+        self.assertEqual(job['files'][1]['duplicate_of'], 0)
+        self.assertEqual(job['summary']['invoices_created'], 1)
+        self.assertEqual(len(self.requests), 2)
+        self.assertTrue(all('image_path' in data and 'image_data' not in data for data in self.requests))
+        self.assertFalse(os.path.exists(self.store.upload_dir(job['token'])))
+
+        invoice = ExtractedInvoice.objects.get(tenant_id=self.tenant_id)
+        self.assertEqual((invoice.invoice_number, invoice.gstin), ('INV-1', '29ABCDE1234F1Z5'))
+        self.assertEqual(invoice.additional_fields['GSTIN'], '29ABCDE1234F1Z5XX')
+        self.assertEqual(invoice.additional_fields['Bank - Bank Name'], 'SBI')
+        self.assertEqual(invoice.additional_fields['source_file'], 'a.png')
+
+        # The same file again is a duplicate of the stored extraction
+        job = self.queue.submit(self.tenant_id, 7, [self.upload('again.png', b'INV-1')])
+        self.assertEqual(job['files'][0]['status'], FILE_DUPLICATE)
+        self.assertEqual(len(self.requests), 2)
+        self.assertEqual(ExtractedInvoice.objects.filter(tenant_id=self.tenant_id).count(), 1)
+
+        self.assertIsNone(self.queue.get(job['token'], 'tenant-2'))
+        with self.assertRaises(ValueError):
+            self.queue.submit(self.tenant_id, 7, [])
+
+    @patch('core.invoice_batches.time.sleep')
+    def test_rate_limited_files_wait_and_retry(self, sleep):
+        self.rate_limited = 2
+        job = self.queue.submit(self.tenant_id, 7, [self.upload('a.png', b'INV-1')])
+
+        self.assertEqual(job['files'][0]['status'], 'extracted')
+        self.assertEqual(len(self.requests), 3)
+        self.assertEqual([call.args[0] for call in sleep.call_args_list], [2, 2])
+
+    def test_stale_batch_failed_on_poll(self):
+        import os
+        import time
+
+        with patch.object(self.queue, 'run'):  # The worker died before picking it up
+            job = self.queue.submit(self.tenant_id, 7, [self.upload('a.png', b'INV-1')])
+        self.assertEqual(self.queue.get(job['token'], self.tenant_id)['status'], 'queued')
+
+        with patch('reports.jobs.time.time', return_value=time.time() + self.queue.stale_after):
+            job = self.queue.get(job['token'], self.tenant_id)
+        self.assertEqual(job['status'], 'failed')
+        self.assertIn('upload the files again', job['error'])
+        self.assertFalse(os.path.exists(self.store.upload_dir(job['token'])))
+
+        # A late worker leaves the failed batch alone
+        self.queue.run(job['token'])
+        self.assertEqual(self.queue.get(job['token'], self.tenant_id)['status'], 'failed')
+        self.assertEqual(self.requests, [])
+
+    def test_mime_type_inferred_for_generic_uploads(self):
+        from django.core.files.uploadedfile import SimpleUploadedFile
+
+        job = self.queue.submit(self.tenant_id, 7, [
+            SimpleUploadedFile('scan', b'%PDF-1.4 INV-1', content_type='application/octet-stream'),
+            SimpleUploadedFile('photo.jpg', b'INV-2', content_type=''),
+            SimpleUploadedFile('notes', b'INV-3', content_type='application/octet-stream'),
+        ])
+        self.assertEqual([entry['mime_type'] for entry in job['files']], ['application/pdf', 'image/jpeg', None])
+        self.assertEqual([entry['status'] for entry in job['files']], ['extracted', 'extracted', 'failed'])
+        self.assertEqual([data['mime_type'] for data in self.requests], ['application/pdf', 'image/jpeg'])
+
+
+def _take_voucher_numbers(db_name, config_id, count, block_size):
+    from django.db import connection
+    from core.sequences import SequenceAllocator
+
+    connection.settings_dict['NAME'] = db_name
+    allocator = SequenceAllocator('voucher_configurations', block_size=block_size)
+    try:
+        return [allocator.next(config_id) for _ in range(count)]
+    finally:
+        connection.close()
+
+
+class SequenceAllocatorTest(TransactionTestCase):
+    """Threads and processes never share a number (needs an on-disk test database)"""
+
+    def setUp(self):
+        from datetime import date
+        from django.db import connection
+        from accounting.models import VoucherConfiguration
+
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            self.skipTest('concurrent connections need an on-disk test database')
+        self.config = VoucherConfiguration.objects.create(
+            tenant_id='tenant-1', voucher_type='sales', voucher_name='Sales', prefix='INV-',
+            current_number=1, required_digits=4, effective_from=date(2025, 4, 1), effective_to=date(2026, 3, 31)
+        )
+
+    def _hammer_threads(self, take, threads=8, count=25):
+        from concurrent.futures import ThreadPoolExecutor
+        from django.db import connection
+
+        def worker(_):
+            try:
+                return [take() for _ in range(count)]
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(threads) as pool:
+            return [number for numbers in pool.map(worker, range(threads)) for number in numbers]
+
+    def test_threads_take_consecutive_voucher_numbers(self):
+        from accounting.models import VoucherConfiguration
+
+        numbers = self._hammer_threads(lambda: VoucherConfiguration.objects.get(pk=self.config.pk).get_next_voucher_number())
+        self.assertEqual(sorted(numbers), [f'INV-{n:04d}' for n in range(1, 201)])
+        self.config.refresh_from_db()
+        self.assertEqual(self.config.current_number, 201)
+
+    def test_blocks_are_unique_and_released_only_on_commit(self):
+        from django.db import transaction
+        from core.sequences import SequenceAllocator
+
+        allocator = SequenceAllocator('voucher_configurations', block_size=10)
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            self.assertEqual(allocator.allocate(self.config.pk, 2), [2, 3])
+            raise RuntimeError
+        # The rolled back block is neither in the pool nor counted
+        self.assertEqual(allocator.next(self.config.pk), 2)
+
+        numbers = self._hammer_threads(lambda: allocator.next(self.config.pk))
+        self.assertEqual(len(set(numbers)), 200)
+        self.assertNotIn(2, numbers)
+        self.assertIsNone(allocator.next(self.config.pk + 1))
+
+    def test_threads_create_and_share_tenant_series(self):
+        from customerportal.database import CustomerMaster
+        from customerportal.flow import CustomerFlow
+
+        CustomerMaster.objects.create(tenant_id='tenant-1', customer_code='CUST-00041', customer_name='ABC Ltd')
+        codes = self._hammer_threads(lambda: CustomerFlow._generate_customer_code('tenant-1'))
+        self.assertEqual(sorted(codes), [f'CUST-{n:05d}' for n in range(42, 242)])
+
+    def test_processes_take_unique_numbers(self):
+        import django
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+        from django.db import connection
+
+        # Spawned workers load Django before unpickling the task from this module
+        db_name = connection.settings_dict['NAME']
+        with ProcessPoolExecutor(4, mp_context=multiprocessing.get_context('spawn'), initializer=django.setup) as pool:
+            results = pool.map(
+                _take_voucher_numbers, [db_name] * 4, [self.config.pk] * 4, [50] * 4, [1, 1, 5, 5]
+            )
+            numbers = [number for chunk in results for number in chunk]
+        self.assertEqual(len(set(numbers)), 200)
+        self.config.refresh_from_db()
+        self.assertEqual(self.config.current_number, 1 + 2 * 50 + 2 * 50)
+
+
+class TenantSequenceTest(TestCase):
+    def test_series_continue_from_existing_codes_per_tenant(self):
+        from django.db import transaction
+        from core.models import TenantSequence
+        from customerportal.database import CustomerMaster
+        from customerportal.flow import CustomerFlow
+
+        CustomerMaster.objects.create(tenant_id='tenant-1', customer_code='CUST-00041', customer_name='ABC Ltd')
+
+        self.assertEqual(CustomerFlow._generate_customer_code('tenant-1'), 'CUST-00042')
+        self.assertEqual(CustomerFlow._generate_customer_code('tenant-1'), 'CUST-00043')
+        self.assertEqual(CustomerFlow._generate_customer_code('tenant-2'), 'CUST-00001')
+
+        # A rolled back number is issued again, with no new scan of customer_master
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            CustomerFlow._generate_customer_code('tenant-2')
+            raise RuntimeError
+        CustomerMaster.objects.create(tenant_id='tenant-2', customer_code='CUST-00099', customer_name='XYZ')
+        self.assertEqual(CustomerFlow._generate_customer_code('tenant-2'), 'CUST-00002')
+        self.assertEqual(TenantSequence.objects.get(tenant_id='tenant-1', name='customer_code').current_number, 43)
@@ -2,7 +2,7 @@ from django.urls import path, include  # type: ignore
 from rest_framework import routers  # type: ignore
 from .views import (
     CompanySettingsViewSet, health_check, check_status,
-    AgentMessageView, AIProxyView,
+    AgentMessageView, AIProxyView, agent_message_stream, InvoiceBatchView, InvoiceBatchStatusView,
     ai_metrics, health_with_metrics, AdminPaymentsView
 )
 from .admin_views import AdminSubscriptionsView, AdminUserStatusView
@@ -35,8 +35,12 @@ urlpatterns = [
     path('admin/payments/', AdminPaymentsView.as_view(), name='admin-payments'),
 
     # AI Services
+    path('ai/agent-message/stream/', agent_message_stream, name='ai-agent-message-stream'),  # SSE
+    path('ai/invoice-batches/', InvoiceBatchView.as_view(), name='ai-invoice-batches'),
+    path('ai/invoice-batches/<str:token>/', InvoiceBatchStatusView.as_view(), name='ai-invoice-batch-status'),
     path('ai/<str:action>/', AIProxyView.as_view(), name='ai-proxy'),
     path('agent/message/', AgentMessageView.as_view()),  # Legacy endpoint, uses AI proxy internally
+    path('agent/message/stream/', agent_message_stream),
     path('metrics/ai/', ai_metrics, name='ai-metrics'),
     
     path('', include(router.urls)),
@@ -0,0 +1,141 @@
+"""
+User Identity Cache - Minimal user identity for JWT authentication
+Avoids a users-table query on every authenticated request.
+
+Cached are the fields authentication and tenant scoping need, plus the
+profile fields views read from request.user (company name, email, plan,
+phone). Users are rebuilt with Model.from_db(), so every other field
+(password, last_login, timestamps, ...) stays deferred: touching one costs a
+query per field per request, so add it to CACHED_FIELDS if a hot view
+needs it. Saving a user evicts its entry (see evict_user).
+
+Configuration (settings.USER_IDENTITY_CACHE):
+    TTL:         seconds an identity stays valid (default 60)
+    MAX_ENTRIES: in-process LRU bound (default 10000)
+    BACKEND:     optional django cache alias shared across worker processes;
+                 when set it replaces the in-process store
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db import router
+
+IDENTITY_FIELDS = ('id', 'username', 'is_active', 'tenant_id', 'is_staff', 'is_superuser')
+PROFILE_FIELDS = ('company_name', 'email', 'selected_plan', 'phone')
+CACHED_FIELDS = IDENTITY_FIELDS + PROFILE_FIELDS
+
+DEFAULT_TTL = 60
+DEFAULT_MAX_ENTRIES = 10000
+KEY_PREFIX = 'user_identity'
+
+
+class UserIdentityCache:
+    """Bounded TTL cache of user identity dicts keyed by user id"""
+
+    def __init__(self, ttl=DEFAULT_TTL, max_entries=DEFAULT_MAX_ENTRIES, backend=None):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.backend = backend  # django cache alias, or None for in-process
+        self._entries = OrderedDict()  # user_id -> (expires_at, values)
+        self._lock = threading.Lock()
+
+    def _shared(self):
+        from django.core.cache import caches
+        return caches[self.backend]
+
+    def _key(self, user_id):
+        return f"{KEY_PREFIX}:{user_id}"
+
+    def get(self, user_id):
+        """Return cached identity values for user_id, or None"""
+        if self.backend:
+            return self._shared().get(self._key(user_id))
+
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+            expires_at, values = entry
+            if expires_at < time.monotonic():
+                del self._entries[user_id]
+                return None
+            self._entries.move_to_end(user_id)
+            return values
+
+    def set(self, user_id, values):
+        """Store identity values for user_id"""
+        if self.backend:
+            self._shared().set(self._key(user_id), values, self.ttl)
+            return
+
+        with self._lock:
+            self._entries[user_id] = (time.monotonic() + self.ttl, values)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def evict(self, user_id):
+        """Drop user_id from the cache"""
+        if self.backend:
+            self._shared().delete(self._key(user_id))
+            return
+
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+def _build_cache():
+    config = getattr(settings, 'USER_IDENTITY_CACHE', {})
+    return UserIdentityCache(
+        ttl=config.get('TTL', DEFAULT_TTL),
+        max_entries=config.get('MAX_ENTRIES', DEFAULT_MAX_ENTRIES),
+        backend=config.get('BACKEND'),
+    )
+
+
+user_identity_cache = _build_cache()
+
+
+def _normalize_id(user_id):
+    # Token claims may carry the id as str or int
+    try:
+        return int(user_id)
+    except (TypeError, ValueError):
+        return user_id
+
+
+def get_cached_user(user_model, user_id):
+    """
+    Return a user instance for user_id, loading identity from cache when possible.
+
+    Raises:
+        user_model.DoesNotExist: If the user does not exist
+    """
+    user_id = _normalize_id(user_id)
+    # Model.from_db() expects values in concrete field order
+    field_names = [
+        f.attname for f in user_model._meta.concrete_fields if f.attname in CACHED_FIELDS
+    ]
+
+    identity = user_identity_cache.get(user_id)
+    # A shared backend may still hold entries cached with fewer fields
+    if identity is None or any(name not in identity for name in field_names):
+        identity = user_model.objects.filter(id=user_id).values(*field_names).first()
+        if identity is None:
+            raise user_model.DoesNotExist
+        user_identity_cache.set(user_id, identity)
+
+    db = router.db_for_read(user_model)
+    return user_model.from_db(db, field_names, [identity[name] for name in field_names])
+
+
+def evict_user(sender, instance, **kwargs):
+    """Signal receiver: drop a user from the cache when saved or deleted"""
+    user_identity_cache.evict(_normalize_id(instance.pk))
@@ -1,4 +1,6 @@
 import os
+import json
+import logging
 from rest_framework import viewsets, status, generics, views  # type: ignore
 from rest_framework.response import Response  # type: ignore
 from rest_framework.permissions import IsAuthenticated, AllowAny  # type: ignore
@@ -11,6 +13,7 @@ from django.contrib.auth import get_user_model  # type: ignore
 from django.db import models
 
 User = get_user_model()
+logger = logging.getLogger(__name__)
 
 from .models import CompanyFullInfo
 from .serializers import (
@@ -49,39 +52,115 @@ def health_check(request):
 def check_status(request):
     return Response({'isActive': True})
 
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse, StreamingHttpResponse
+from django.views import View
+from django.views.decorators.http import require_POST
+
 from .ai_proxy import ai_service
+from .ai_service import build_invoice_request
+from .auth import CustomJWTAuthentication
 
-@method_decorator(csrf_exempt, name='dispatch')
-class AgentMessageView(views.APIView):
-    permission_classes = [IsAuthenticated]
+async def _authenticate(request):
+    """The JWT-authenticated user of a plain (non-DRF) async view, or None"""
+    auth = await sync_to_async(CustomJWTAuthentication().authenticate)(request)
+    return auth[0] if auth else None
 
-    def post(self, request):
-        msg = request.data.get('message', '').strip()
-        use_grounding = request.data.get('useGrounding', False)
 
-        if not msg:
-            return Response({'error': 'AI service busy. Please try again later.'}, status=429)
+def _user_ids(user):
+    tenant_id = getattr(user, 'tenant_id', None)
+    return str(user.id), str(tenant_id) if tenant_id else None
+
+
+def _request_payload(request):
+    """JSON body, or the form fields of a form/multipart POST"""
+    if request.content_type == 'application/json':
+        return json.loads(request.body or b'{}')
+    return request.POST
+
+
+def _agent_request_data(data):
+    msg = str(data.get('message', '')).strip()
+    if not msg:
+        return None
+    return {
+        'message': msg,
+        'contextData': data.get('contextData', ''),
+        'useGrounding': data.get('useGrounding', False)
+    }
 
-        # Extract user and tenant info
-        user_id = str(request.user.id)
-        tenant_id = getattr(request.user, 'tenant_id', None)
-        if tenant_id:
-            tenant_id = str(tenant_id)
-
-        # Prepare request data
-        request_data = {
-            'message': msg,
-            'contextData': request.data.get('contextData', ''),
-            'useGrounding': use_grounding
-        }
+
+@method_decorator(csrf_exempt, name='dispatch')
+class AgentMessageView(View):
+    """
+    One-shot agent reply. Async so the Gemini call awaits
+    ai_service.amake_request instead of holding a worker thread.
+    """
+
+    async def post(self, request):
+        user = await _authenticate(request)
+        if user is None:
+            return JsonResponse({'detail': 'Authentication credentials were not provided.'}, status=401)
+
+        try:
+            request_data = _agent_request_data(_request_payload(request))
+        except ValueError:
+            return JsonResponse({'error': 'Invalid JSON body.'}, status=400)
+        if request_data is None:
+            return JsonResponse({'error': 'AI service busy. Please try again later.'}, status=429)
 
         # Use AI proxy
-        result = ai_service.make_request('agent', request_data, user_id, tenant_id)
+        user_id, tenant_id = _user_ids(user)
+        result = await ai_service.amake_request('agent', request_data, user_id, tenant_id)
 
         if 'error' in result:
-            return Response(result, status=429)
+            return JsonResponse(result, status=429)
+
+        return JsonResponse({'reply': result['reply']})
 
-        return Response({'reply': result['reply']})
+
+def _sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@csrf_exempt
+@require_POST
+async def agent_message_stream(request):
+    """
+    Streaming AgentMessageView: the reply as Server-Sent Events.
+
+    Events: `chunk` {"text"} while Gemini generates, then `done` (the full
+    {"reply", ...} result) or `error`. Served by the ASGI entrypoint
+    (gunicorn_config.py): under WSGI Django would collect the whole async
+    stream before sending anything. The wait costs a coroutine, not a
+    worker thread.
+    """
+    user = await _authenticate(request)
+    if user is None:
+        return JsonResponse({'detail': 'Authentication credentials were not provided.'}, status=401)
+
+    try:
+        request_data = _agent_request_data(json.loads(request.body or b'{}'))
+    except ValueError:
+        return JsonResponse({'error': 'Invalid JSON body.'}, status=400)
+    if request_data is None:
+        return JsonResponse({'error': 'AI service busy. Please try again later.'}, status=429)
+
+    user_id, tenant_id = _user_ids(user)
+
+    async def events():
+        async for event in ai_service.astream_request('agent', request_data, user_id, tenant_id):
+            if 'chunk' in event:
+                yield _sse_event('chunk', {'text': event['chunk']})
+            elif 'error' in event:
+                yield _sse_event('error', event)
+            else:
+                yield _sse_event('done', event)
+
+    response = StreamingHttpResponse(events(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # Don't let nginx buffer the stream
+    return response
 
 
 @api_view(['GET'])
@@ -251,60 +330,103 @@ class AdminPaymentsView(views.APIView):
 
 
 @method_decorator(csrf_exempt, name='dispatch')
-class AIProxyView(views.APIView):
+class AIProxyView(View):
     """Unified AI proxy endpoint for all AI operations"""
 
-    def post(self, request, action):
+    async def post(self, request, action):
         # Require authentication for AI services
-        if not request.user.is_authenticated:
-            return Response({'error': 'AI service busy. Please try again later.'}, status=429)
+        user = await _authenticate(request)
+        if user is None:
+            return JsonResponse({'error': 'AI service busy. Please try again later.'}, status=429)
 
         # Extract user and tenant info
-        user_id = str(request.user.id)
-        tenant_id = getattr(request.user, 'tenant_id', None)
-        if tenant_id:
-            tenant_id = str(tenant_id)
+        user_id, tenant_id = _user_ids(user)
 
         if action == 'extract-invoice':
             # Handle file upload for invoice extraction
             if 'file' not in request.FILES:
-                return Response({'error': 'No file provided.'}, status=400)
+                return JsonResponse({'error': 'No file provided.'}, status=400)
 
             file_obj = request.FILES['file']
-
-            # Use updated invoice processing
-            from .ai_service import create_invoice_processing_request
-            result = create_invoice_processing_request(
-                file_obj,
-                mime_type=file_obj.content_type,
-                user_id=user_id,
-                tenant_id=tenant_id
-            )
+            try:
+                request_data = build_invoice_request(file_obj, mime_type=file_obj.content_type)
+            except Exception as e:
+                logger.exception("Error reading uploaded invoice")
+                return JsonResponse({'error': str(e)}, status=429)
+            result = await ai_service.amake_request('invoice', request_data, user_id, tenant_id)
 
         elif action == 'agent-message':
             # Handle agent messages
-            msg = request.data.get('message', '').strip()
-            if not msg:
-                return Response({'error': 'AI service busy. Please try again later.'}, status=429)
-
-            request_data = {
-                'message': msg,
-                'contextData': request.data.get('contextData', ''),
-                'useGrounding': request.data.get('useGrounding', False)
-            }
-            result = ai_service.make_request('agent', request_data, user_id, tenant_id)
+            try:
+                request_data = _agent_request_data(_request_payload(request))
+            except ValueError:
+                return JsonResponse({'error': 'Invalid JSON body.'}, status=400)
+            if request_data is None:
+                return JsonResponse({'error': 'AI service busy. Please try again later.'}, status=429)
+            result = await ai_service.amake_request('agent', request_data, user_id, tenant_id)
         else:
-            return Response({'error': 'AI service busy. Please try again later.'}, status=429)
+            return JsonResponse({'error': 'AI service busy. Please try again later.'}, status=429)
 
         if 'error' in result:
-            return Response(result, status=429)
+            return JsonResponse(result, status=429)
 
-        return Response(result)
+        return JsonResponse(result, safe=False)
 
-    def get(self, request, action):
+    async def get(self, request, action):
         """Get AI service stats"""
         if action == 'stats':
-            if not request.user.is_staff:  # Only staff can see stats
-                return Response({'error': 'Unauthorized'}, status=403)
-            return Response(ai_service.get_stats())
-        return Response({'error': 'Unknown action'}, status=400)
+            user = await _authenticate(request)
+            if user is None or not user.is_staff:  # Only staff can see stats
+                return JsonResponse({'error': 'Unauthorized'}, status=403)
+            # Reads the shared limiter/cache state from sqlite
+            return JsonResponse(await sync_to_async(ai_service.get_stats)())
+        return JsonResponse({'error': 'Unknown action'}, status=400)
+
+
+def serialize_invoice_batch(job):
+    return {
+        'token': job['token'],
+        'status': job['status'],
+        'files': [
+            {key: entry.get(key) for key in ('name', 'size', 'status', 'error', 'invoices', 'duplicate_of')}
+            for entry in job['files']
+        ],
+        'summary': job['summary'],
+        'error': job['error'],
+    }
+
+
+class InvoiceBatchView(views.APIView):
+    """
+    Queue extraction of many invoices.
+
+    POST multipart: "files" (repeated). Extracted invoices are saved as
+    ExtractedInvoice rows; poll InvoiceBatchStatusView for progress.
+    """
+    permission_classes = [IsAuthenticated]
+    parser_classes = (MultiPartParser, FormParser)
+
+    def post(self, request):
+        from .invoice_batches import get_invoice_batch_queue
+
+        tenant_id = getattr(request.user, 'tenant_id', None)
+        if not tenant_id:
+            return Response({'error': 'Tenant not found.'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            job = get_invoice_batch_queue().submit(tenant_id, request.user.id, request.FILES.getlist('files'))
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(serialize_invoice_batch(job), status=status.HTTP_202_ACCEPTED)
+
+
+class InvoiceBatchStatusView(views.APIView):
+    """Poll an invoice batch by token"""
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, token):
+        from .invoice_batches import get_invoice_batch_queue
+
+        job = get_invoice_batch_queue().get(token, getattr(request.user, 'tenant_id', None))
+        if job is None:
+            return Response({'error': 'Invoice batch not found'}, status=status.HTTP_404_NOT_FOUND)
+        return Response(serialize_invoice_batch(job))
@@ -4,6 +4,7 @@ Defines all database tables and relationships for customer portal
 """
 from django.db import models
 from django.core.validators import EmailValidator, RegexValidator
+from core.sequences import SequenceAllocator, format_number
 
 
 class CustomerMaster(models.Model):
@@ -125,10 +126,12 @@ class CustomerMastersSalesQuotation(models.Model):
     
     def get_next_number(self):
         """Generate the next quotation number in the series"""
-        self.current_number += 1
-        self.save()
-        number_str = str(self.current_number).zfill(self.required_digits)
-        return f"{self.prefix}{number_str}{self.suffix}"
+        # current_number holds the last number issued; take the next atomically (see core.sequences)
+        self.current_number = quotation_numbers.next(self.pk)
+        return format_number(self.current_number, self.prefix, self.required_digits, self.suffix)
+
+
+quotation_numbers = SequenceAllocator(CustomerMastersSalesQuotation._meta.db_table, touch='updated_at')
 
 
 class CustomerMasterCustomerBasicDetails(models.Model):
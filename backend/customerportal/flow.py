@@ -7,11 +7,21 @@ from django.utils import timezone
 from decimal import Decimal
 from .database import (
     CustomerMaster,
-    CustomerCategory,
     CustomerTransaction,
     CustomerSalesQuotation,
     CustomerSalesOrder
 )
+from core.sequences import last_number, next_tenant_number
+
+
+def _next_number(tenant_id, name, queryset, field):
+    """
+    Next number of a per-tenant series (see core.sequences). On first use
+    the series continues from the code on the latest row of queryset.
+    """
+    return next_tenant_number(tenant_id, name, seed=lambda: last_number(
+        queryset.order_by('-id').values_list(field, flat=True).first()
+    ))
 
 
 class CustomerFlow:
@@ -47,18 +57,9 @@ class CustomerFlow:
     @staticmethod
     def _generate_customer_code(tenant_id):
         """Generate unique customer code"""
-        last_customer = CustomerMaster.objects.filter(
+        new_number = _next_number(tenant_id, 'customer_code', CustomerMaster.objects.filter(
             tenant_id=tenant_id
-        ).order_by('-id').first()
-        
-        if last_customer and last_customer.customer_code:
-            try:
-                last_number = int(last_customer.customer_code.split('-')[-1])
-                new_number = last_number + 1
-            except (ValueError, IndexError):
-                new_number = 1
-        else:
-            new_number = 1
+        ), 'customer_code')
         
         return f"CUST-{new_number:05d}"
     
@@ -120,18 +121,9 @@ class QuotationFlow:
     @staticmethod
     def _generate_quotation_number(tenant_id):
         """Generate unique quotation number"""
-        last_quotation = CustomerSalesQuotation.objects.filter(
+        new_number = _next_number(tenant_id, 'sales_quotation', CustomerSalesQuotation.objects.filter(
             tenant_id=tenant_id
-        ).order_by('-id').first()
-        
-        if last_quotation and last_quotation.quotation_number:
-            try:
-                last_number = int(last_quotation.quotation_number.split('-')[-1])
-                new_number = last_number + 1
-            except (ValueError, IndexError):
-                new_number = 1
-        else:
-            new_number = 1
+        ), 'quotation_number')
         
         return f"SQ-{timezone.now().year}-{new_number:05d}"
     
@@ -221,18 +213,9 @@ class OrderFlow:
     @staticmethod
     def _generate_order_number(tenant_id):
         """Generate unique order number"""
-        last_order = CustomerSalesOrder.objects.filter(
+        new_number = _next_number(tenant_id, 'sales_order', CustomerSalesOrder.objects.filter(
             tenant_id=tenant_id
-        ).order_by('-id').first()
-        
-        if last_order and last_order.order_number:
-            try:
-                last_number = int(last_order.order_number.split('-')[-1])
-                new_number = last_number + 1
-            except (ValueError, IndexError):
-                new_number = 1
-        else:
-            new_number = 1
+        ), 'order_number')
         
         return f"SO-{timezone.now().year}-{new_number:05d}"
     
@@ -321,18 +304,9 @@ class TransactionFlow:
         
         prefix = prefix_map.get(transaction_type, 'TXN')
         
-        last_transaction = CustomerTransaction.objects.filter(
+        new_number = _next_number(tenant_id, f'customer_transaction:{transaction_type}', CustomerTransaction.objects.filter(
             tenant_id=tenant_id,
             transaction_type=transaction_type
-        ).order_by('-id').first()
-        
-        if last_transaction and last_transaction.transaction_number:
-            try:
-                last_number = int(last_transaction.transaction_number.split('-')[-1])
-                new_number = last_number + 1
-            except (ValueError, IndexError):
-                new_number = 1
-        else:
-            new_number = 1
+        ), 'transaction_number')
         
         return f"{prefix}-{timezone.now().year}-{new_number:05d}"
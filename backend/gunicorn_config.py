@@ -5,8 +5,10 @@ bind = "0.0.0.0:8000"
 
 # Workers: (2 * CPUs) + 1 recommended
 workers = multiprocessing.cpu_count() * 2 + 1
-worker_class = "gthread" # Threaded worker for I/O bound tasks
-threads = 4
+# ASGI worker (backend.asgi): async views such as the agent SSE stream send
+# each chunk as it is generated; sync views run in a thread per request
+# (so DB connections are not persistent, see CONN_MAX_AGE in settings.py)
+worker_class = "uvicorn_worker.UvicornWorker"
 
 # Timeouts
 timeout = 120
@@ -9,7 +9,7 @@ from django.db import IntegrityError, transaction
 from django.core.exceptions import ValidationError
 from rest_framework import serializers as drf_serializers
 from core.tenant import get_user_tenant_id
-from accounting.utils import generate_ledger_code
+from accounting.utils import generate_ledger_code, ledger_conflict_errors
 from . import database as db
 
 logger = logging.getLogger('masters.flow')
@@ -163,106 +163,85 @@ def create_ledger(user, validated_data):
     question_answers = validated_data.pop('additional_data', {})
     logger.info(f"📋 Question answers extracted: {question_answers}")
     
-    # Retry logic for code generation (handles race conditions)
-    max_retries = 3
-    ledger = None
-    
-    for attempt in range(max_retries):
+    # Codes come from atomic per-tenant counters (accounting.utils); a rollback
+    # also undoes the counter, so a conflict is reported instead of retried
+    with transaction.atomic():
+        # Generate code
+        ledger_code = generate_ledger_code(validated_data, tenant_id)
+        logger.info(f"🔢 Generated ledger code: {ledger_code}")
+        
+        # Save with generated code (including additional_data)
+        ledger_data = {**validated_data, 'code': ledger_code, 'additional_data': question_answers}
         try:
             with transaction.atomic():
-                # Generate code
-                ledger_code = generate_ledger_code(validated_data, tenant_id)
-                logger.info(
-                    f"🔢 Generated ledger code: {ledger_code} "
-                    f"(attempt {attempt + 1}/{max_retries})"
-                )
-                
-                # Save with generated code (including additional_data)
-                ledger_data = {**validated_data, 'code': ledger_code, 'additional_data': question_answers}
                 ledger = db.create_ledger(ledger_data, tenant_id)
-                logger.info(f"✅ Ledger saved successfully with code: {ledger_code}")
-                
-                # Save answers to Answer table
-                if question_answers and isinstance(question_answers, dict):
-                    from accounting.models_question import Question, Answer
-                    logger.info(f"💾 Saving {len(question_answers)} answers to answers table...")
+        except IntegrityError as e:
+            logger.error(f"❌ Ledger conflict for code {ledger_code}: {e}")
+            raise drf_serializers.ValidationError(ledger_conflict_errors(ledger_data, tenant_id))
+        logger.info(f"✅ Ledger saved successfully with code: {ledger_code}")
+        
+        # Save answers to Answer table
+        if question_answers and isinstance(question_answers, dict):
+            from accounting.models_question import Question, Answer
+            logger.info(f"💾 Saving {len(question_answers)} answers to answers table...")
+            
+            for q_id, ans_text in question_answers.items():
+                if not ans_text:
+                    logger.info(f"⏭️  Skipping empty answer for Q_ID: {q_id}")
+                    continue
                     
-                    for q_id, ans_text in question_answers.items():
-                        if not ans_text:
-                            logger.info(f"⏭️  Skipping empty answer for Q_ID: {q_id}")
-                            continue
-                            
-                        try:
-                            question_obj = Question.objects.get(id=q_id)
-                            Answer.objects.create(
-                                ledger_code=ledger.code,
-                                sub_group_1_1=question_obj.sub_group_1_1,
-                                sub_group_1_2=question_obj.sub_group_1_2,
-                                question=question_obj.question,
-                                answer=ans_text,
-                                tenant_id=tenant_id
-                            )
-                            logger.info(f"✅ Saved answer for Q:{q_id} to answers table")
-                        except Question.DoesNotExist:
-                            logger.warning(f"⚠️  Question with ID {q_id} does not exist!")
-                        except Exception as e:
-                            logger.error(f"❌ Failed to save answer for Q:{q_id}: {e}")
-                else:
-                    logger.info("ℹ️  No question answers to save")
+                try:
+                    question_obj = Question.objects.get(id=q_id)
+                    Answer.objects.create(
+                        ledger_code=ledger.code,
+                        sub_group_1_1=question_obj.sub_group_1_1,
+                        sub_group_1_2=question_obj.sub_group_1_2,
+                        question=question_obj.question,
+                        answer=ans_text,
+                        tenant_id=tenant_id
+                    )
+                    logger.info(f"✅ Saved answer for Q:{q_id} to answers table")
+                except Question.DoesNotExist:
+                    logger.warning(f"⚠️  Question with ID {q_id} does not exist!")
+                except Exception as e:
+                    logger.error(f"❌ Failed to save answer for Q:{q_id}: {e}")
+        else:
+            logger.info("ℹ️  No question answers to save")
+        
+        # Auto-create AmountTransaction for Cash/Bank ledgers (even without opening balance)
+        if _is_cash_or_bank_ledger(ledger):
+            try:
+                from accounting.models import AmountTransaction
+                from datetime import date
                 
-                # Auto-create AmountTransaction for Cash/Bank ledgers (even without opening balance)
-                if _is_cash_or_bank_ledger(ledger):
-                    try:
-                        from accounting.models import AmountTransaction
-                        from datetime import date
-                        
-                        # Get opening balance from question_answers or default to 0
-                        opening_balance = 0
-                        if question_answers:
-                            opening_balance = question_answers.get('opening_balance', 0)
-                        
-                        opening_balance_value = float(opening_balance) if opening_balance else 0
-                        logger.info(f"💰 Creating transaction for {ledger.name}: {opening_balance_value}")
-                        
-                        # Create transaction (even if balance is 0)
-                        AmountTransaction.objects.create(
-                            tenant_id=tenant_id,
-                            ledger=ledger,
-                            ledger_name=ledger.name,  # Ledger name
-                            sub_group_1=ledger.sub_group_1,  # Parent category (e.g., Current Assets)
-                            code=ledger.code,  # Ledger code
-                            transaction_date=date.today(),
-                            transaction_type='opening_balance',
-                            debit=opening_balance_value if opening_balance_value >= 0 else 0,
-                            credit=abs(opening_balance_value) if opening_balance_value < 0 else 0,
-                            balance=opening_balance_value,
-                            narration='Opening Balance'
-                        )
-                        logger.info(f"✅ Created transaction for {ledger.name}")
-                    except Exception as e:
-                        logger.error(f"❌ Failed to create transaction: {e}")
-                        import traceback
-                        traceback.print_exc()
-                        # Don't fail ledger creation if transaction creation fails
+                # Get opening balance from question_answers or default to 0
+                opening_balance = 0
+                if question_answers:
+                    opening_balance = question_answers.get('opening_balance', 0)
                 
-                break  # Success, exit retry loop
+                opening_balance_value = float(opening_balance) if opening_balance else 0
+                logger.info(f"💰 Creating transaction for {ledger.name}: {opening_balance_value}")
                 
-        except IntegrityError as e:
-            if attempt == max_retries - 1:
-                # Last attempt failed
-                logger.error(
-                    f"❌ Failed to generate unique code after {max_retries} attempts. "
-                    f"Error: {str(e)}"
+                # Create transaction (even if balance is 0)
+                AmountTransaction.objects.create(
+                    tenant_id=tenant_id,
+                    ledger=ledger,
+                    ledger_name=ledger.name,  # Ledger name
+                    sub_group_1=ledger.sub_group_1,  # Parent category (e.g., Current Assets)
+                    code=ledger.code,  # Ledger code
+                    transaction_date=date.today(),
+                    transaction_type='opening_balance',
+                    debit=opening_balance_value if opening_balance_value >= 0 else 0,
+                    credit=abs(opening_balance_value) if opening_balance_value < 0 else 0,
+                    balance=opening_balance_value,
+                    narration='Opening Balance'
                 )
-                raise drf_serializers.ValidationError({
-                    'code': 'Failed to generate unique ledger code. Please try again.'
-                })
-            
-            # Retry on next iteration
-            logger.warning(
-                f"⚠️ Code collision detected on attempt {attempt + 1}, retrying..."
-            )
-            continue
+                logger.info(f"✅ Created transaction for {ledger.name}")
+            except Exception as e:
+                logger.error(f"❌ Failed to create transaction: {e}")
+                import traceback
+                traceback.print_exc()
+                # Don't fail ledger creation if transaction creation fails
     
     logger.info(f"✅ Ledger created successfully: {ledger}")
     return ledger
@@ -1,13 +1,19 @@
 """
 Reports API Layer
 """
-from rest_framework import views
+from rest_framework import views, status
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, AllowAny
-from django.http import HttpResponse
-import openpyxl
+from django.http import FileResponse
 from datetime import datetime
 
+from core.utils import IsTenantMember
+from reports.export import (
+    EXPORT_CONTENT_TYPES, DEFAULT_EXPORT_FORMAT, ExportContentNegotiation, export_response, get_export_format
+)
+from reports.jobs import get_report_job_queue, STATUS_DONE
+from reports import flow
+
 class PlaceholderReportView(views.APIView):
     permission_classes = [IsAuthenticated]
     
@@ -18,16 +24,10 @@ class PlaceholderReportView(views.APIView):
 class DaybookExcelView(views.APIView):
     """Export daybook report as Excel file"""
     permission_classes = [AllowAny]  # Temporary for development
+    content_negotiation_class = ExportContentNegotiation
     
     def get(self, request):
-        # Create Excel workbook
-        wb = openpyxl.Workbook()
-        ws = wb.active
-        ws.title = "Daybook"
-        
-        # Add headers
         headers = ['Date', 'Voucher No', 'Voucher Type', 'Party', 'Debit', 'Credit', 'Narration']
-        ws.append(headers)
         
         # Add sample data
         sample_data = [
@@ -35,30 +35,17 @@ class DaybookExcelView(views.APIView):
             [datetime.now().strftime('%Y-%m-%d'), 'PURCH-001', 'Purchase', 'XYZ Suppliers', 0, 5000, 'Purchase invoice'],
         ]
         
-        for row in sample_data:
-            ws.append(row)
-        
-        # Create HTTP response with Excel file
-        response = HttpResponse(
-            content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-        )
-        response['Content-Disposition'] = f'attachment; filename=daybook_{datetime.now().strftime("%Y%m%d")}.xlsx'
-        
-        wb.save(response)
-        return response
+        filename = f'daybook_{datetime.now().strftime("%Y%m%d")}.xlsx'
+        return export_response(sample_data, headers, filename, get_export_format(request), sheet_title="Daybook")
 
 
 class TrialBalanceExcelView(views.APIView):
     """Export trial balance report as Excel file"""
     permission_classes = [AllowAny]
+    content_negotiation_class = ExportContentNegotiation
     
     def get(self, request):
-        wb = openpyxl.Workbook()
-        ws = wb.active
-        ws.title = "Trial Balance"
-        
         headers = ['Account Name', 'Debit', 'Credit']
-        ws.append(headers)
         
         sample_data = [
             ['Cash', 50000, 0],
@@ -67,114 +54,66 @@ class TrialBalanceExcelView(views.APIView):
             ['Purchases', 80000, 0],
         ]
         
-        for row in sample_data:
-            ws.append(row)
-        
-        response = HttpResponse(
-            content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-        )
-        response['Content-Disposition'] = f'attachment; filename=trial_balance_{datetime.now().strftime("%Y%m%d")}.xlsx'
-        
-        wb.save(response)
-        return response
+        filename = f'trial_balance_{datetime.now().strftime("%Y%m%d")}.xlsx'
+        return export_response(sample_data, headers, filename, get_export_format(request), sheet_title="Trial Balance")
 
 
 class StockSummaryExcelView(views.APIView):
     """Export stock summary report as Excel file"""
     permission_classes = [AllowAny]
+    content_negotiation_class = ExportContentNegotiation
     
     def get(self, request):
-        wb = openpyxl.Workbook()
-        ws = wb.active
-        ws.title = "Stock Summary"
-        
         headers = ['Item Name', 'Opening Stock', 'Inward', 'Outward', 'Closing Stock']
-        ws.append(headers)
         
         sample_data = [
             ['Product A', 100, 50, 30, 120],
             ['Product B', 200, 100, 80, 220],
         ]
         
-        for row in sample_data:
-            ws.append(row)
-        
-        response = HttpResponse(
-            content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-        )
-        response['Content-Disposition'] = f'attachment; filename=stock_summary_{datetime.now().strftime("%Y%m%d")}.xlsx'
-        
-        wb.save(response)
-        return response
+        filename = f'stock_summary_{datetime.now().strftime("%Y%m%d")}.xlsx'
+        return export_response(sample_data, headers, filename, get_export_format(request), sheet_title="Stock Summary")
 
 
 class LedgerExcelView(views.APIView):
     """Export ledger report as Excel file"""
     permission_classes = [AllowAny]
+    content_negotiation_class = ExportContentNegotiation
     
     def get(self, request):
-        wb = openpyxl.Workbook()
-        ws = wb.active
-        ws.title = "Ledger Report"
-        
         headers = ['Date', 'Particulars', 'Debit', 'Credit', 'Balance']
-        ws.append(headers)
         
         sample_data = [
             [datetime.now().strftime('%Y-%m-%d'), 'Opening Balance', 0, 0, 50000],
             [datetime.now().strftime('%Y-%m-%d'), 'Sales', 10000, 0, 60000],
         ]
         
-        for row in sample_data:
-            ws.append(row)
-        
-        response = HttpResponse(
-            content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-        )
-        response['Content-Disposition'] = f'attachment; filename=ledger_{datetime.now().strftime("%Y%m%d")}.xlsx'
-        
-        wb.save(response)
-        return response
+        filename = f'ledger_{datetime.now().strftime("%Y%m%d")}.xlsx'
+        return export_response(sample_data, headers, filename, get_export_format(request), sheet_title="Ledger Report")
 
 
 class GSTExcelView(views.APIView):
     """Export GST report as Excel file"""
     permission_classes = [AllowAny]
+    content_negotiation_class = ExportContentNegotiation
     
     def get(self, request):
-        wb = openpyxl.Workbook()
-        ws = wb.active
-        ws.title = "GST Report"
-        
         headers = ['GSTIN', 'Party Name', 'Taxable Value', 'CGST', 'SGST', 'IGST', 'Total']
-        ws.append(headers)
         
         sample_data = [
             ['22AAAAA0000A1Z5', 'ABC Ltd', 50000, 4500, 4500, 0, 59000],
         ]
         
-        for row in sample_data:
-            ws.append(row)
-        
-        response = HttpResponse(
-            content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-        )
-        response['Content-Disposition'] = f'attachment; filename=gst_report_{datetime.now().strftime("%Y%m%d")}.xlsx'
-        
-        wb.save(response)
-        return response
+        filename = f'gst_report_{datetime.now().strftime("%Y%m%d")}.xlsx'
+        return export_response(sample_data, headers, filename, get_export_format(request), sheet_title="GST Report")
 
 class AIReportExcelView(views.APIView):
     """Export AI report as Excel file"""
     permission_classes = [AllowAny]
+    content_negotiation_class = ExportContentNegotiation
     
     def get(self, request):
-        wb = openpyxl.Workbook()
-        ws = wb.active
-        ws.title = "AI Report"
-        
         headers = ['Metric', 'Value', 'Analysis']
-        ws.append(headers)
         
         # Sample data - in a real app this would come from the AI analysis
         sample_data = [
@@ -183,13 +122,126 @@ class AIReportExcelView(views.APIView):
             ['Expense Trend', 'Stable', 'Expenses within budget'],
         ]
         
-        for row in sample_data:
-            ws.append(row)
-        
-        response = HttpResponse(
-            content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+        filename = f'ai_report_{datetime.now().strftime("%Y%m%d")}.xlsx'
+        return export_response(sample_data, headers, filename, get_export_format(request), sheet_title="AI Report")
+
+
+# ============================================================================
+# BACKGROUND REPORT JOBS
+# ============================================================================
+
+def serialize_report_job(job):
+    return {
+        'token': job['token'],
+        'report': job['report'],
+        'format': job['format'],
+        'status': job['status'],
+        'filename': job['filename'],
+        'error': job['error'],
+    }
+
+
+class ReportJobView(views.APIView):
+    """
+    Enqueue a report for background generation.
+
+    POST body: {"report": "daybook" | "ledger" | "trial_balance" | "ai",
+                "params": {"startDate": ..., "endDate": ..., "ledger": ..., "query": ...},
+                "format": "xlsx" | "csv" | "parquet"}
+    """
+    permission_classes = [IsAuthenticated, IsTenantMember]
+
+    def post(self, request):
+        report = request.data.get('report')
+        params = request.data.get('params') or {}
+        export_format = (request.data.get('format') or DEFAULT_EXPORT_FORMAT).lower()
+
+        if not isinstance(params, dict):
+            return Response({'error': 'params must be an object'}, status=status.HTTP_400_BAD_REQUEST)
+        if report == 'ai':
+            if not params.get('query'):
+                return Response({'error': 'Query is required'}, status=status.HTTP_400_BAD_REQUEST)
+            # Relative dates in the query ("last month") resolve against today
+            params.setdefault('current_date', datetime.now().date().isoformat())
+
+        try:
+            job = get_report_job_queue().submit(request.tenant_id, report, params, export_format)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response(serialize_report_job(job), status=status.HTTP_202_ACCEPTED)
+
+
+class ReportJobStatusView(views.APIView):
+    """Poll a report job by token"""
+    permission_classes = [IsAuthenticated, IsTenantMember]
+
+    def get(self, request, token):
+        job = get_report_job_queue().get(token, request.tenant_id)
+        if job is None:
+            return Response({'error': 'Report job not found'}, status=status.HTTP_404_NOT_FOUND)
+        return Response(serialize_report_job(job))
+
+
+class ReportJobDownloadView(views.APIView):
+    """Download a finished report job's file by token"""
+    permission_classes = [IsAuthenticated, IsTenantMember]
+
+    def get(self, request, token):
+        queue = get_report_job_queue()
+        job = queue.get(token, request.tenant_id)
+        if job is None:
+            return Response({'error': 'Report job not found'}, status=status.HTTP_404_NOT_FOUND)
+
+        path = queue.artifact_path(job)
+        if path is None:
+            if job['status'] == STATUS_DONE:
+                # Artifact expired; a new POST rebuilds it
+                return Response({'error': 'Report file has expired'}, status=status.HTTP_410_GONE)
+            return Response(serialize_report_job(job), status=status.HTTP_409_CONFLICT)
+
+        return FileResponse(
+            open(path, 'rb'),
+            as_attachment=True,
+            filename=job['filename'],
+            content_type=EXPORT_CONTENT_TYPES[job['format']],
         )
-        response['Content-Disposition'] = f'attachment; filename=ai_report_{datetime.now().strftime("%Y%m%d")}.xlsx'
-        
-        wb.save(response)
-        return response
+
+
+# ============================================================================
+# PERIOD CLOSE
+# ============================================================================
+
+def serialize_period_close(period_close):
+    return {
+        'id': period_close.id,
+        'period_type': period_close.period_type,
+        'period_start': period_close.period_start.isoformat(),
+        'period_end': period_close.period_end.isoformat(),
+        'closed_at': period_close.updated_at,
+    }
+
+
+class PeriodCloseView(views.APIView):
+    """
+    GET: list closed periods.
+    POST {"period_type": "month" | "year", "date": "YYYY-MM-DD"}: close the
+    period containing date, snapshotting closing balances for reports.
+    """
+    permission_classes = [IsAuthenticated, IsTenantMember]
+
+    def get(self, request):
+        closes = flow.list_report_period_closes(request.user)
+        return Response([serialize_period_close(c) for c in closes])
+
+    def post(self, request):
+        try:
+            period_close = flow.close_report_period(
+                request.user, request.data.get('period_type'), request.data.get('date')
+            )
+        except PermissionError as e:
+            return Response({'error': str(e)}, status=status.HTTP_403_FORBIDDEN)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response(serialize_period_close(period_close), status=status.HTTP_201_CREATED)
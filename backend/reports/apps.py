@@ -4,3 +4,15 @@ from django.apps import AppConfig
 class ReportsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'reports'
+
+    def ready(self):
+        from django.db.models.signals import pre_save, post_save, post_delete
+        from reports.database import SPLIT_VOUCHER_SOURCE_MODELS
+        from reports.period_close import remember_voucher_date, invalidate_for_voucher
+
+        # Voucher writes dated inside a closed period invalidate its snapshot
+        for model in SPLIT_VOUCHER_SOURCE_MODELS:
+            uid = f'period_close_{model.__name__}'
+            pre_save.connect(remember_voucher_date, sender=model, dispatch_uid=f'{uid}_pre_save')
+            post_save.connect(invalidate_for_voucher, sender=model, dispatch_uid=f'{uid}_post_save')
+            post_delete.connect(invalidate_for_voucher, sender=model, dispatch_uid=f'{uid}_post_delete')
@@ -0,0 +1,238 @@
+"""
+Columnar Report Computations - Ledger and trial balance over voucher frames.
+
+Vectorized equivalents of the per-voucher ledger_rows / trial_balance_rows
+loops (kept in the benchmark_report_compute command). They take a DataFrame
+with VOUCHER_FRAME_COLUMNS (reports.database.get_split_voucher_frame,
+optionally preceded by period-close snapshot rows carrying positive_amount)
+and return rows as tuples in report column order, which the export writers
+accept like dicts.
+
+Output is identical to the per-voucher loops, not just close:
+- strings are only compared as integer codes (pd.factorize)
+- per-ledger sums use np.add.at, which adds in array order like the loop did
+  (pandas groupby sums use compensated summation and can differ in the last bit)
+- running balances use np.cumsum, which is sequential
+- ledgers keep first-appearance order
+- untouched debit/credit cells stay int 0, as in the loops
+"""
+
+import numpy as np
+import pandas as pd
+
+DEBIT = 0
+CREDIT = 1
+
+VOUCHER_TYPES = ['Sales', 'Purchase', 'Receipt', 'Payment', 'Contra', 'Journal']
+SALES, PURCHASE, RECEIPT, PAYMENT, CONTRA, JOURNAL = range(len(VOUCHER_TYPES))
+
+# Ledger operands of a posting
+PARTY, ACCOUNT, SALES_LEDGER, PURCHASES_LEDGER = range(4)
+FIXED_LEDGERS = {SALES_LEDGER: 'Sales', PURCHASES_LEDGER: 'Purchases'}
+
+# Trial balance postings per voucher type:
+# (first ledger, first side, second ledger, second side)
+TRIAL_BALANCE_POSTINGS = {
+    SALES: (PARTY, DEBIT, SALES_LEDGER, CREDIT),
+    PURCHASE: (PARTY, CREDIT, PURCHASES_LEDGER, DEBIT),
+    RECEIPT: (ACCOUNT, DEBIT, PARTY, CREDIT),
+    PAYMENT: (PARTY, DEBIT, ACCOUNT, CREDIT),
+    CONTRA: (ACCOUNT, DEBIT, PARTY, CREDIT),
+}
+
+
+def _codes(series, values):
+    """Position of each value of series in values (-1 for anything else)."""
+    codes, uniques = pd.factorize(series)
+    lookup = np.array([values.index(value) if value in values else -1 for value in uniques] + [-1])
+    return lookup[codes]
+
+
+def _type_codes(frame):
+    """Voucher type as an index into VOUCHER_TYPES (-1 for anything else)."""
+    return _codes(frame['type'], VOUCHER_TYPES)
+
+
+def _amounts(frame, use_positive=False):
+    amount = frame['amount'].to_numpy(dtype='float64')
+    if use_positive and 'positive_amount' in frame:
+        positive = frame['positive_amount'].to_numpy(dtype='float64')
+        amount = np.where(np.isnan(positive), amount, positive)
+    return amount
+
+
+def _values(series, index):
+    """Python values of series at positions index."""
+    return series.iloc[index].to_numpy(dtype=object).tolist()
+
+
+# ============================================================================
+# TRIAL BALANCE
+# ============================================================================
+
+def trial_balance_totals(frame):
+    """
+    Debit/credit totals per ledger.
+
+    Returns:
+        (ledger names in first-appearance order, totals ndarray of shape (n, 2))
+    """
+    size = len(frame)
+    types = _type_codes(frame)
+    amounts = _amounts(frame)
+
+    # One code space for party, account and the fixed ledgers
+    codes, names = pd.factorize(pd.concat([frame['party'], frame['account']], ignore_index=True))
+    names = list(names)
+    operands = np.empty((4, size), dtype=np.int64)
+    operands[PARTY] = codes[:size]
+    operands[ACCOUNT] = codes[size:]
+    for operand, ledger in FIXED_LEDGERS.items():
+        if ledger not in names:
+            names.append(ledger)
+        operands[operand] = names.index(ledger)
+
+    # Lookup tables: voucher type -> operand / side of each posting (-1: no posting)
+    source = np.full((2, len(VOUCHER_TYPES) + 1), -1, dtype=np.int64)
+    sides = np.full((2, len(VOUCHER_TYPES) + 1), -1, dtype=np.int64)
+    for voucher_type, (first, first_side, second, second_side) in TRIAL_BALANCE_POSTINGS.items():
+        source[:, voucher_type] = (first, second)
+        sides[:, voucher_type] = (first_side, second_side)
+
+    rows = np.arange(size)
+    posting_codes = []
+    posting_sides = []
+    for position in (0, 1):
+        operand = source[position][types]  # types == -1 picks the trailing "no posting" slot
+        posting_codes.append(np.where(operand >= 0, operands[np.maximum(operand, 0), rows], -1))
+        posting_sides.append(sides[position][types])
+
+    # Interleave so each voucher's two postings stay in voucher order
+    posting_codes = np.column_stack(posting_codes).ravel()
+    posting_sides = np.column_stack(posting_sides).ravel()
+    posting_amounts = np.repeat(amounts, 2)
+
+    # Unknown voucher types and blank ledger names post nothing
+    blank = np.array([name is None or name != name or name == '' for name in names] + [True])
+    keep = (posting_sides >= 0) & ~blank[posting_codes]
+
+    # Dense ledger ids in order of first appearance
+    dense, ordered = pd.factorize(posting_codes[keep])
+
+    totals = np.zeros((len(ordered), 2))
+    np.add.at(totals, (dense, posting_sides[keep]), posting_amounts[keep])
+    return [names[code] for code in ordered.tolist()], totals
+
+
+def trial_balance_rows(frame):
+    """Trial balance rows (Ledger, Debit, Credit) plus a Total row, as the loop version."""
+    ledgers, totals = trial_balance_totals(frame)
+    net = totals[:, DEBIT] - totals[:, CREDIT]
+
+    rows = []
+    total_debit = 0
+    total_credit = 0
+    for name, value in zip(ledgers, net.tolist()):
+        debit = value if value > 0 else 0
+        credit = abs(value) if value < 0 else 0
+        if debit > 0.001 or credit > 0.001:
+            rows.append((name, debit, credit))
+            total_debit += debit
+            total_credit += credit
+
+    if rows:
+        rows.append(('Total', total_debit, total_credit))
+    return rows
+
+
+# ============================================================================
+# LEDGER
+# ============================================================================
+
+def ledger_postings(frame, ledger_name, use_positive=False):
+    """
+    Debit / credit of every voucher for one ledger.
+
+    Returns:
+        (types, is_party, is_debit, is_credit, amounts) arrays
+    """
+    types = _type_codes(frame)
+    is_party = _codes(frame['party'], [ledger_name]) == 0
+    is_account = _codes(frame['account'], [ledger_name]) == 0
+    amounts = _amounts(frame, use_positive)
+
+    sales = types == SALES
+    purchase = types == PURCHASE
+    payment = types == PAYMENT
+    receipt_or_contra = (types == RECEIPT) | (types == CONTRA)
+
+    is_debit = (
+        (sales & is_party)
+        | (purchase & ~is_party)
+        | (receipt_or_contra & ~is_party & is_account)
+        | (payment & is_party)
+    )
+    is_credit = (
+        (sales & ~is_party)
+        | (purchase & is_party)
+        | (receipt_or_contra & is_party)
+        | (payment & ~is_party & is_account)
+    )
+    return types, is_party, is_debit, is_credit, amounts
+
+
+def ledger_opening_balance(frame, ledger_name):
+    """Balance carried into a ledger report by everything in frame (snapshot rows use positive_amount)."""
+    _, _, is_debit, is_credit, amounts = ledger_postings(frame, ledger_name, use_positive=True)
+    moves = (is_debit | is_credit) & (amounts > 0)
+    if not moves.any():
+        return 0
+    signed = np.where(is_debit, amounts, -amounts)[moves]
+    return np.cumsum(signed)[-1].item()
+
+
+def ledger_rows(frame, ledger_name, opening_balance=None, opening_date=None):
+    """
+    Ledger report rows (Date, Particulars, Voucher Type, Voucher No, Debit,
+    Credit, Balance) with running balance, as the loop version.
+    """
+    rows = []
+    balance = 0
+
+    if opening_balance is not None:
+        balance = opening_balance
+        rows.append((opening_date, 'Opening Balance', '', '', 0, 0, balance))
+
+    types, is_party, is_debit, is_credit, amounts = ledger_postings(frame, ledger_name)
+    emitted = np.flatnonzero((is_debit | is_credit) & (amounts > 0))
+    if not len(emitted):
+        return rows
+
+    is_debit = is_debit[emitted]
+    amounts = amounts[emitted]
+    signed = np.where(is_debit, amounts, -amounts)
+    balances = np.cumsum(np.concatenate(([balance], signed)))[1:]
+
+    # Particulars: the other side of the voucher, or the voucher type
+    types = types[emitted]
+    is_party = is_party[emitted]
+    sales_or_purchase = (types == SALES) | (types == PURCHASE)
+    party = np.array(_values(frame['party'], emitted), dtype=object)
+    account = np.array(_values(frame['account'], emitted), dtype=object)
+    type_names = np.array(_values(frame['type'], emitted), dtype=object)
+    particulars = np.where(
+        sales_or_purchase,
+        np.where(is_party, type_names, party),
+        np.where(is_party, account, party)
+    )
+    particulars = np.where(pd.isna(particulars) | (particulars == ''), type_names, particulars)
+
+    amount_values = amounts.astype(object)
+    debits = np.where(is_debit, amount_values, 0)
+    credits = np.where(is_debit, 0, amount_values)
+
+    rows.extend(zip(
+        _values(frame['date'], emitted), particulars.tolist(), type_names.tolist(),
+        _values(frame['voucher_number'], emitted), debits.tolist(), credits.tolist(), balances.tolist()
+    ))
+    return rows
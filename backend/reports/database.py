@@ -4,10 +4,18 @@ NO business logic, NO RBAC, NO tenant validation.
 Only database queries accepting tenant_id as parameter.
 """
 
+import hashlib
 import logging
-from django.db.models import Sum, Q
-from accounting.models import Voucher, JournalEntry
-from inventory.models import InventoryStockItem, StockMovement
+from django.db import connections
+from django.utils.dateparse import parse_date
+from django.db.models import Q, F, Value, CharField, DecimalField, IntegerField, Count, Max, Sum
+from django.db.models.functions import Cast, Coalesce, TruncMonth
+from accounting.models import (
+    Voucher, JournalEntry, VoucherSalesInvoiceDetails, VoucherSalesPaymentDetails,
+    VoucherPurchaseSupplierDetails, VoucherPurchaseDueDetails,
+    VoucherPaymentSingle, VoucherReceiptSingle, VoucherContra, VoucherJournal
+)
+from accounting.ledger_balances import get_ledger_totals
 
 logger = logging.getLogger('reports.database')
 
@@ -28,6 +36,278 @@ def get_vouchers_for_daybook(tenant_id, start_date=None, end_date=None):
     return vouchers.order_by('date', 'id')
 
 
+# ============================================================================
+# SPLIT-TABLE VOUCHER QUERIES
+# ============================================================================
+
+# Column order shared by every member of the UNION ALL
+SPLIT_VOUCHER_COLUMNS = [
+    'r_date', 'r_seq', 'r_type', 'r_voucher_number', 'r_invoice_no',
+    'r_party', 'r_account', 'r_total', 'r_amount', 'r_narration', 'r_id',
+]
+
+
+def _split_voucher_projection(queryset, seq, voucher_type, voucher_number, invoice_no,
+                              party, account, total, amount, narration):
+    """Project one split voucher table onto the common day book columns."""
+    text = CharField()
+    money = DecimalField(max_digits=18, decimal_places=2)
+
+    def as_text(expr):
+        return Coalesce(Cast(expr, text), Value('', output_field=text), output_field=text)
+
+    def as_money(expr):
+        return Coalesce(Cast(expr, money), Value(0, output_field=money), output_field=money)
+
+    return queryset.annotate(
+        r_date=F('date'),
+        r_seq=Value(seq, output_field=IntegerField()),
+        r_type=Value(voucher_type, output_field=text),
+        r_voucher_number=as_text(voucher_number),
+        r_invoice_no=as_text(invoice_no),
+        r_party=as_text(party),
+        r_account=as_text(account),
+        r_total=as_money(total),
+        r_amount=as_money(amount),
+        r_narration=as_text(narration),
+        r_id=F('id'),
+    ).values(*SPLIT_VOUCHER_COLUMNS).order_by()
+
+
+def _split_voucher_query(tenant_id, start_date=None, end_date=None):
+    """UNION ALL over the split voucher tables, ordered by date."""
+    def scoped(model):
+        qs = model.objects.filter(tenant_id=tenant_id)
+        if start_date:
+            qs = qs.filter(date__gte=start_date)
+        if end_date:
+            qs = qs.filter(date__lte=end_date)
+        return qs
+
+    zero = Value(0)
+    empty = Value('')
+    members = [
+        _split_voucher_projection(
+            scoped(VoucherSalesInvoiceDetails), 0, 'Sales',
+            F('sales_invoice_no'), F('sales_invoice_no'), F('customer_name'), empty,
+            F('payment_details__payment_invoice_value'), F('payment_details__payment_invoice_value'),
+            F('payment_details__posting_note'),
+        ),
+        _split_voucher_projection(
+            scoped(VoucherPurchaseSupplierDetails), 1, 'Purchase',
+            Coalesce(F('purchase_voucher_no'), F('supplier_invoice_no')), F('supplier_invoice_no'),
+            F('vendor_name'), empty,
+            F('due_details__to_pay'), F('due_details__to_pay'), F('due_details__posting_note'),
+        ),
+        _split_voucher_projection(
+            scoped(VoucherPaymentSingle), 2, 'Payment',
+            F('voucher_number'), F('voucher_number'), F('pay_to'), F('pay_from'),
+            zero, F('total_payment'), empty,
+        ),
+        _split_voucher_projection(
+            scoped(VoucherReceiptSingle), 3, 'Receipt',
+            F('voucher_number'), F('voucher_number'), F('receive_from'), F('receive_in'),
+            zero, F('total_receipt'), empty,
+        ),
+        _split_voucher_projection(
+            scoped(VoucherContra), 4, 'Contra',
+            F('voucher_number'), F('voucher_number'), F('from_account'), F('to_account'),
+            zero, F('amount'), F('narration'),
+        ),
+        _split_voucher_projection(
+            scoped(VoucherJournal), 5, 'Journal',
+            F('voucher_number'), F('voucher_number'), empty, empty,
+            F('total_debit'), F('total_debit'), F('narration'),
+        ),
+    ]
+
+    return members[0].union(*members[1:], all=True).order_by('r_date', 'r_seq', 'r_id')
+
+
+def get_split_vouchers(tenant_id, start_date=None, end_date=None, chunk_size=2000):
+    """
+    Get vouchers from the split voucher tables as one UNION ALL query,
+    ordered by date in the database.
+
+    Returns:
+        Iterator of dicts with date, type, voucher_number, invoice_no, party,
+        account, total, amount, narration, id
+    """
+    query = _split_voucher_query(tenant_id, start_date, end_date)
+
+    for row in query.iterator(chunk_size=chunk_size):
+        yield {
+            'date': row['r_date'],
+            'type': row['r_type'],
+            'voucher_number': row['r_voucher_number'],
+            'invoice_no': row['r_invoice_no'] or row['r_voucher_number'],
+            'party': row['r_party'],
+            'account': row['r_account'],
+            'total': float(row['r_total']),
+            'amount': float(row['r_amount']),
+            'narration': row['r_narration'],
+            'id': row['r_id'],
+        }
+
+
+# Columns of get_split_voucher_frame, in order
+VOUCHER_FRAME_COLUMNS = ['date', 'type', 'voucher_number', 'party', 'account', 'amount']
+
+
+def get_split_voucher_frame(tenant_id, start_date=None, end_date=None, chunk_size=10000):
+    """
+    Get the split vouchers needed by ledger / trial balance computations as a
+    pandas DataFrame, same order as get_split_vouchers.
+
+    Returns:
+        DataFrame with VOUCHER_FRAME_COLUMNS; amount as float64
+    """
+    import pandas as pd
+
+    # Run the UNION ALL through a plain cursor: tuples, no per-row dicts
+    query = _split_voucher_query(tenant_id, start_date, end_date)
+    sql, params = query.query.sql_with_params()
+    with connections[query.db].cursor() as cursor:
+        cursor.execute(sql, params)
+        names = [column[0] for column in cursor.description]
+        rows = []
+        while True:
+            chunk = cursor.fetchmany(chunk_size)
+            if not chunk:
+                break
+            rows.extend(chunk)
+
+    frame = pd.DataFrame.from_records(rows, columns=names)
+    frame = frame[['r_' + column for column in VOUCHER_FRAME_COLUMNS]]
+    frame.columns = VOUCHER_FRAME_COLUMNS
+    if len(frame) and isinstance(frame['date'].iloc[0], str):
+        # Backends without native date columns (SQLite) return ISO strings
+        frame['date'] = frame['date'].map(parse_date)
+    frame['amount'] = frame['amount'].map(float).astype('float64')
+    return frame
+
+
+# Tables the split voucher reports read from, including child detail tables
+SPLIT_VOUCHER_SOURCE_MODELS = [
+    VoucherSalesInvoiceDetails, VoucherSalesPaymentDetails,
+    VoucherPurchaseSupplierDetails, VoucherPurchaseDueDetails,
+    VoucherPaymentSingle, VoucherReceiptSingle, VoucherContra, VoucherJournal,
+]
+
+
+def get_report_data_version(tenant_id):
+    """
+    Fingerprint of a tenant's voucher data.
+
+    Combines row count, max id and max updated_at of every source table, so
+    inserts, deletes and updates all change it.
+
+    Returns:
+        str: hex digest
+    """
+    digest = hashlib.sha256()
+    for model in SPLIT_VOUCHER_SOURCE_MODELS:
+        stats = model.objects.filter(tenant_id=tenant_id).aggregate(
+            rows=Count('id'), last_id=Max('id'), last_update=Max('updated_at')
+        )
+        digest.update(
+            f"{model._meta.db_table}:{stats['rows']}:{stats['last_id']}:{stats['last_update']};".encode()
+        )
+    return digest.hexdigest()
+
+
+# ============================================================================
+# VOUCHER AGGREGATES
+# ============================================================================
+
+# Per voucher type: (model, party field, amount field), the same columns
+# _split_voucher_query reads, so aggregates agree with the reports
+VOUCHER_AMOUNT_SOURCES = {
+    'Sales': (VoucherSalesInvoiceDetails, 'customer_name', 'payment_details__payment_invoice_value'),
+    'Purchase': (VoucherPurchaseSupplierDetails, 'vendor_name', 'due_details__to_pay'),
+    'Payment': (VoucherPaymentSingle, 'pay_to', 'total_payment'),
+    'Receipt': (VoucherReceiptSingle, 'receive_from', 'total_receipt'),
+    'Contra': (VoucherContra, 'from_account', 'amount'),
+    'Journal': (VoucherJournal, None, 'total_debit'),
+}
+
+
+def _voucher_amount_queryset(tenant_id, voucher_type, start_date=None, end_date=None, party=None):
+    model, party_field, _ = VOUCHER_AMOUNT_SOURCES[voucher_type]
+    qs = model.objects.filter(tenant_id=tenant_id)
+    if start_date:
+        qs = qs.filter(date__gte=start_date)
+    if end_date:
+        qs = qs.filter(date__lte=end_date)
+    if party:
+        if party_field is None:
+            return qs.none()
+        qs = qs.filter(**{f'{party_field}__iexact': party})
+    return qs
+
+
+def get_voucher_totals(tenant_id, voucher_types=None, start_date=None, end_date=None,
+                       party=None, by_month=False):
+    """
+    Voucher count and amount total per type (and month), one aggregate
+    query per voucher type.
+
+    Returns:
+        list of dicts: type, [month (date),] count, total (Decimal)
+    """
+    results = []
+    for voucher_type in voucher_types or VOUCHER_AMOUNT_SOURCES:
+        _, _, amount_field = VOUCHER_AMOUNT_SOURCES[voucher_type]
+        qs = _voucher_amount_queryset(tenant_id, voucher_type, start_date, end_date, party)
+        aggregates = {'count': Count('id'), 'total': Coalesce(Sum(amount_field), Value(0), output_field=DecimalField())}
+        if by_month:
+            rows = qs.annotate(month=TruncMonth('date')).values('month').annotate(**aggregates).order_by('month')
+            results.extend({'type': voucher_type, **row} for row in rows)
+        else:
+            results.append({'type': voucher_type, **qs.aggregate(**aggregates)})
+    return results
+
+
+def get_top_parties(tenant_id, voucher_type, limit=10, start_date=None, end_date=None):
+    """
+    Parties with the largest amount total for a voucher type.
+
+    Returns:
+        list of dicts: party, count, total (Decimal), largest first
+    """
+    _, party_field, amount_field = VOUCHER_AMOUNT_SOURCES[voucher_type]
+    if party_field is None:
+        return []
+    rows = (
+        _voucher_amount_queryset(tenant_id, voucher_type, start_date, end_date)
+        .exclude(**{f'{party_field}__isnull': True}).exclude(**{party_field: ''})
+        .values(party_field)
+        .annotate(count=Count('id'), total=Coalesce(Sum(amount_field), Value(0), output_field=DecimalField()))
+        .order_by('-total', party_field)[:limit]
+    )
+    return [{'party': row[party_field], 'count': row['count'], 'total': row['total']} for row in rows]
+
+
+def get_party_totals(tenant_id, voucher_type, start_date=None, end_date=None):
+    """
+    Amount total per party for a voucher type, one GROUP BY query.
+
+    Returns:
+        dict: party name -> total (Decimal)
+    """
+    _, party_field, amount_field = VOUCHER_AMOUNT_SOURCES[voucher_type]
+    if party_field is None:
+        return {}
+    rows = (
+        _voucher_amount_queryset(tenant_id, voucher_type, start_date, end_date)
+        .exclude(**{f'{party_field}__isnull': True}).exclude(**{party_field: ''})
+        .values(party_field)
+        .annotate(total=Coalesce(Sum(amount_field), Value(0), output_field=DecimalField()))
+        .order_by()
+    )
+    return {row[party_field]: row['total'] for row in rows}
+
+
 # ============================================================================
 # LEDGER REPORT QUERIES
 # ============================================================================
@@ -62,13 +342,12 @@ def get_vouchers_for_ledger(tenant_id, ledger_name, start_date=None, end_date=No
 # ============================================================================
 
 def get_trial_balance_data(tenant_id):
-    """Get aggregated ledger balances for trial balance."""
-    entries = JournalEntry.objects.filter(tenant_id=tenant_id)
-    
-    return entries.values('ledger').annotate(
-        total_debit=Sum('debit'),
-        total_credit=Sum('credit')
-    ).order_by('ledger')
+    """
+    Get aggregated ledger balances for trial balance.
+    Reads the materialized ledger_balances month rows instead of
+    re-aggregating journal_entries.
+    """
+    return get_ledger_totals(tenant_id)
 
 
 # ============================================================================
@@ -77,11 +356,15 @@ def get_trial_balance_data(tenant_id):
 
 def get_stock_items(tenant_id):
     """Get all stock items for stock summary."""
+    # Imported lazily: the stock models are not defined yet in inventory.models,
+    # and a module-level import would break every report query above.
+    from inventory.models import InventoryStockItem
     return InventoryStockItem.objects.filter(tenant_id=tenant_id)
 
 
 def get_stock_movements(tenant_id, start_date=None, end_date=None):
     """Get stock movements for stock summary."""
+    from inventory.models import StockMovement
     movements = StockMovement.objects.filter(tenant_id=tenant_id)
     
     if start_date:
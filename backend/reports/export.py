@@ -0,0 +1,311 @@
+"""
+Reports Export Engine - Streaming file exports for report views.
+
+Reports are produced as row generators and rendered in the format picked by
+the `format` query parameter:
+
+- xlsx (default): openpyxl write-only mode, serialized to a temporary file as
+  rows arrive and streamed back from disk
+- csv: encoded and streamed to the client row by row
+- parquet: written with pyarrow in record batches to a temporary file
+
+All three consume the same row source, so memory use stays flat whatever the
+report size.
+"""
+
+import csv
+import os
+import tempfile
+
+from django.http import FileResponse, StreamingHttpResponse
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font
+from rest_framework.exceptions import ValidationError
+from rest_framework.negotiation import BaseContentNegotiation
+
+XLSX_CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+CSV_CONTENT_TYPE = 'text/csv; charset=utf-8'
+PARQUET_CONTENT_TYPE = 'application/vnd.apache.parquet'
+
+EXPORT_FORMATS = ('xlsx', 'csv', 'parquet')
+EXPORT_CONTENT_TYPES = {
+    'xlsx': XLSX_CONTENT_TYPE,
+    'csv': CSV_CONTENT_TYPE,
+    'parquet': PARQUET_CONTENT_TYPE,
+}
+DEFAULT_EXPORT_FORMAT = 'xlsx'
+FORMAT_PARAM = 'format'
+
+# Rows are spooled in memory up to this size before the temp file moves to disk
+SPOOL_MAX_SIZE = 1024 * 1024
+
+# Rows per pyarrow record batch / parquet row group chunk
+PARQUET_BATCH_SIZE = 10000
+
+# Rows held back while some Parquet column has only nulls; columns still all
+# null after this many rows are written as strings
+PARQUET_SCHEMA_ROWS = 10 * PARQUET_BATCH_SIZE
+
+
+class ExportContentNegotiation(BaseContentNegotiation):
+    """
+    Pick the first renderer without looking at `?format=`.
+
+    DRF treats the `format` query parameter as a renderer override and would
+    404 on csv/parquet; export views read it as the file format instead.
+    """
+
+    def select_parser(self, request, parsers):
+        return parsers[0] if parsers else None
+
+    def select_renderer(self, request, renderers, format_suffix=None):
+        return (renderers[0], renderers[0].media_type)
+
+
+def get_export_format(request):
+    """
+    Return the export format requested via `?format=`.
+
+    Raises:
+        ValidationError: If the format is not supported
+    """
+    export_format = (request.GET.get(FORMAT_PARAM) or DEFAULT_EXPORT_FORMAT).lower()
+    if export_format not in EXPORT_FORMATS:
+        raise ValidationError({
+            FORMAT_PARAM: f"Unsupported format '{export_format}'. Use one of: {', '.join(EXPORT_FORMATS)}"
+        })
+    return export_format
+
+
+def iter_row_values(rows, columns):
+    """
+    Yield each row as a list of values in column order.
+    Rows may be dicts keyed by column name or plain sequences.
+    """
+    for row in rows:
+        if isinstance(row, dict):
+            yield [row.get(column) for column in columns]
+        else:
+            yield list(row)
+
+
+def write_xlsx(rows, columns, fileobj, sheet_title=None):
+    """
+    Write rows to an XLSX file using openpyxl write-only mode.
+
+    Args:
+        rows: Iterable of dicts or sequences
+        columns: Header row / dict keys, in output order
+        fileobj: Writable binary file object
+        sheet_title: Optional worksheet title
+    """
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(title=sheet_title)
+
+    header = []
+    for column in columns:
+        cell = WriteOnlyCell(ws, value=column)
+        cell.font = Font(bold=True)
+        header.append(cell)
+    ws.append(header)
+
+    for values in iter_row_values(rows, columns):
+        ws.append(values)
+
+    wb.save(fileobj)
+
+
+def xlsx_response(rows, columns, filename, sheet_title=None):
+    """
+    Build an XLSX report from a row generator and stream it to the client.
+
+    Returns:
+        FileResponse streaming the workbook from a temporary file
+    """
+    spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+    try:
+        write_xlsx(rows, columns, spool, sheet_title=sheet_title)
+        spool.seek(0)
+    except Exception:
+        spool.close()
+        raise
+
+    # FileResponse reads the file in chunks and closes (deletes) it when done
+    return FileResponse(
+        spool,
+        as_attachment=True,
+        filename=filename,
+        content_type=XLSX_CONTENT_TYPE,
+    )
+
+
+class _Echo:
+    """File-like object whose write() returns the value, for csv.writer streaming."""
+
+    def write(self, value):
+        return value
+
+
+def iter_csv(rows, columns):
+    """Yield the report as encoded CSV lines, header first."""
+    writer = csv.writer(_Echo())
+    yield writer.writerow(columns).encode('utf-8')
+    for values in iter_row_values(rows, columns):
+        yield writer.writerow(values).encode('utf-8')
+
+
+def csv_response(rows, columns, filename):
+    """
+    Stream a report as CSV, one row at a time.
+
+    Returns:
+        StreamingHttpResponse producing the CSV lazily
+    """
+    response = StreamingHttpResponse(iter_csv(rows, columns), content_type=CSV_CONTENT_TYPE)
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
+def _column_type(pa, values):
+    """
+    Arrow type for a column's values: integers widen to doubles (amount
+    columns mix 0 with decimals), and a column pyarrow can't type as one
+    kind (numbers mixed with text) becomes a string.
+    """
+    try:
+        arrow_type = pa.array(values).type
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        return pa.string()
+    return pa.float64() if pa.types.is_integer(arrow_type) else arrow_type
+
+
+def _arrow_array(pa, values, arrow_type):
+    """values as arrow_type, casting those pyarrow won't convert itself (e.g. numbers into a string column)"""
+    try:
+        return pa.array(values, type=arrow_type)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        if pa.types.is_string(arrow_type):
+            return pa.array([None if value is None else str(value) for value in values], type=arrow_type)
+        if pa.types.is_floating(arrow_type):
+            return pa.array([None if value is None else float(value) for value in values], type=arrow_type)
+        raise
+
+
+def write_parquet(rows, columns, fileobj, batch_size=PARQUET_BATCH_SIZE, schema_rows=PARQUET_SCHEMA_ROWS):
+    """
+    Write rows to a Parquet file with pyarrow, one record batch at a time.
+
+    Each column's type comes from its first non-null values (see
+    _column_type). Batches are held back until every column has one, or
+    schema_rows rows were read; later values are cast to the column's type
+    (see _arrow_array).
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    types = [pa.null()] * len(columns)
+    held = []
+    writer = None
+    batch = []
+
+    def write(values_batch):
+        arrays = [list(values) for values in zip(*values_batch)] if values_batch else [[] for _ in columns]
+        writer.write_table(pa.table(
+            [_arrow_array(pa, values, field.type) for values, field in zip(arrays, writer.schema)],
+            schema=writer.schema
+        ))
+
+    def flush(final=False):
+        nonlocal writer
+        rows_batch = list(batch)
+        batch.clear()
+        if writer is not None:
+            write(rows_batch)
+            return
+
+        if rows_batch or not held:
+            held.append(rows_batch)
+        for index, values in enumerate(zip(*rows_batch)):
+            if pa.types.is_null(types[index]):
+                types[index] = _column_type(pa, list(values))
+        untyped = any(pa.types.is_null(arrow_type) for arrow_type in types)
+        if untyped and not final and sum(map(len, held)) < schema_rows:
+            return
+
+        writer = pq.ParquetWriter(fileobj, pa.schema([
+            pa.field(column, pa.string() if pa.types.is_null(arrow_type) else arrow_type)
+            for column, arrow_type in zip(columns, types)
+        ]))
+        for held_batch in held:
+            write(held_batch)
+        held.clear()
+
+    try:
+        for values in iter_row_values(rows, columns):
+            batch.append(values)
+            if len(batch) >= batch_size:
+                flush()
+        if batch or writer is None:
+            flush(final=True)
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+def parquet_response(rows, columns, filename):
+    """
+    Build a Parquet report from a row generator and stream it to the client.
+
+    Returns:
+        FileResponse streaming the file from a temporary file
+    """
+    spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+    try:
+        write_parquet(rows, columns, spool)
+        spool.seek(0)
+    except Exception:
+        spool.close()
+        raise
+
+    return FileResponse(
+        spool,
+        as_attachment=True,
+        filename=filename,
+        content_type=PARQUET_CONTENT_TYPE,
+    )
+
+
+def export_filename(filename, export_format):
+    """Replace the extension of filename to match export_format."""
+    return f"{os.path.splitext(filename)[0]}.{export_format}"
+
+
+def write_export(rows, columns, fileobj, export_format=DEFAULT_EXPORT_FORMAT, sheet_title=None):
+    """Write a report to a binary file object in the given format."""
+    if export_format == 'csv':
+        for chunk in iter_csv(rows, columns):
+            fileobj.write(chunk)
+    elif export_format == 'parquet':
+        write_parquet(rows, columns, fileobj)
+    else:
+        write_xlsx(rows, columns, fileobj, sheet_title=sheet_title)
+
+
+def export_response(rows, columns, filename, export_format=DEFAULT_EXPORT_FORMAT, sheet_title=None):
+    """
+    Render a report in the requested format.
+
+    Args:
+        rows: Iterable of dicts or sequences
+        columns: Header row / dict keys, in output order
+        filename: Download filename; its extension is replaced to match the format
+        export_format: One of EXPORT_FORMATS
+        sheet_title: Worksheet title (xlsx only)
+    """
+    filename = export_filename(filename, export_format)
+    if export_format == 'csv':
+        return csv_response(rows, columns, filename)
+    if export_format == 'parquet':
+        return parquet_response(rows, columns, filename)
+    return xlsx_response(rows, columns, filename, sheet_title=sheet_title)
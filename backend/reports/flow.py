@@ -7,6 +7,7 @@ Every function MUST start with tenant validation and permission checks.
 import logging
 from core.tenant import get_user_tenant_id
 from . import database as db
+from . import period_close
 
 logger = logging.getLogger('reports.flow')
 
@@ -110,6 +111,51 @@ def generate_trial_balance_data(user):
     return result
 
 
+# ============================================================================
+# PERIOD CLOSE OPERATIONS
+# ============================================================================
+
+def close_report_period(user, period_type, day):
+    """
+    Close the month or financial year containing a date.
+    
+    Args:
+        user: Authenticated user
+        period_type: 'month' or 'year' (financial year from company settings)
+        day: Any date inside the period
+    
+    Returns:
+        PeriodClose
+    """
+    # 1. Tenant validation
+    tenant_id = get_user_tenant_id(user)
+    if not tenant_id:
+        raise PermissionError("User has no associated tenant")
+    # 2. Business logic - snapshot closing balances
+    if not day:
+        raise ValueError("Date is required")
+    
+    return period_close.close_period(tenant_id, period_type, day)
+
+
+def list_report_period_closes(user):
+    """
+    List closed periods, latest first.
+    
+    Args:
+        user: Authenticated user
+    
+    Returns:
+        QuerySet of PeriodClose
+    """
+    # 1. Tenant validation
+    tenant_id = get_user_tenant_id(user)
+    if not tenant_id:
+        raise PermissionError("User has no associated tenant")
+    
+    return period_close.PeriodClose.objects.filter(tenant_id=tenant_id).order_by('-period_end')
+
+
 # ============================================================================
 # STOCK SUMMARY OPERATIONS
 # ============================================================================
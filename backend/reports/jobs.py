@@ -0,0 +1,351 @@
+"""
+Report Jobs - Background report generation with cached artifacts.
+
+Large exports are built off the request thread: a POST enqueues a report spec,
+a worker pool renders the file, and clients poll / download it by token.
+
+Everything lives on local disk under settings.REPORT_JOBS['ROOT'], so all
+gunicorn workers on a host share job state without a broker:
+
+    jobs/<token>.json          job state (status, spec, filename, error)
+    keys/<cache_key>           token of the job producing that artifact
+    artifacts/<cache_key>.<fmt>
+
+The cache key hashes (tenant, report, params, format, data version). An
+identical request while the data is unchanged returns the existing job and
+reuses its artifact; any voucher change moves the data version and therefore
+the key.
+
+Configuration (settings.REPORT_JOBS):
+    ROOT:         directory for job state and artifacts
+    WORKERS:      worker threads per process (0 runs jobs inline)
+    ARTIFACT_TTL: seconds an artifact is kept / reused (default 86400)
+    STALE_AFTER:  seconds after which a queued/running job whose worker died
+                  is claimed again (default 900)
+"""
+
+import hashlib
+import json
+import logging
+import os
+import secrets
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connections
+
+from reports.export import EXPORT_FORMATS, export_filename, write_export
+
+logger = logging.getLogger('reports.jobs')
+
+STATUS_QUEUED = 'queued'
+STATUS_RUNNING = 'running'
+STATUS_DONE = 'done'
+STATUS_FAILED = 'failed'
+
+DEFAULT_WORKERS = 2
+DEFAULT_ARTIFACT_TTL = 24 * 60 * 60
+DEFAULT_STALE_AFTER = 15 * 60
+
+# Expired files are swept at most this often per process
+PURGE_INTERVAL = 10 * 60
+
+
+def get_report_builders():
+    from core.reports_views import REPORT_BUILDERS
+    return REPORT_BUILDERS
+
+
+def is_stale(job, stale_after, now=None):
+    """A queued/running job whose state was last saved stale_after seconds ago (its worker died)"""
+    if job['status'] not in (STATUS_QUEUED, STATUS_RUNNING):
+        return False
+    return (now or time.time()) - job['updated_at'] >= stale_after
+
+
+def report_cache_key(tenant_id, report, params, export_format, data_version):
+    """Hash of everything that determines the contents of a report file."""
+    spec = json.dumps(
+        [str(tenant_id), report, params, export_format, data_version],
+        sort_keys=True, default=str
+    )
+    return hashlib.sha256(spec.encode()).hexdigest()
+
+
+class ReportJobStore:
+    """File-backed job state and artifact storage"""
+
+    def __init__(self, root):
+        self.root = root
+        self.jobs_dir = os.path.join(root, 'jobs')
+        self.keys_dir = os.path.join(root, 'keys')
+        self.artifacts_dir = os.path.join(root, 'artifacts')
+        for path in (self.jobs_dir, self.keys_dir, self.artifacts_dir):
+            os.makedirs(path, exist_ok=True)
+
+    def _job_path(self, token):
+        return os.path.join(self.jobs_dir, f"{token}.json")
+
+    def _key_path(self, cache_key):
+        return os.path.join(self.keys_dir, cache_key)
+
+    def artifact_path(self, cache_key, export_format):
+        return os.path.join(self.artifacts_dir, f"{cache_key}.{export_format}")
+
+    def _write_atomic(self, path, data):
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def get(self, token):
+        # Tokens come from URLs; never let them address other paths
+        if not token or not token.replace('-', '').replace('_', '').isalnum():
+            return None
+        try:
+            with open(self._job_path(token)) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def save(self, job):
+        job['updated_at'] = time.time()
+        self._write_atomic(self._job_path(job['token']), json.dumps(job).encode())
+
+    def delete(self, token):
+        try:
+            os.remove(self._job_path(token))
+        except FileNotFoundError:
+            pass
+
+    def claim_key(self, cache_key, token):
+        """
+        Point cache_key at token unless another job already holds it.
+
+        Returns:
+            bool: True if the key was claimed
+        """
+        try:
+            fd = os.open(self._key_path(cache_key), os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            return False
+        with os.fdopen(fd, 'w') as f:
+            f.write(token)
+        return True
+
+    def replace_key(self, cache_key, token):
+        self._write_atomic(self._key_path(cache_key), token.encode())
+
+    def token_for_key(self, cache_key):
+        try:
+            with open(self._key_path(cache_key)) as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def write_artifact(self, cache_key, export_format, write):
+        """Write an artifact via write(fileobj), publishing it atomically."""
+        path = self.artifact_path(cache_key, export_format)
+        fd, tmp_path = tempfile.mkstemp(dir=self.artifacts_dir, prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                write(f)
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return path
+
+    def purge(self, max_age):
+        """Delete artifacts, keys and job records older than max_age seconds."""
+        cutoff = time.time() - max_age
+        removed = 0
+        for directory in (self.artifacts_dir, self.keys_dir, self.jobs_dir):
+            for entry in os.scandir(directory):
+                try:
+                    if entry.is_file() and entry.stat().st_mtime < cutoff:
+                        os.remove(entry.path)
+                        removed += 1
+                except FileNotFoundError:
+                    pass
+        return removed
+
+
+class ReportJobQueue:
+    """In-process worker pool over a file-backed ReportJobStore"""
+
+    def __init__(self, store, workers=DEFAULT_WORKERS, artifact_ttl=DEFAULT_ARTIFACT_TTL,
+                 stale_after=DEFAULT_STALE_AFTER):
+        self.store = store
+        self.workers = workers
+        self.artifact_ttl = artifact_ttl
+        self.stale_after = stale_after
+        self._executor = None
+        self._lock = threading.Lock()
+        self._last_purge = 0
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.workers, thread_name_prefix='report-job'
+                )
+            return self._executor
+
+    def _is_reusable(self, job):
+        """An existing job can serve a new identical request"""
+        if job is None:
+            return False
+        age = time.time() - job['updated_at']
+        if job['status'] == STATUS_DONE:
+            return (
+                age < self.artifact_ttl
+                and os.path.exists(self.store.artifact_path(job['cache_key'], job['format']))
+            )
+        if job['status'] in (STATUS_QUEUED, STATUS_RUNNING):
+            return not is_stale(job, self.stale_after)
+        return False
+
+    def _maybe_purge(self):
+        now = time.time()
+        if now - self._last_purge < PURGE_INTERVAL:
+            return
+        self._last_purge = now
+        try:
+            removed = self.store.purge(self.artifact_ttl)
+            if removed:
+                logger.info(f"Purged {removed} expired report job files")
+        except OSError as e:
+            logger.warning(f"Report job purge failed: {e}")
+
+    def submit(self, tenant_id, report, params=None, export_format='xlsx'):
+        """
+        Enqueue a report, or return the job already producing / holding it.
+
+        Returns:
+            dict: job state
+
+        Raises:
+            ValueError: Unknown report or format
+        """
+        from reports.database import get_report_data_version
+
+        if report not in get_report_builders():
+            raise ValueError(f"Unknown report '{report}'")
+        if export_format not in EXPORT_FORMATS:
+            raise ValueError(f"Unsupported format '{export_format}'")
+
+        self._maybe_purge()
+
+        params = params or {}
+        data_version = get_report_data_version(tenant_id)
+        cache_key = report_cache_key(tenant_id, report, params, export_format, data_version)
+
+        existing = self.store.get(self.store.token_for_key(cache_key))
+        if self._is_reusable(existing):
+            return existing
+
+        job = {
+            'token': secrets.token_urlsafe(24),
+            'tenant_id': str(tenant_id),
+            'report': report,
+            'params': params,
+            'format': export_format,
+            'cache_key': cache_key,
+            'status': STATUS_QUEUED,
+            'filename': None,
+            'error': None,
+            'created_at': time.time(),
+        }
+        self.store.save(job)
+
+        if not self.store.claim_key(cache_key, job['token']):
+            # Another request holds the key; reuse its job unless it is dead
+            existing = self.store.get(self.store.token_for_key(cache_key))
+            if self._is_reusable(existing):
+                self.store.delete(job['token'])
+                return existing
+            self.store.replace_key(cache_key, job['token'])
+
+        if self.workers > 0:
+            self._get_executor().submit(self._run_in_worker, job['token'])
+        else:
+            self.run(job['token'])
+        return self.store.get(job['token'])
+
+    def _run_in_worker(self, token):
+        try:
+            self.run(token)
+        finally:
+            # Worker threads own their DB connections
+            connections.close_all()
+
+    def run(self, token):
+        """Build the artifact for a queued job."""
+        job = self.store.get(token)
+        if job is None or job['status'] != STATUS_QUEUED:
+            return
+
+        job['status'] = STATUS_RUNNING
+        self.store.save(job)
+        started = time.time()
+
+        try:
+            builder = get_report_builders()[job['report']]
+            rows, columns, filename = builder(job['tenant_id'], job['params'])
+            self.store.write_artifact(
+                job['cache_key'], job['format'],
+                lambda f: write_export(rows, columns, f, job['format'])
+            )
+            job['filename'] = export_filename(filename, job['format'])
+            job['status'] = STATUS_DONE
+            logger.info(f"Report job {token} ({job['report']}) built in {time.time() - started:.2f}s")
+        except Exception as e:
+            logger.exception(f"Report job {token} ({job['report']}) failed")
+            job['status'] = STATUS_FAILED
+            job['error'] = str(e)
+
+        self.store.save(job)
+
+    def get(self, token, tenant_id):
+        """Return a job visible to tenant_id, or None"""
+        job = self.store.get(token)
+        if job is None or job['tenant_id'] != str(tenant_id):
+            return None
+        return job
+
+    def artifact_path(self, job):
+        """Path of a finished job's artifact, or None if it is not available"""
+        if job['status'] != STATUS_DONE:
+            return None
+        path = self.store.artifact_path(job['cache_key'], job['format'])
+        return path if os.path.exists(path) else None
+
+
+_queue = None
+_queue_lock = threading.Lock()
+
+
+def get_report_job_queue():
+    """Process-wide queue built from settings.REPORT_JOBS on first use"""
+    global _queue
+    with _queue_lock:
+        if _queue is None:
+            config = getattr(settings, 'REPORT_JOBS', {})
+            root = config.get('ROOT') or os.path.join(settings.BASE_DIR, 'report_jobs')
+            _queue = ReportJobQueue(
+                ReportJobStore(root),
+                workers=config.get('WORKERS', DEFAULT_WORKERS),
+                artifact_ttl=config.get('ARTIFACT_TTL', DEFAULT_ARTIFACT_TTL),
+                stale_after=config.get('STALE_AFTER', DEFAULT_STALE_AFTER),
+            )
+        return _queue
@@ -0,0 +1,33 @@
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+
+from reports.period_close import PERIOD_MONTH, PERIOD_YEAR, close_period
+
+
+class Command(BaseCommand):
+    help = 'Snapshot closing balances for a month or financial year (speeds up trial balance and ledger reports)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tenant', dest='tenant_id', required=True, help='Tenant to close')
+        parser.add_argument('--period', choices=[PERIOD_MONTH, PERIOD_YEAR], default=PERIOD_MONTH)
+        parser.add_argument(
+            '--date', default=None,
+            help='Any date inside the period (YYYY-MM-DD); defaults to the previous month / year'
+        )
+
+    def handle(self, *args, **options):
+        day = options['date']
+        if day is None:
+            day = date.today().replace(day=1) - timedelta(days=1)
+            if options['period'] == PERIOD_YEAR:
+                day = day.replace(year=day.year - 1)
+
+        try:
+            period_close = close_period(options['tenant_id'], options['period'], day)
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(self.style.SUCCESS(
+            f'✓ Closed {period_close.period_type} {period_close.period_start} - {period_close.period_end}'
+        ))
@@ -0,0 +1,52 @@
+# Generated by Django 5.0.14 on 2026-10-17 18:08
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PeriodClose',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tenant_id', models.CharField(db_index=True, max_length=36)),
+                ('created_at', models.DateTimeField(auto_now_add=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True, null=True)),
+                ('period_type', models.CharField(choices=[('month', 'Month'), ('year', 'Financial Year')], max_length=10)),
+                ('period_start', models.DateField()),
+                ('period_end', models.DateField()),
+            ],
+            options={
+                'db_table': 'report_period_closes',
+                'indexes': [models.Index(fields=['tenant_id', 'period_end'], name='report_peri_tenant__e99c77_idx')],
+                'unique_together': {('tenant_id', 'period_type', 'period_end')},
+            },
+        ),
+        migrations.CreateModel(
+            name='PeriodCloseBalance',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tenant_id', models.CharField(db_index=True, max_length=36)),
+                ('created_at', models.DateTimeField(auto_now_add=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True, null=True)),
+                ('position', models.PositiveIntegerField()),
+                ('voucher_type', models.CharField(max_length=20)),
+                ('party', models.CharField(blank=True, default='', max_length=255)),
+                ('account', models.CharField(blank=True, default='', max_length=255)),
+                ('amount', models.DecimalField(decimal_places=2, default=0, max_digits=18)),
+                ('positive_amount', models.DecimalField(decimal_places=2, default=0, help_text='Sum of positive amounts only (ledger reports skip non-positive postings)', max_digits=18)),
+                ('period_close', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='balances', to='reports.periodclose')),
+            ],
+            options={
+                'db_table': 'report_period_close_balances',
+                'ordering': ['position'],
+            },
+        ),
+    ]
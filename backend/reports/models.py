@@ -1,3 +1,56 @@
 from django.db import models
 
-# Create your models here.
+from core.models import BaseModel
+
+
+class PeriodClose(BaseModel):
+    """
+    Closed reporting period for a tenant.
+    Its balances hold voucher totals from the beginning of time through
+    period_end (see reports/period_close.py).
+    """
+    PERIOD_MONTH = 'month'
+    PERIOD_YEAR = 'year'
+    PERIOD_TYPE_CHOICES = [
+        (PERIOD_MONTH, 'Month'),
+        (PERIOD_YEAR, 'Financial Year'),
+    ]
+
+    period_type = models.CharField(max_length=10, choices=PERIOD_TYPE_CHOICES)
+    period_start = models.DateField()
+    period_end = models.DateField()
+
+    class Meta:
+        db_table = 'report_period_closes'
+        unique_together = ('tenant_id', 'period_type', 'period_end')
+        indexes = [
+            models.Index(fields=['tenant_id', 'period_end']),
+        ]
+
+    def __str__(self):
+        return f"{self.period_type} {self.period_start} - {self.period_end}"
+
+
+class PeriodCloseBalance(BaseModel):
+    """
+    Cumulative voucher amount per (voucher type, party, account) at a period close.
+    Rows keep the order in which each combination first appeared, so reports
+    replaying them list ledgers in the same order as a full voucher scan.
+    """
+    period_close = models.ForeignKey(PeriodClose, on_delete=models.CASCADE, related_name='balances')
+    position = models.PositiveIntegerField()
+    voucher_type = models.CharField(max_length=20)
+    party = models.CharField(max_length=255, blank=True, default='')
+    account = models.CharField(max_length=255, blank=True, default='')
+    amount = models.DecimalField(max_digits=18, decimal_places=2, default=0)
+    positive_amount = models.DecimalField(
+        max_digits=18, decimal_places=2, default=0,
+        help_text="Sum of positive amounts only (ledger reports skip non-positive postings)"
+    )
+
+    class Meta:
+        db_table = 'report_period_close_balances'
+        ordering = ['position']
+
+    def __str__(self):
+        return f"{self.voucher_type} {self.party} / {self.account}: {self.amount}"
@@ -0,0 +1,266 @@
+"""
+Period Close - Closing snapshots for trial balance and ledger reports.
+
+Closing a month or financial year stores, per (voucher type, party, account),
+the cumulative voucher amount from the beginning of time through the period
+end (PeriodCloseBalance). Reports that need balances up to a date replay the
+nearest snapshot on or before it and only scan vouchers after it, so their
+cost is bounded by the open period instead of the tenant's full history.
+
+Snapshot rows have the same shape as split voucher dicts (type, party,
+account, amount) plus positive_amount, so report code treats them as
+pre-aggregated vouchers.
+
+Any voucher write dated on or before a closed period end deletes the affected
+snapshots (see invalidate_period_closes); reports then fall back to an earlier
+snapshot or a full scan.
+"""
+
+import logging
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.db import transaction
+
+from core.models import CompanyFullInfo
+from reports.models import PeriodClose, PeriodCloseBalance
+
+logger = logging.getLogger('reports.period_close')
+
+PERIOD_MONTH = PeriodClose.PERIOD_MONTH
+PERIOD_YEAR = PeriodClose.PERIOD_YEAR
+
+# Voucher types that carry party/account postings in the reports
+SNAPSHOT_VOUCHER_TYPES = ('Sales', 'Purchase', 'Receipt', 'Payment', 'Contra')
+
+# Financial year start used when the company has none configured (1 April)
+DEFAULT_FY_START = (4, 1)
+
+
+def _as_date(value):
+    if value is None or isinstance(value, date):
+        return value
+    return date.fromisoformat(str(value)[:10])
+
+
+# ============================================================================
+# PERIOD BOUNDS
+# ============================================================================
+
+def get_financial_year_start(tenant_id):
+    """(month, day) the tenant's financial year starts on, from CompanyFullInfo."""
+    company = CompanyFullInfo.objects.filter(tenant_id=tenant_id).values('financial_year_start').first()
+    fy_start = company and company['financial_year_start']
+    if fy_start:
+        return fy_start.month, fy_start.day
+    return DEFAULT_FY_START
+
+
+def _add_years(day, years):
+    try:
+        return day.replace(year=day.year + years)
+    except ValueError:  # 29 Feb
+        return day.replace(year=day.year + years, day=28)
+
+
+def get_period_bounds(tenant_id, period_type, day):
+    """
+    Return (period_start, period_end) of the month / financial year containing day.
+
+    Raises:
+        ValueError: Unknown period type
+    """
+    day = _as_date(day)
+    if period_type == PERIOD_MONTH:
+        start = day.replace(day=1)
+        end = (start + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+        return start, end
+    if period_type == PERIOD_YEAR:
+        month, first_day = get_financial_year_start(tenant_id)
+        start = date(day.year, month, min(first_day, 28) if month == 2 else first_day)
+        if start > day:
+            start = _add_years(start, -1)
+        return start, _add_years(start, 1) - timedelta(days=1)
+    raise ValueError(f"Unknown period type '{period_type}'")
+
+
+# ============================================================================
+# SNAPSHOT READS
+# ============================================================================
+
+def get_nearest_close(tenant_id, on_or_before=None):
+    """Latest PeriodClose ending on or before the given date (any close if None)."""
+    closes = PeriodClose.objects.filter(tenant_id=tenant_id)
+    if on_or_before is not None:
+        closes = closes.filter(period_end__lte=_as_date(on_or_before))
+    return closes.order_by('-period_end', 'id').first()
+
+
+def get_snapshot_rows(period_close):
+    """Snapshot rows of a close as voucher-shaped dicts, in first-seen order."""
+    for balance in period_close.balances.order_by('position').iterator():
+        yield {
+            'type': balance.voucher_type,
+            'party': balance.party,
+            'account': balance.account,
+            'amount': float(balance.amount),
+            'positive_amount': float(balance.positive_amount),
+        }
+
+
+def iter_cumulative_vouchers(tenant_id, through=None):
+    """
+    Everything that happened up to and including `through` (all time if None):
+    the nearest snapshot's rows, then the vouchers dated after it.
+    """
+    from reports.database import get_split_vouchers
+
+    through = _as_date(through)
+    period_close = get_nearest_close(tenant_id, through)
+
+    scan_from = None
+    if period_close is not None:
+        scan_from = period_close.period_end + timedelta(days=1)
+        logger.debug(f"Tenant {tenant_id}: replaying close {period_close.period_end}, scanning from {scan_from}")
+        yield from get_snapshot_rows(period_close)
+
+    yield from get_split_vouchers(tenant_id, scan_from, through)
+
+
+def get_cumulative_voucher_frame(tenant_id, through=None):
+    """
+    Columnar iter_cumulative_vouchers: snapshot rows, then vouchers after the
+    snapshot, as one DataFrame (positive_amount is NaN on voucher rows).
+    """
+    import pandas as pd
+    from reports.database import VOUCHER_FRAME_COLUMNS, get_split_voucher_frame
+
+    through = _as_date(through)
+    period_close = get_nearest_close(tenant_id, through)
+    if period_close is None:
+        return get_split_voucher_frame(tenant_id, None, through)
+
+    snapshot = pd.DataFrame.from_records(
+        list(get_snapshot_rows(period_close)),
+        columns=['type', 'party', 'account', 'amount', 'positive_amount']
+    )
+    snapshot['date'] = None
+    snapshot['voucher_number'] = ''
+    vouchers = get_split_voucher_frame(tenant_id, period_close.period_end + timedelta(days=1), through)
+    return pd.concat(
+        [snapshot[VOUCHER_FRAME_COLUMNS + ['positive_amount']], vouchers], ignore_index=True
+    )
+
+
+# ============================================================================
+# CLOSING
+# ============================================================================
+
+def build_snapshot(tenant_id, through):
+    """
+    Aggregate cumulative amounts through a date, in first-seen order.
+
+    Returns:
+        list of (voucher_type, party, account, amount, positive_amount)
+    """
+    totals = {}
+    for v in iter_cumulative_vouchers(tenant_id, through):
+        if v['type'] not in SNAPSHOT_VOUCHER_TYPES:
+            continue
+        key = (v['type'], v.get('party') or '', v.get('account') or '')
+        amount = Decimal(str(v.get('amount') or 0))
+        positive = v.get('positive_amount')
+        positive = Decimal(str(positive)) if positive is not None else max(amount, Decimal('0'))
+
+        entry = totals.setdefault(key, [Decimal('0'), Decimal('0')])
+        entry[0] += amount
+        entry[1] += positive
+
+    return [key + tuple(entry) for key, entry in totals.items()]
+
+
+def close_period(tenant_id, period_type, day, batch_size=1000):
+    """
+    Close the month / financial year containing `day`, replacing any existing
+    close for the same period.
+
+    Raises:
+        ValueError: Unknown period type, or the period has not ended yet
+
+    Returns:
+        PeriodClose
+    """
+    period_start, period_end = get_period_bounds(tenant_id, period_type, day)
+    if period_end >= date.today():
+        raise ValueError(f"Period ending {period_end} has not ended yet")
+
+    snapshot = build_snapshot(tenant_id, period_end)
+
+    with transaction.atomic():
+        PeriodClose.objects.filter(
+            tenant_id=tenant_id, period_type=period_type, period_end=period_end
+        ).delete()
+        period_close = PeriodClose.objects.create(
+            tenant_id=tenant_id, period_type=period_type,
+            period_start=period_start, period_end=period_end
+        )
+        PeriodCloseBalance.objects.bulk_create(
+            [
+                PeriodCloseBalance(
+                    tenant_id=tenant_id, period_close=period_close, position=position,
+                    voucher_type=voucher_type, party=party, account=account,
+                    amount=amount, positive_amount=positive_amount
+                )
+                for position, (voucher_type, party, account, amount, positive_amount) in enumerate(snapshot)
+            ],
+            batch_size=batch_size
+        )
+
+    logger.info(f"Closed {period_type} {period_start} - {period_end} for tenant {tenant_id} ({len(snapshot)} rows)")
+    return period_close
+
+
+def invalidate_period_closes(tenant_id, day=None):
+    """Drop snapshots that include `day` (all of the tenant's if day is None)."""
+    closes = PeriodClose.objects.filter(tenant_id=tenant_id)
+    if day is not None:
+        closes = closes.filter(period_end__gte=_as_date(day))
+    deleted, _ = closes.delete()
+    if deleted:
+        logger.info(f"Invalidated period closes for tenant {tenant_id} from {day or 'the beginning'}")
+
+
+# ============================================================================
+# INVALIDATION (signal receivers, connected in ReportsConfig.ready)
+# ============================================================================
+
+# Detail tables whose amounts feed the reports, with the FK to the dated voucher
+VOUCHER_DETAIL_PARENTS = {
+    'VoucherSalesPaymentDetails': 'invoice',
+    'VoucherPurchaseDueDetails': 'supplier_details',
+}
+
+
+def _voucher_date(instance):
+    parent_field = VOUCHER_DETAIL_PARENTS.get(type(instance).__name__)
+    if parent_field:
+        parent = getattr(instance, parent_field, None)
+        return getattr(parent, 'date', None)
+    return getattr(instance, 'date', None)
+
+
+def remember_voucher_date(sender, instance, **kwargs):
+    """pre_save: keep the stored date so moving a voucher invalidates both periods."""
+    if instance.pk is not None and sender.__name__ not in VOUCHER_DETAIL_PARENTS:
+        instance._period_close_previous_date = sender.objects.filter(
+            pk=instance.pk
+        ).values_list('date', flat=True).first()
+
+
+def invalidate_for_voucher(sender, instance, **kwargs):
+    """post_save / post_delete: drop snapshots covering the voucher's date."""
+    dates = [
+        _as_date(d) for d in (_voucher_date(instance), getattr(instance, '_period_close_previous_date', None))
+        if d is not None
+    ]
+    invalidate_period_closes(instance.tenant_id, min(dates) if dates else None)
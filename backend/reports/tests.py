@@ -1,3 +1,353 @@
-from django.test import TestCase
+from datetime import date
+from decimal import Decimal
 
-# Create your tests here.
+from django.test import SimpleTestCase, TestCase
+from rest_framework.test import APIRequestFactory
+
+from accounting.models import (
+    VoucherSalesInvoiceDetails, VoucherSalesPaymentDetails, VoucherPurchaseSupplierDetails,
+    VoucherPurchaseDueDetails, VoucherPaymentSingle, VoucherReceiptSingle,
+    VoucherContra, VoucherJournal
+)
+from core.testing import use_temp_ai_cache
+from reports.api import DaybookExcelView
+from reports.database import get_split_vouchers
+
+
+class SplitVoucherQueryTest(TestCase):
+    def setUp(self):
+        use_temp_ai_cache(self)
+        self.tenant_id = 'tenant-1'
+        sales = VoucherSalesInvoiceDetails.objects.create(
+            tenant_id=self.tenant_id, date=date(2025, 4, 3), sales_invoice_no='S-1', customer_name='ABC Ltd'
+        )
+        VoucherSalesPaymentDetails.objects.create(
+            tenant_id=self.tenant_id, invoice=sales, payment_invoice_value=Decimal('1180.00')
+        )
+        purchase = VoucherPurchaseSupplierDetails.objects.create(
+            tenant_id=self.tenant_id, date=date(2025, 4, 1), supplier_invoice_no='P-1', vendor_name='XYZ Suppliers'
+        )
+        VoucherPurchaseDueDetails.objects.create(
+            tenant_id=self.tenant_id, supplier_details=purchase, to_pay=Decimal('500.00')
+        )
+        VoucherPaymentSingle.objects.create(
+            tenant_id=self.tenant_id, date=date(2025, 4, 2), voucher_number='PAY-1',
+            pay_from='Cash', pay_to='XYZ Suppliers', total_payment=Decimal('200.00')
+        )
+        VoucherReceiptSingle.objects.create(
+            tenant_id=self.tenant_id, date=date(2025, 4, 3), voucher_number='REC-1',
+            receive_in='Bank', receive_from='ABC Ltd', total_receipt=Decimal('300.00')
+        )
+        VoucherContra.objects.create(
+            tenant_id=self.tenant_id, date=date(2025, 4, 1), voucher_number='CON-1',
+            from_account='Cash', to_account='Bank', amount=Decimal('50.00')
+        )
+        VoucherJournal.objects.create(
+            tenant_id=self.tenant_id, date=date(2025, 5, 5), voucher_number='JV-1',
+            total_debit=Decimal('75.00'), total_credit=Decimal('75.00'), narration='Adjustment'
+        )
+        VoucherContra.objects.create(
+            tenant_id='tenant-2', date=date(2025, 4, 1), voucher_number='CON-X',
+            from_account='Cash', to_account='Bank', amount=Decimal('10.00')
+        )
+
+    def test_single_query_ordered_by_date(self):
+        with self.assertNumQueries(1):
+            vouchers = list(get_split_vouchers(self.tenant_id))
+
+        self.assertEqual(
+            [(v['date'], v['type']) for v in vouchers],
+            [
+                (date(2025, 4, 1), 'Purchase'), (date(2025, 4, 1), 'Contra'),
+                (date(2025, 4, 2), 'Payment'), (date(2025, 4, 3), 'Sales'),
+                (date(2025, 4, 3), 'Receipt'), (date(2025, 5, 5), 'Journal'),
+            ]
+        )
+        receipt = vouchers[4]
+        self.assertEqual((receipt['party'], receipt['account'], receipt['amount'], receipt['total']),
+                         ('ABC Ltd', 'Bank', 300.0, 0.0))
+
+    def test_date_range(self):
+        vouchers = list(get_split_vouchers(self.tenant_id, '2025-04-02', '2025-04-30'))
+        self.assertEqual([v['voucher_number'] for v in vouchers], ['PAY-1', 'S-1', 'REC-1'])
+
+    def test_frame_matches_vouchers(self):
+        from reports.database import VOUCHER_FRAME_COLUMNS, get_split_voucher_frame
+
+        frame = get_split_voucher_frame(self.tenant_id)
+        expected = [[v[column] for column in VOUCHER_FRAME_COLUMNS] for v in get_split_vouchers(self.tenant_id)]
+        self.assertEqual(frame.to_numpy(dtype=object).tolist(), expected)
+
+
+class StreamingXlsxExportTest(TestCase):
+    def test_rows_written_in_column_order(self):
+        import io
+        from openpyxl import load_workbook
+        from reports.export import xlsx_response
+
+        rows = ({'Ledger': f'L{i}', 'Debit': i, 'Credit': 0} for i in range(3))
+        response = xlsx_response(rows, ['Ledger', 'Debit', 'Credit'], 'TrialBalance.xlsx')
+
+        self.assertTrue(response.streaming)
+        self.assertIn('TrialBalance.xlsx', response['Content-Disposition'])
+        ws = load_workbook(io.BytesIO(b''.join(response.streaming_content))).active
+        self.assertEqual(
+            list(ws.iter_rows(values_only=True)),
+            [('Ledger', 'Debit', 'Credit'), ('L0', 0, 0), ('L1', 1, 0), ('L2', 2, 0)]
+        )
+
+
+class ExportFormatTest(TestCase):
+    columns = ['Date', 'Party', 'Amount']
+
+    def rows(self):
+        yield {'Date': date(2025, 4, 1), 'Party': 'ABC Ltd', 'Amount': 0}
+        yield {'Date': date(2025, 4, 2), 'Party': None, 'Amount': 1180.5}
+
+    def test_csv_streams_rows(self):
+        from reports.export import export_response
+
+        response = export_response(self.rows(), self.columns, 'DayBook.xlsx', 'csv')
+
+        self.assertIn('DayBook.csv', response['Content-Disposition'])
+        self.assertEqual(
+            b''.join(response.streaming_content).decode().splitlines(),
+            ['Date,Party,Amount', '2025-04-01,ABC Ltd,0', '2025-04-02,,1180.5']
+        )
+
+    def test_parquet_shares_row_source(self):
+        import io
+        import pyarrow.parquet as pq
+        from reports.export import export_response, write_parquet
+
+        response = export_response(self.rows(), self.columns, 'DayBook.xlsx', 'parquet')
+        table = pq.read_table(io.BytesIO(b''.join(response.streaming_content)))
+        self.assertEqual(table.column_names, self.columns)
+        self.assertEqual(table.column('Amount').to_pylist(), [0.0, 1180.5])
+
+        # Later batches are cast to the schema inferred from the first one
+        buffer = io.BytesIO()
+        write_parquet(self.rows(), self.columns, buffer, batch_size=1)
+        buffer.seek(0)
+        self.assertEqual(pq.read_table(buffer).column('Party').to_pylist(), ['ABC Ltd', None])
+
+    def test_parquet_types_columns_null_in_first_batch(self):
+        import io
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        from reports.export import write_parquet
+
+        rows = [
+            {'Date': date(2025, 4, 1), 'Party': 'ABC Ltd', 'Amount': None},
+            {'Date': date(2025, 4, 2), 'Party': 'XYZ Traders', 'Amount': 10},
+            {'Date': date(2025, 4, 3), 'Party': 1001, 'Amount': Decimal('2.5')},
+            {'Date': date(2025, 4, 4), 'Party': None, 'Amount': 4.25},
+        ]
+        buffer = io.BytesIO()
+        write_parquet(iter(rows), self.columns, buffer, batch_size=1)
+        buffer.seek(0)
+        table = pq.read_table(buffer)
+        self.assertEqual(table.schema.field('Amount').type, pa.float64())
+        self.assertEqual(table.column('Amount').to_pylist(), [None, 10.0, 2.5, 4.25])
+        self.assertEqual(table.column('Party').to_pylist(), ['ABC Ltd', 'XYZ Traders', '1001', None])
+
+        # Still all null once schema_rows were read: strings
+        buffer = io.BytesIO()
+        write_parquet(iter(rows), self.columns, buffer, batch_size=1, schema_rows=1)
+        buffer.seek(0)
+        self.assertEqual(pq.read_table(buffer).column('Amount').to_pylist(), [None, '10', '2.5', '4.25'])
+
+    def test_unknown_format_rejected(self):
+        response = DaybookExcelView.as_view()(APIRequestFactory().get('/', {'format': 'pdf'}))
+        self.assertEqual(response.status_code, 400)
+
+    def test_format_query_param_selects_csv(self):
+        response = DaybookExcelView.as_view()(APIRequestFactory().get('/', {'format': 'csv'}))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Disposition'].endswith('.csv"'))
+
+
+class ReportJobQueueTest(TestCase):
+    def setUp(self):
+        import shutil
+        import tempfile
+        from reports.jobs import ReportJobQueue, ReportJobStore
+
+        use_temp_ai_cache(self)
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root)
+        # workers=0 runs jobs inline, inside the test transaction
+        self.queue = ReportJobQueue(ReportJobStore(root), workers=0)
+        VoucherContra.objects.create(
+            tenant_id='tenant-1', date=date(2025, 4, 1), voucher_number='CON-1',
+            from_account='Cash', to_account='Bank', amount=Decimal('50.00')
+        )
+
+    def test_job_builds_artifact(self):
+        job = self.queue.submit('tenant-1', 'daybook', {'startDate': '2025-04-01'}, 'csv')
+
+        self.assertEqual(job['status'], 'done')
+        self.assertEqual(job['filename'], 'DayBook.csv')
+        with open(self.queue.artifact_path(job)) as f:
+            self.assertEqual(f.read().splitlines()[1], '2025-04-01,Contra,CON-1,Cash,50.0,')
+
+    def test_identical_request_reuses_artifact_until_data_changes(self):
+        first = self.queue.submit('tenant-1', 'trial_balance', {}, 'csv')
+        self.assertEqual(self.queue.submit('tenant-1', 'trial_balance', {}, 'csv')['token'], first['token'])
+        self.assertNotEqual(self.queue.submit('tenant-1', 'trial_balance', {}, 'xlsx')['token'], first['token'])
+
+        VoucherContra.objects.create(
+            tenant_id='tenant-1', date=date(2025, 4, 2), voucher_number='CON-2',
+            from_account='Cash', to_account='Bank', amount=Decimal('5.00')
+        )
+        self.assertNotEqual(self.queue.submit('tenant-1', 'trial_balance', {}, 'csv')['token'], first['token'])
+
+    def test_jobs_scoped_to_tenant(self):
+        job = self.queue.submit('tenant-1', 'daybook', {}, 'csv')
+
+        self.assertIsNotNone(self.queue.get(job['token'], 'tenant-1'))
+        self.assertIsNone(self.queue.get(job['token'], 'tenant-2'))
+        self.assertIsNone(self.queue.get('../keys/x', 'tenant-1'))
+
+    def test_unknown_report_rejected(self):
+        with self.assertRaises(ValueError):
+            self.queue.submit('tenant-1', 'balance_sheet', {}, 'csv')
+
+
+class PeriodCloseTest(TestCase):
+    tenant_id = 'tenant-1'
+
+    def setUp(self):
+        use_temp_ai_cache(self)
+
+        def contra(day, number, amount, from_account='Cash', to_account='Bank'):
+            VoucherContra.objects.create(
+                tenant_id=self.tenant_id, date=day, voucher_number=number,
+                from_account=from_account, to_account=to_account, amount=Decimal(amount)
+            )
+
+        contra(date(2025, 3, 10), 'CON-1', '100.00')
+        contra(date(2025, 3, 20), 'CON-2', '-20.00', 'Bank', 'Petty Cash')
+        VoucherPaymentSingle.objects.create(
+            tenant_id=self.tenant_id, date=date(2025, 4, 2), voucher_number='PAY-1',
+            pay_from='Bank', pay_to='XYZ Suppliers', total_payment=Decimal('30.00')
+        )
+        contra(date(2025, 5, 5), 'CON-3', '10.00', 'Bank', 'Cash')
+        self.contra = contra
+
+    def reports(self, params):
+        from core.reports_views import build_ledger_report, build_trial_balance_report
+
+        trial_balance = list(build_trial_balance_report(self.tenant_id, params)[0])
+        ledger = list(build_ledger_report(self.tenant_id, dict(params, ledger='Bank'))[0])
+        return trial_balance, ledger
+
+    def test_reports_identical_with_snapshot(self):
+        from reports.period_close import close_period
+
+        params = {'endDate': '2025-05-31'}
+        ranged = {'startDate': '2025-04-01', 'endDate': '2025-05-31'}
+        before = self.reports(params), self.reports(ranged)
+
+        close_period(self.tenant_id, 'month', date(2025, 3, 1))
+        close_period(self.tenant_id, 'year', date(2024, 6, 1))
+        from core.reports_views import build_trial_balance_report
+        with self.assertNumQueries(3):  # snapshot lookup, snapshot rows, open-period vouchers
+            list(build_trial_balance_report(self.tenant_id, params)[0])
+
+        self.assertEqual((self.reports(params), self.reports(ranged)), before)
+
+    def test_ledger_opening_balance(self):
+        from reports.period_close import close_period
+
+        close_period(self.tenant_id, 'month', date(2025, 3, 1))
+        _, ledger = self.reports({'startDate': '2025-04-01'})
+
+        # CON-1 debits Bank 100; CON-2 (negative) never moves a ledger report
+        # Rows are tuples in LEDGER_COLUMNS order: Particulars is [1], Balance is [6]
+        self.assertEqual(ledger[0][1], 'Opening Balance')
+        self.assertEqual(ledger[0][6], 100.0)
+        self.assertEqual([row[6] for row in ledger[1:]], [70.0, 60.0])
+
+    def test_backdated_voucher_invalidates_snapshot(self):
+        from reports.models import PeriodClose
+        from reports.period_close import close_period
+
+        close_period(self.tenant_id, 'month', date(2025, 3, 1))
+        self.contra(date(2025, 4, 9), 'CON-4', '1.00')
+        self.assertEqual(PeriodClose.objects.count(), 1)
+
+        self.contra(date(2025, 3, 31), 'CON-5', '1.00')
+        self.assertEqual(PeriodClose.objects.count(), 0)
+
+    def test_financial_year_bounds(self):
+        from core.models import CompanyFullInfo
+        from reports.period_close import get_period_bounds
+
+        self.assertEqual(
+            get_period_bounds(self.tenant_id, 'year', date(2025, 3, 31)), (date(2024, 4, 1), date(2025, 3, 31))
+        )
+        CompanyFullInfo.objects.create(
+            tenant_id=self.tenant_id, company_name='Acme',
+            financial_year_start=date(2025, 1, 1), financial_year_end=date(2025, 12, 31)
+        )
+        self.assertEqual(
+            get_period_bounds(self.tenant_id, 'year', date(2025, 3, 31)), (date(2025, 1, 1), date(2025, 12, 31))
+        )
+
+
+class ColumnarReportTest(SimpleTestCase):
+    """The vectorized computations must reproduce the per-voucher loops exactly."""
+
+    def vouchers(self, count=2000, seed=7):
+        import random
+        rng = random.Random(seed)
+        names = ['Cash', 'Bank', 'ABC Ltd', 'XYZ Suppliers', 'Petty Cash', '']
+        types = ['Sales', 'Purchase', 'Receipt', 'Payment', 'Contra', 'Journal']
+        return [
+            {
+                'date': date(2025, 4, 1 + i % 28), 'type': rng.choice(types), 'voucher_number': f'V-{i}',
+                'party': rng.choice(names), 'account': rng.choice(names),
+                'amount': rng.choice([0.0, -5.5, round(rng.uniform(0, 1e6), 2), 0.1, 0.2]),
+            }
+            for i in range(count)
+        ]
+
+    def frame(self, vouchers):
+        import pandas as pd
+        from reports.database import VOUCHER_FRAME_COLUMNS
+        return pd.DataFrame.from_records(vouchers, columns=VOUCHER_FRAME_COLUMNS)
+
+    def as_tuples(self, rows, columns):
+        return [tuple(row[column] for column in columns) for row in rows]
+
+    def test_trial_balance_identical(self):
+        from core.reports_views import TRIAL_BALANCE_COLUMNS
+        from reports import columnar
+        from reports.management.commands.benchmark_report_compute import trial_balance_rows
+
+        vouchers = self.vouchers()
+        self.assertEqual(
+            columnar.trial_balance_rows(self.frame(vouchers)),
+            self.as_tuples(trial_balance_rows(vouchers), TRIAL_BALANCE_COLUMNS)
+        )
+        self.assertEqual(columnar.trial_balance_rows(self.frame([])), [])
+
+    def test_ledger_identical(self):
+        from core.reports_views import LEDGER_COLUMNS
+        from reports import columnar
+        from reports.management.commands.benchmark_report_compute import ledger_opening_balance, ledger_rows
+
+        vouchers = self.vouchers()
+        for ledger in ('Bank', 'ABC Ltd', 'Unknown'):
+            expected = self.as_tuples(ledger_rows(vouchers, ledger, 12.5, date(2025, 4, 1)), LEDGER_COLUMNS)
+            actual = columnar.ledger_rows(self.frame(vouchers), ledger, 12.5, date(2025, 4, 1))
+            self.assertEqual(actual, expected)
+            self.assertEqual(
+                [(type(r[4]), type(r[5])) for r in actual],
+                [(type(r[4]), type(r[5])) for r in expected]
+            )
+            self.assertEqual(
+                columnar.ledger_opening_balance(self.frame(vouchers), ledger),
+                ledger_opening_balance(vouchers, ledger)
+            )
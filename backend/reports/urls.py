@@ -5,7 +5,11 @@ from .api import (
     TrialBalanceExcelView,
     StockSummaryExcelView,
     LedgerExcelView,
-    GSTExcelView
+    GSTExcelView,
+    ReportJobView,
+    ReportJobStatusView,
+    ReportJobDownloadView,
+    PeriodCloseView
 )
 
 urlpatterns = [
@@ -15,4 +19,8 @@ urlpatterns = [
     path('stocksummary/excel/', StockSummaryExcelView.as_view(), name='stocksummary-excel'),
     path('ledger/excel/', LedgerExcelView.as_view(), name='ledger-excel'),
     path('gst/excel/', GSTExcelView.as_view(), name='gst-excel'),
+    path('jobs/', ReportJobView.as_view(), name='report-jobs'),
+    path('jobs/<str:token>/', ReportJobStatusView.as_view(), name='report-job-status'),
+    path('jobs/<str:token>/download/', ReportJobDownloadView.as_view(), name='report-job-download'),
+    path('period-closes/', PeriodCloseView.as_view(), name='report-period-closes'),
 ]
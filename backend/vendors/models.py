@@ -2,6 +2,7 @@
 from django.db import models
 from django.core.validators import EmailValidator, RegexValidator
 from inventory.models import InventoryMasterCategory
+from core.sequences import SequenceAllocator, format_number, last_number, next_tenant_number
 
 
 class VendorMasterCategory(models.Model):
@@ -248,10 +249,8 @@ class VendorMasterPOSettings(models.Model):
     def __str__(self):
         return f"{self.name} ({self.tenant_id})"
     
-    def generate_po_number(self):
-        """Generate the next PO number based on settings"""
-        number_str = str(self.current_number).zfill(self.digits)
-        prefix = self.prefix or ''
+    def generate_po_number(self, number=None):
+        """Format a PO number (default: the next one, without taking it)"""
         suffix = self.suffix or ''
         
         if self.auto_year:
@@ -259,7 +258,17 @@ class VendorMasterPOSettings(models.Model):
             current_year = datetime.now().year
             suffix = f"/{current_year % 100:02d}"  # Last 2 digits of year
         
-        return f"{prefix}{number_str}{suffix}"
+        return format_number(self.current_number if number is None else number, self.prefix, self.digits, suffix)
+    
+    def next_po_number(self):
+        """Take the next PO number of the series atomically (see core.sequences)"""
+        # current_number holds the next number to issue
+        number = po_numbers.next(self.pk) - 1
+        self.current_number = number + 1
+        return self.generate_po_number(number)
+
+
+po_numbers = SequenceAllocator(VendorMasterPOSettings._meta.db_table, touch='updated_at')
 
 
 class VendorMasterBasicDetail(models.Model):
@@ -309,24 +318,19 @@ class VendorMasterBasicDetail(models.Model):
     def generate_vendor_code(self):
         """Auto-generate vendor code if not provided"""
         if not self.vendor_code:
-            # Get the last vendor for this tenant
-            last_vendor = VendorMasterBasicDetail.objects.filter(
-                tenant_id=self.tenant_id
-            ).exclude(vendor_code__isnull=True).exclude(vendor_code='').order_by('-id').first()
-            
-            if last_vendor and last_vendor.vendor_code:
-                # Extract number from last code (e.g., VEN0001 -> 1)
-                try:
-                    last_number = int(last_vendor.vendor_code.replace('VEN', ''))
-                    new_number = last_number + 1
-                except (ValueError, AttributeError):
-                    new_number = 1
-            else:
-                new_number = 1
-            
-            self.vendor_code = f"VEN{new_number:04d}"
+            self.vendor_code = VendorMasterBasicDetail.next_vendor_code(self.tenant_id)
         
         return self.vendor_code
+    
+    @staticmethod
+    def next_vendor_code(tenant_id):
+        """Take the tenant's next VEN#### code (per-tenant series, see core.sequences)"""
+        new_number = next_tenant_number(tenant_id, 'vendor_basic_code', seed=lambda: last_number(
+            VendorMasterBasicDetail.objects.filter(tenant_id=tenant_id)
+            .exclude(vendor_code__isnull=True).exclude(vendor_code='')
+            .order_by('-id').values_list('vendor_code', flat=True).first()
+        ))
+        return f"VEN{new_number:04d}"
 
 
 class VendorMasterGSTDetails(models.Model):
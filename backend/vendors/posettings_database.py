@@ -153,14 +153,8 @@ class POSettingsDatabase:
         Returns:
             The generated PO number string
         """
-        with transaction.atomic():
-            po_setting = VendorMasterPOSettings.objects.select_for_update().get(
-                id=po_setting_id
-            )
-            po_number = po_setting.generate_po_number()
-            po_setting.current_number += 1
-            po_setting.save()
-            return po_number
+        po_setting = VendorMasterPOSettings.objects.get(id=po_setting_id)
+        return po_setting.next_po_number()
     
     @staticmethod
     def get_po_settings_by_category(tenant_id, category_id):
@@ -8,6 +8,7 @@ from django.core.exceptions import ObjectDoesNotExist
 from django.db.models import Q
 from .models import Vendor
 from inventory.models import InventoryMasterCategory
+from core.sequences import last_number, next_tenant_number
 
 
 class VendorDatabase:
@@ -25,21 +26,11 @@ class VendorDatabase:
         Returns:
             Unique vendor code string
         """
-        # Get the last vendor code for this tenant
-        last_vendor = Vendor.objects.filter(
-            tenant_id=tenant_id,
-            vendor_code__startswith=prefix
-        ).order_by('-vendor_code').first()
-        
-        if last_vendor:
-            # Extract number from last code and increment
-            try:
-                last_number = int(last_vendor.vendor_code.replace(prefix, ''))
-                new_number = last_number + 1
-            except ValueError:
-                new_number = 1
-        else:
-            new_number = 1
+        # Per-tenant series (see core.sequences), seeded from the last code on first use
+        new_number = next_tenant_number(tenant_id, f'vendor_code:{prefix}', seed=lambda: last_number(
+            Vendor.objects.filter(tenant_id=tenant_id, vendor_code__startswith=prefix)
+            .order_by('-vendor_code').values_list('vendor_code', flat=True).first()
+        ))
         
         return f"{prefix}{new_number:05d}"  # e.g., VEN00001
     
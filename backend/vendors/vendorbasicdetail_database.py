@@ -22,20 +22,7 @@ class VendorBasicDetailDatabase:
         Returns:
             Generated vendor code (e.g., VEN0001)
         """
-        last_vendor = VendorMasterBasicDetail.objects.filter(
-            tenant_id=tenant_id
-        ).exclude(vendor_code__isnull=True).exclude(vendor_code='').order_by('-id').first()
-        
-        if last_vendor and last_vendor.vendor_code:
-            try:
-                last_number = int(last_vendor.vendor_code.replace('VEN', ''))
-                new_number = last_number + 1
-            except (ValueError, AttributeError):
-                new_number = 1
-        else:
-            new_number = 1
-        
-        return f"VEN{new_number:04d}"
+        return VendorMasterBasicDetail.next_vendor_code(tenant_id)
     
     @staticmethod
     def create_vendor_basic_detail(tenant_id, vendor_data, created_by=None):
@@ -6,6 +6,9 @@ from typing import List, Dict, Optional, Any
 from decimal import Decimal
 from datetime import date
 
+from .models import VendorMasterPOSettings
+from core.sequences import next_tenant_number
+
 
 def generate_po_number(tenant_id: str, po_series_id: Optional[int] = None) -> str:
     """
@@ -15,44 +18,27 @@ def generate_po_number(tenant_id: str, po_series_id: Optional[int] = None) -> st
         str: Generated PO number
     """
     if po_series_id:
-        # Get series settings
-        query = """
-            SELECT prefix, current_number, required_digits, suffix
-            FROM vendor_master_posettings
-            WHERE id = %s AND tenant_id = %s
-        """
-        
-        with connection.cursor() as cursor:
-            cursor.execute(query, [po_series_id, tenant_id])
-            row = cursor.fetchone()
-            
-            if row:
-                prefix, current_number, required_digits, suffix = row
-                next_number = current_number + 1
-                
-                # Update current number
-                update_query = """
-                    UPDATE vendor_master_posettings
-                    SET current_number = %s, updated_at = NOW()
-                    WHERE id = %s
-                """
-                cursor.execute(update_query, [next_number, po_series_id])
-                
-                # Format PO number
-                number_str = str(next_number).zfill(required_digits)
-                return f"{prefix}{number_str}{suffix}"
+        # Take the next number of the series atomically (see core.sequences)
+        po_setting = VendorMasterPOSettings.objects.filter(id=po_series_id, tenant_id=tenant_id).first()
+        if po_setting:
+            return po_setting.next_po_number()
     
-    # Fallback: generate simple sequential number
+    # Fallback: simple sequential number from the per-tenant series (see core.sequences)
+    next_num = next_tenant_number(tenant_id, 'purchase_order', seed=lambda: _last_po_number(tenant_id))
+    return f"PO{str(next_num).zfill(6)}"
+
+
+def _last_po_number(tenant_id: str) -> int:
+    """Highest PO###### number in use; scanned once, when the tenant's series is created"""
     query = """
-        SELECT COALESCE(MAX(CAST(SUBSTRING(po_number, 3) AS UNSIGNED)), 0) + 1
+        SELECT COALESCE(MAX(CAST(SUBSTRING(po_number, 3) AS UNSIGNED)), 0)
         FROM vendor_transaction_po
         WHERE tenant_id = %s AND po_number LIKE 'PO%%'
     """
     
     with connection.cursor() as cursor:
         cursor.execute(query, [tenant_id])
-        next_num = cursor.fetchone()[0]
-        return f"PO{str(next_num).zfill(6)}"
+        return cursor.fetchone()[0]
 
 
 def create_purchase_order(